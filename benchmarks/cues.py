@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Time CueParser on a large number of Cue Sheets.
+
+Usage:
+    python -m benchmarks.cues --cues 50000
+    python -m benchmarks.cues --cues 50000 --baseline d2e3046~1
+
+Cue Sheets are generated like the ones in benchmarks.library, in the same mix of
+encodings. With --baseline, CueParser from the given git revision is timed on the
+same files too, so that both parsers are compared in a single run.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+
+from benchmarks.library import (
+    ARTISTS,
+    CUE_ENCODINGS,
+    TITLES,
+    _cue_sheet,
+    _pick,
+)
+from benchmarks.run import measure
+from teeb.cueparser import CueParser
+
+
+def generate_cues(root: str, count: int, *, seed: int = 0) -> Dict[str, List[str]]:
+    """Write Cue Sheets in random encodings & return their paths per encoding."""
+    rng = random.Random(seed)
+    paths: Dict[str, List[str]] = {encoding: [] for encoding in CUE_ENCODINGS}
+    for number in range(count):
+        artist, album = rng.choice(ARTISTS), rng.choice(TITLES)
+        encoding = _pick(rng, CUE_ENCODINGS)
+        text = _cue_sheet(rng, artist, album, f"{artist} - {album}.flac")
+        if encoding == "ascii":
+            text = text.encode("ascii", errors="replace").decode("ascii")
+        path = os.path.join(root, f"{number:06}.cue")
+        with open(path, "wb") as cue:
+            cue.write(text.encode(encoding))
+        paths[encoding].append(path)
+    return paths
+
+
+def load_parser(revision: str) -> Callable[[str], object]:
+    """Return CueParser class of teeb from a git revision."""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:src/teeb/cueparser.py"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    spec = importlib.util.spec_from_loader(f"cueparser_{revision}", loader=None)
+    module = importlib.util.module_from_spec(spec)
+    exec(compile(source, f"{revision}:cueparser.py", "exec"), module.__dict__)
+    return module.CueParser
+
+
+def parse_all(parse: Callable[[str], object], paths: List[str]) -> int:
+    """Parse Cue Sheets & return number of the ones the parser failed on."""
+    failed = 0
+    for path in paths:
+        try:
+            parse(path)
+        except Exception:
+            failed += 1
+    return failed
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cues", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--baseline", metavar="REVISION", help="git revision to compare with"
+    )
+    args = parser.parse_args(argv)
+
+    parsers = {"current": CueParser}
+    if args.baseline:
+        parsers[args.baseline] = load_parser(args.baseline)
+
+    root = tempfile.mkdtemp(prefix="teeb-bench-cues-")
+    try:
+        print(f"Generating {args.cues} Cue Sheets in: {root}", file=sys.stderr)
+        paths = generate_cues(root, args.cues, seed=args.seed)
+        paths["all"] = [path for group in paths.values() for path in group]
+        timings: Dict[str, Dict[str, float]] = {}
+        for name, parse in parsers.items():
+            for encoding, group in paths.items():
+                timings[f"{name} {encoding}"] = measure(
+                    lambda: parse_all(parse, group), args.repeat
+                )
+                failed = parse_all(parse, group)
+                if failed:
+                    print(
+                        f"{name} failed on {failed} {encoding} Cue Sheets",
+                        file=sys.stderr,
+                    )
+    finally:
+        shutil.rmtree(root)
+
+    for encoding, group in paths.items():
+        line = f"{encoding:>9} {len(group):>7} Cue Sheets"
+        for name in parsers:
+            line += f" {name}: {timings[f'{name} {encoding}']['median']:8.3f}s"
+        if args.baseline:
+            before = timings[f"{args.baseline} {encoding}"]["median"]
+            after = timings[f"current {encoding}"]["median"]
+            line += f" {before / after:6.1f}x faster"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
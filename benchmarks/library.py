@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Synthetic music library generator.
+
+Libraries are generated from a seed, so the same number of albums always gives the
+same tree. Albums use all layouts described in teeb.find.nested_album_art, some
+come as a single audio image with a Cue Sheet in one of the encodings commonly
+found in the wild & most come with some junk files teeb is meant to clean up.
+All files are empty except for Cue Sheets.
+"""
+import os
+import random
+from typing import (
+    Dict,
+    List,
+)
+
+from teeb.default import (
+    album_art_extentions_to_convert,
+    ignored_extensions,
+    redundant_text_files,
+)
+
+ARTISTS = ["Kult", "Perfect", "Budka Suflera", "Dżem", "Lady Pank", "Maanam"]
+TITLES = ["Łódź", "Źródło", "Noc", "Żółw", "Mała", "Czarne", "Blues", "Sen"]
+ART_NAMES = [
+    "cover.jpg",
+    "Front.JPEG",
+    "folder.jpg",
+    "Cover Out.png",
+    "back.jpg",
+    "Inside 01.tif",
+    "booklet 02.bmp",
+    "matrix.jpg",
+    "CD1.jpg",
+    "obi.jpg",
+    "przod.jpg",
+]
+# Encodings of Cue Sheets & their share in generated libraries
+CUE_ENCODINGS = {
+    "ascii": 4,
+    "utf-8": 3,
+    "utf-8-sig": 1,
+    "utf-16": 1,
+    "cp1250": 1,
+}
+LAYOUTS = {
+    "preferred": 4,
+    "case_1": 2,
+    "case_2a": 1,
+    "case_2b": 1,
+    "image_with_cue": 2,
+}
+
+
+def _touch(path: str):
+    open(path, "wb").close()
+
+
+def _pick(rng: random.Random, weights: Dict[str, int]) -> str:
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _cue_sheet(rng: random.Random, artist: str, album: str, image: str) -> str:
+    lines = [
+        'REM GENRE "Rock"',
+        f"REM DATE {rng.randint(1970, 2020)}",
+        'REM COMMENT "ExactAudioCopy v0.99pb5"',
+        f'PERFORMER "{artist}"',
+        f'TITLE "{album}"',
+        f'FILE "{image}" WAVE',
+    ]
+    position = 0
+    for number in range(1, rng.randint(8, 16)):
+        position += rng.randint(120, 420)
+        minutes, seconds = divmod(position, 60)
+        lines += [
+            f"  TRACK {number:02} AUDIO",
+            f'    TITLE "{rng.choice(TITLES)} {number}"',
+            f'    PERFORMER "{artist}"',
+            f"    INDEX 01 {minutes:02}:{seconds:02}:{rng.randint(0, 74):02}",
+        ]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _tracks(rng: random.Random, directory: str, disc: int = None):
+    for number in range(1, rng.randint(6, 14)):
+        prefix = f"{disc}{number:02}" if disc else f"{number:02}"
+        extension = rng.choice(["flac", "flac", "flac", "mp3", "ape"])
+        _touch(os.path.join(directory, f"{prefix} - Track {number}.{extension}"))
+
+
+def _art(rng: random.Random, directory: str, count: int):
+    for name in rng.sample(ART_NAMES, count):
+        _touch(os.path.join(directory, name))
+
+
+def _junk(rng: random.Random, directory: str):
+    for extension in rng.sample(ignored_extensions, rng.randint(0, 3)):
+        _touch(os.path.join(directory, f"Rip.{extension}"))
+    for name in rng.sample(redundant_text_files, rng.randint(0, 2)):
+        _touch(os.path.join(directory, name))
+    if rng.random() < 0.2:
+        extension = rng.choice(album_art_extentions_to_convert)
+        _touch(os.path.join(directory, f"Scan.{extension.upper()}"))
+
+
+def make_album(rng: random.Random, directory: str) -> str:
+    """Create an album in one of the layouts and return its layout name."""
+    layout = _pick(rng, LAYOUTS)
+    os.makedirs(directory)
+    if layout == "preferred":
+        _tracks(rng, directory)
+        _art(rng, directory, rng.randint(1, 3))
+    elif layout == "case_1":
+        _tracks(rng, directory)
+        os.mkdir(os.path.join(directory, "album_art"))
+        _art(rng, os.path.join(directory, "album_art"), rng.randint(1, 5))
+    elif layout in ("case_2a", "case_2b"):
+        os.mkdir(os.path.join(directory, "album_art"))
+        _art(rng, os.path.join(directory, "album_art"), rng.randint(2, 6))
+        for disc in range(1, rng.randint(2, 4)):
+            disc_dir = os.path.join(directory, f"cd{disc}")
+            os.mkdir(disc_dir)
+            _tracks(rng, disc_dir)
+            if layout == "case_2b":
+                _touch(os.path.join(disc_dir, "cover.jpg"))
+    else:
+        artist, album = rng.choice(ARTISTS), rng.choice(TITLES)
+        image = f"{artist} - {album}.flac"
+        _touch(os.path.join(directory, image))
+        encoding = _pick(rng, CUE_ENCODINGS)
+        text = _cue_sheet(rng, artist, album, image)
+        if encoding == "ascii":
+            text = text.encode("ascii", errors="replace").decode("ascii")
+        with open(os.path.join(directory, f"{album}.cue"), "wb") as cue:
+            cue.write(text.encode(encoding))
+        _art(rng, directory, rng.randint(0, 2))
+    _junk(rng, directory)
+    return layout
+
+
+def generate_library(root: str, albums: int, *, seed: int = 0) -> Dict[str, int]:
+    """Generate a library with given number of albums grouped in artist dirs.
+
+    Returns number of generated albums per layout.
+    """
+    rng = random.Random(seed)
+    layouts: Dict[str, int] = {}
+    for number in range(albums):
+        artist = f"{rng.choice(ARTISTS)} {number // 10:05}"
+        album = f"{number:06} {rng.choice(TITLES)} ({rng.randint(1970, 2020)})"
+        layout = make_album(rng, os.path.join(root, artist, album))
+        layouts[layout] = layouts.get(layout, 0) + 1
+    return layouts
+
+
+def files_with_extension(root: str, extensions: List[str]) -> List[str]:
+    """Find generated files with any of given (lower case) extensions."""
+    return [
+        os.path.join(path, name)
+        for path, _, files in os.walk(root)
+        for name in files
+        if name.rsplit(".", 1)[-1].lower() in extensions
+    ]
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Time teeb's finders, CueParser & album art name suggestions.
+
+Usage:
+    python -m benchmarks.run --albums 1000 10000 --output before.json
+    python -m benchmarks.run --albums 1000 10000 --compare before.json
+
+Every benchmark is run a few times & both the fastest and the median time are
+reported, as the fastest run is the least affected by other processes.
+Directory listings are served from the OS page cache after the first run, so the
+results show the CPU cost of teeb's code rather than disk speed.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import (
+    Callable,
+    Dict,
+    List,
+)
+
+import teeb
+from benchmarks.library import (
+    files_with_extension,
+    generate_library,
+)
+from teeb import find
+from teeb.cueparser import CueParser
+from teeb.index import LibraryIndex
+from teeb.suggest import new_art_file_name
+
+FINDERS = [
+    find.extra_files,
+    find.extra_text_files,
+    find.files_with_upper_case_extension,
+    find.non_audio_files_with_upper_case_characters,
+    find.files_to_change_extension,
+    find.directory_and_file_paths_with_spaces,
+    find.album_art_files_to_convert,
+    find.album_art_jpg_files,
+    find.cue_files_and_audio_files,
+    find.empty_directories,
+    find.nested_album_art,
+]
+
+
+def measure(function: Callable[[], object], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings)}
+
+
+def run_benchmarks(library: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for finder in FINDERS:
+        results[f"find.{finder.__name__}"] = measure(lambda: finder(library), repeat)
+
+    results["LibraryIndex"] = measure(lambda: LibraryIndex(library), repeat)
+    index = LibraryIndex(library)
+    for finder in FINDERS:
+        results[f"find.{finder.__name__}[index]"] = measure(
+            lambda: finder(library, index=index), repeat
+        )
+
+    cues = files_with_extension(library, ["cue"])
+    results["CueParser"] = measure(lambda: [CueParser(cue) for cue in cues], repeat)
+    results["CueParser"]["items"] = len(cues)
+
+    art = [
+        os.path.basename(path)
+        for path in files_with_extension(library, ["jpg", "jpeg", "png", "tif", "bmp"])
+    ]
+    results["new_art_file_name"] = measure(
+        lambda: [new_art_file_name(name.lower()) for name in art], repeat
+    )
+    results["new_art_file_name"]["items"] = len(art)
+    return results
+
+
+def compare(old: dict, new: dict) -> List[str]:
+    """Return a line per benchmark with its median time in both runs."""
+    lines = []
+    for albums, results in new["results"].items():
+        previous = old["results"].get(albums, {})
+        for name, timing in results.items():
+            if name not in previous:
+                continue
+            before, after = previous[name]["median"], timing["median"]
+            change = (after - before) * 100 / before if before else 0
+            lines.append(
+                f"{albums:>7} albums {name:<58} "
+                f"{before:9.4f}s -> {after:9.4f}s {change:+7.1f}%"
+            )
+    return lines
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--albums",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="sizes of libraries to benchmark",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--dir",
+        help="generate libraries in this dir & keep them for subsequent runs",
+    )
+    parser.add_argument("-o", "--output", help="save results as JSON to this file")
+    parser.add_argument("--compare", metavar="FILE", help="results of a previous run")
+    args = parser.parse_args(argv)
+
+    root = args.dir or tempfile.mkdtemp(prefix="teeb-bench-")
+    report = {
+        "teeb": teeb.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": {},
+    }
+    try:
+        for albums in args.albums:
+            library = os.path.join(root, f"{albums}-albums-seed-{args.seed}")
+            if not os.path.isdir(library):
+                print(f"Generating library with {albums} albums in: {library}")
+                generate_library(library, albums, seed=args.seed)
+            print(f"Benchmarking library with {albums} albums", file=sys.stderr)
+            report["results"][str(albums)] = run_benchmarks(library, args.repeat)
+    finally:
+        if not args.dir:
+            shutil.rmtree(root)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as results:
+            results.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as previous:
+            print("\n".join(compare(json.load(previous), report)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,422 @@
 # -*- coding: utf-8 -*-
 import argparse
+import os
+import signal
+from typing import (
+    List,
+    Optional,
+)
 
+import teeb.prompt
+from teeb import (
+    journal,
+    prefetch,
+)
 from teeb.action import (
-    change_extensions,
     clean_up_jpg_album_art_file_names,
     convert_album_art_to_jpg,
     delete_empty_directories,
     delete_extra_files,
     delete_extra_text_files,
-    lower_extentions,
     move_album_art_files_to_album_dir,
-    non_audio_files_to_lower_case,
-    replace_spaces_with_underscores,
+    normalise_names,
+    optimise_album_art_jpg,
     what_to_do_with_cue,
 )
+from teeb.albums import (
+    album_directories,
+    process_albums,
+)
+from teeb.arthash import ArtHasher
+from teeb.cache import ScanCache
+from teeb.checkpoint import (
+    FINISHED,
+    Checkpoint,
+)
+from teeb.cueparser import CueCache
+from teeb.data_type import SizeLimit
+from teeb.dedupe import (
+    find_duplicates,
+    summary as dedupe_summary,
+)
+from teeb.find import (
+    album_art_files_to_convert,
+    album_art_jpg_files,
+    cue_files_and_audio_files,
+    empty_directories,
+    extra_text_files,
+    nested_album_art,
+    oversized_jpg_files,
+)
+from teeb.index import LibraryIndex
+from teeb.optimise import (
+    DEFAULT_MIN_SSIM,
+    DEFAULT_TARGET_SIZE,
+)
+from teeb.output import configure as configure_output
+from teeb.plan import (
+    Planner,
+    apply_plan,
+    load_plan,
+    save_plan,
+)
+from teeb.policy import Policy
+from teeb.prompt import prompt
+from teeb.rename import plan_renames
+from teeb.split import DEFAULT_TIMEOUT
+from teeb.trash import (
+    default_trash,
+    human_size,
+)
+
+
+def print_undo_result(undone: int, problems: list):
+    print(f"Reversed {undone} operations")
+    for problem in problems:
+        print(f"* {problem}")
+
+
+def print_duplicates(groups: list):
+    for group in groups:
+        print(f"{len(group.paths)} identical files, {human_size(group.size)} each:")
+        for path in group.paths:
+            print(f"* {path}")
+    print(dedupe_summary(groups) or "No duplicates found")
+
+
+def interrupt(signum: int, frame):
+    """Stop like on Ctrl+C, so the run is journaled & checkpointed as interrupted."""
+    raise KeyboardInterrupt(signal.Signals(signum).name)
+
+
+def recover_interrupted_runs(mode: str = None):
+    """Keep (roll forward) or undo (roll back) changes made by interrupted runs."""
+    for path in journal.interrupted_runs():
+        header, entries, _ = journal.read_journal(path)
+        made = sum(1 for entry in entries if journal.settle(entry))
+        print(
+            f"Run {header['run']} in '{header['directory']}' was interrupted after "
+            f"{made} file operations"
+        )
+        if mode:
+            rollback = mode == "back"
+        else:
+            rollback = prompt("Roll it back?", ["y", "n"]) == "y"
+        if rollback:
+            journal.start_run(header["directory"], rollback=header["run"])
+            try:
+                print_undo_result(*journal.recover(path, rollback=True))
+            finally:
+                journal.finish_run()
+        else:
+            journal.recover(path, rollback=False)
+            print(f"Kept changes made by run {header['run']}")
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--dir", help="dir to organise")
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="ignore cached directory listings and scan the whole dir again",
+    )
+    parser.add_argument(
+        "--scan-workers",
+        type=int,
+        default=8,
+        help="number of directories listed concurrently, increase it on NFS/SMB",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of album art files converted or re-encoded in parallel "
+        "(default: CPU count)",
+    )
+    parser.add_argument(
+        "--max-dimension",
+        type=int,
+        metavar="PIXELS",
+        help="scale down converted album art wider or taller than that",
+    )
+    parser.add_argument(
+        "--max-megapixels",
+        type=float,
+        metavar="MP",
+        help="scale down converted album art larger than that many megapixels",
+    )
+    parser.add_argument(
+        "--jpg-target-size",
+        type=int,
+        default=DEFAULT_TARGET_SIZE // 1024,
+        metavar="KIB",
+        help="re-encode jpg files larger than that to fit in it "
+        f"(default: {DEFAULT_TARGET_SIZE // 1024})",
+    )
+    parser.add_argument(
+        "--jpg-min-ssim",
+        type=float,
+        default=DEFAULT_MIN_SSIM,
+        help="never re-encode jpg files with lower structural similarity than that "
+        f"(default: {DEFAULT_MIN_SSIM})",
+    )
+    parser.add_argument(
+        "--split-jobs",
+        type=int,
+        default=None,
+        help="number of CUE files split in parallel (default: CPU count)",
+    )
+    parser.add_argument(
+        "--split-timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"kill CUE splitter after that many seconds (default: {DEFAULT_TIMEOUT})",
+    )
+    parser.add_argument(
+        "--albums",
+        type=int,
+        metavar="WORKERS",
+        help="process every sub-directory of the dir as an album on its own, "
+        "that many at once, while questions are asked one at a time",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="list every path found instead of a summary of long listings",
+    )
+    parser.add_argument(
+        "--listing",
+        metavar="FILE",
+        help="write every path found in full to this file",
+    )
+    parser.add_argument(
+        "--policy",
+        metavar="FILE",
+        help="answer questions the way they were answered before & record answers "
+        "to new ones in this file",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip steps & albums completed by the last run which haven't changed "
+        "since",
+    )
+    parser.add_argument(
+        "--review",
+        action="store_true",
+        help="review album art name suggestions on a full-screen list instead of "
+        "answering questions directory by directory",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="ask about extra files & empty directories album by album, as soon as "
+        "they're found, while the rest of the dir is still searched",
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        help="don't prepare the next step in the background while asking questions",
+    )
+    parser.add_argument(
+        "--plan",
+        metavar="FILE",
+        help="save all intended changes as JSON without touching the dir",
+    )
+    parser.add_argument(
+        "--apply",
+        metavar="FILE",
+        help="apply changes saved with --plan without asking any questions",
+    )
+    parser.add_argument(
+        "--duplicates",
+        action="store_true",
+        help="list files with identical content without touching the dir",
+    )
+    parser.add_argument(
+        "--undo",
+        metavar="RUN_ID",
+        help="reverse renames & moves made by a previous run",
+    )
+    parser.add_argument(
+        "--recover",
+        choices=["forward", "back"],
+        help="keep or undo changes of interrupted runs without asking",
+    )
     args = parser.parse_args()
+    size_limit = SizeLimit(args.max_dimension, args.max_megapixels)
+    if args.undo:
+        path = journal.journal_path(args.undo)
+        if not os.path.isfile(path):
+            parser.error(f"No journal for run {args.undo} in {journal.journal_dir()}")
+        header, _, _ = journal.read_journal(path)
+        journal.start_run(header.get("directory", os.curdir), undo=args.undo)
+        try:
+            print_undo_result(*journal.undo(path))
+        finally:
+            journal.finish_run()
+        return
+
+    recover_interrupted_runs(args.recover)
+    if args.apply:
+        plan = load_plan(args.apply)
+        run = journal.start_run(plan.directory, plan=args.apply)
+        try:
+            applied, skipped = apply_plan(plan, size_limit=size_limit)
+        finally:
+            journal.finish_run()
+        print(f"Applied {applied} operations, skipped {skipped}. Run ID: {run.run_id}")
+        return
+
     directory = args.dir
+    cache = ScanCache()
+    if args.rescan:
+        cache.clear(directory)
+    index = LibraryIndex(directory, cache=cache, workers=args.scan_workers)
+    print(cache.summary())
+    cues = CueCache(store=cache)
+    hashes = ArtHasher(store=cache)
+
+    if args.duplicates:
+        groups = find_duplicates(directory, index=index, workers=args.scan_workers)
+        cache.close()
+        print_duplicates(groups)
+        return
+
+    if args.plan:
+        plan = Planner(directory, index, cues, hashes).make()
+        save_plan(plan, args.plan)
+        cache.close()
+        print(
+            f"Saved {len(plan.operations)} operations to: {args.plan}. "
+            f"{len(plan.skipped)} items need a manual decision."
+        )
+        return
+
+    jobs, split_jobs = args.jobs, args.split_jobs
+    target_size = args.jpg_target_size * 1024
+    if args.albums:
+        # Albums are the unit of parallelism, so each one is worked on in-thread
+        jobs, split_jobs = jobs or 1, split_jobs or 1
+
+    checkpoint = Checkpoint(directory, index=index, resume=args.resume)
+
+    def pending(path: str, name: str) -> Optional[List[str]]:
+        """Return albums a step is still to be done in, None if it's all of path."""
+        if path != directory:  # An album processed on its own
+            return [] if checkpoint.done(path, name) else None
+        albums = album_directories(directory, index=index)
+        return checkpoint.pending(directory, albums, name)
+
+    def complete(path: str, name: str):
+        if path != directory:
+            checkpoint.complete(path, name)
+        else:
+            albums = album_directories(directory, index=index)
+            checkpoint.complete_library(directory, albums, name)
+
+    def step(path: str, action, **kwargs):
+        """Run an action in all albums in which it wasn't completed or is changed."""
+        albums = pending(path, action.__name__)
+        if albums == []:
+            print(f"Skipping {action.__name__} in {path}, it's already done")
+            return
+        for target in albums or [path]:
+            action(target, index=index, **kwargs)
+        complete(path, action.__name__)
+
+    def organise(path: str):
+        if pending(path, FINISHED) == []:
+            print(f"Skipping {path}, it hasn't changed since it was organised")
+            return
+        # Before each step, calls of the one after it are registered to be prefetched
+        # while the user answers its questions
+        if not args.stream:
+            prefetch.expect(extra_text_files, path, index=index)
+        step(path, delete_extra_files, stream=args.stream)
+        prefetch.expect(plan_renames, path, index=index)
+        step(path, delete_extra_text_files, stream=args.stream)
+        prefetch.expect(album_art_files_to_convert, path, index=index)
+        prefetch.expect(prefetch.hash_album_art, path, index=index, hashes=hashes)
+        step(path, normalise_names)
+        prefetch.expect(nested_album_art, path, index=index)
+        step(
+            path,
+            convert_album_art_to_jpg,
+            jobs=jobs,
+            hashes=hashes,
+            size_limit=size_limit,
+        )
+        prefetch.expect(cue_files_and_audio_files, path, index=index)
+        prefetch.expect(prefetch.parse_cues, path, index=index, cues=cues)
+        step(path, move_album_art_files_to_album_dir)
+        prefetch.expect(album_art_jpg_files, path, index=index)
+        step(
+            path,
+            what_to_do_with_cue,
+            split_jobs=split_jobs,
+            split_timeout=args.split_timeout,
+            cues=cues,
+        )
+        prefetch.expect(oversized_jpg_files, path, index=index, min_size=target_size)
+        step(path, clean_up_jpg_album_art_file_names, review=args.review)
+        if not args.stream:
+            prefetch.expect(empty_directories, path, index=index)
+        step(
+            path,
+            optimise_album_art_jpg,
+            jobs=jobs,
+            target_size=target_size,
+            min_ssim=args.jpg_min_ssim,
+        )
+        step(path, delete_empty_directories, stream=args.stream)
+        complete(path, FINISHED)
 
-    delete_extra_files(directory)
-    delete_extra_text_files(directory)
-    lower_extentions(directory)
-    change_extensions(directory)
-    non_audio_files_to_lower_case(directory)
-    replace_spaces_with_underscores(directory)
-    convert_album_art_to_jpg(directory)
-    move_album_art_files_to_album_dir(directory)
-    what_to_do_with_cue(directory)
-    clean_up_jpg_album_art_file_names(directory)
-    delete_empty_directories(directory)
+    if not args.no_prefetch:
+        prefetch.start(index)
+    if args.policy:
+        teeb.prompt.policy = Policy(args.policy)
+    output = configure_output(verbose=args.verbose, listing_path=args.listing)
+    # e.g. a dropped SSH session
+    for name in ["SIGHUP", "SIGTERM"]:
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), interrupt)
+    run = journal.start_run(directory)
+    finished = False
+    try:
+        if args.albums:
+            albums = album_directories(directory, index=index)
+            done = process_albums(albums, organise, workers=args.albums)
+            print(f"Processed {done} of {len(albums)} albums")
+            # Names of album directories themselves & empty albums
+            step(directory, normalise_names)
+            step(directory, delete_empty_directories, stream=args.stream)
+        else:
+            organise(directory)
+        finished = True
+    except SystemExit:  # User chose to quit
+        finished = True
+        raise
+    finally:
+        prefetcher = prefetch.current()
+        prefetch.stop()
+        checkpoint.close()
+        journal.finish_run(finished=finished)
+        summaries = [cues.summary(), hashes.summary(), default_trash().summary()]
+        if teeb.prompt.policy is not None:
+            summaries.append(teeb.prompt.policy.summary())
+            teeb.prompt.policy = None
+        if prefetcher is not None:
+            summaries.append(prefetcher.summary())
+        for summary in summaries:
+            if summary:
+                print(summary)
+        cache.close()
+        output.close()
+        if finished:
+            print(f"Run ID: {run.run_id}, use `teeb --undo {run.run_id}` to reverse it")
+        else:
+            print(f"Run {run.run_id} was interrupted, it'll be recovered on next start")
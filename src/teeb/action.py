@@ -2,229 +2,386 @@
 import os
 import sys
 from pathlib import Path
-from subprocess import Popen
-
-from send2trash import send2trash
-from wand.image import Image
+from typing import (
+    Callable,
+    Iterator,
+    List,
+    Tuple,
+)
 
 import teeb.suggest
-from teeb.cueparser import CueParser
+from teeb.arthash import (
+    ArtHasher,
+    redundant_album_art,
+)
+from teeb.convert import (
+    convert_to_jpg,
+    memory_summary,
+)
+from teeb.cueparser import (
+    CueCache,
+    CueParser,
+)
+from teeb.data_type import (
+    CuedAlbum,
+    ReviewItem,
+    SizeLimit,
+)
+from teeb.dedupe import identical_pairs
 from teeb.default import change_extension_mapping
+from teeb.fileops import (
+    move,
+    remove,
+    rename,
+    restore,
+    trash,
+    trash_many,
+)
 from teeb.find import (
     album_art_files_to_convert,
     album_art_jpg_files,
     cue_files_and_audio_files,
-    directory_and_file_paths_with_spaces,
     empty_directories,
     extra_files,
     extra_text_files,
-    files_to_change_extension,
-    files_with_upper_case_extension,
+    iter_album_art_jpg_suggestions,
+    iter_empty_directories,
+    iter_extra_files,
+    iter_extra_text_files,
     nested_album_art,
-    non_audio_files_with_upper_case_characters,
+    oversized_jpg_files,
+    walk,
 )
+from teeb.index import LibraryIndex
+from teeb.optimise import (
+    DEFAULT_MIN_SSIM,
+    DEFAULT_TARGET_SIZE,
+    optimise_jpgs,
+    remove_temporary_files,
+    summary as optimise_summary,
+)
+from teeb.output import (
+    buffered,
+    echo,
+    flush,
+    listing,
+)
+from teeb.policy import pattern
+from teeb.prefetch import prefetched
 from teeb.prompt import prompt
+from teeb.rename import (
+    ALL_RULES,
+    CHANGE_EXTENSIONS,
+    LOWER_EXTENSIONS,
+    NON_AUDIO_TO_LOWER_CASE,
+    SPACES_TO_UNDERSCORES,
+    apply_renames,
+    plan_renames,
+)
+from teeb.review import (
+    available as review_available,
+    review as review_findings,
+)
+from teeb.split import (
+    DEFAULT_TIMEOUT,
+    run_job,
+    run_jobs,
+    split_job,
+    splitter_name,
+    summary as split_summary,
+)
+from teeb.stream import stream_groups
+from teeb.trash import human_size
 
 
-def delete_extra_files(directory):
-    filepaths = extra_files(directory)
-    if not filepaths:
-        print(f"No extra files found in: {directory}")
-    else:
-        print(f"Found {len(filepaths)} extra files:")
-        for path in filepaths:
-            print(path)
+def _parse_cue(cue_path: str, cues: CueCache = None) -> CueParser:
+    return CueParser(cue_path) if cues is None else cues.parse(cue_path)
 
-        decision = prompt("Delete all extra files?", ["y", "n", "q"])
-        if decision == "y":
-            for path in filepaths:
-                try:
-                    os.remove(path)
-                except OSError as err:
-                    print(err)
-            print("Deleted all extra files")
-        elif decision == "q":
-            print("Quit")
-            sys.exit(0)
-        else:
-            print("Skipped deleting extra files")
 
+def _remove_all(paths: List[str], index: LibraryIndex = None) -> List[str]:
+    """Remove files and return errors of failed ones."""
+    errors = []
+    for path in paths:
+        try:
+            remove(path, index)
+        except OSError as err:
+            errors.append(f"{err}")
+    return errors
 
-def delete_extra_text_files(directory):
-    filepaths = extra_text_files(directory)
-    if not filepaths:
-        print(f"No extra text files found in: {directory}")
-    else:
-        print(f"Found {len(filepaths)} extra text files:")
-        for path in filepaths:
-            print(path)
 
-        decision = prompt("Delete all extra text files?", ["y", "n", "q"])
-        if decision == "y":
-            for path in filepaths:
-                try:
-                    os.remove(path)
-                except OSError as err:
-                    print(err)
-            print("Deleted all extra text files")
-        elif decision == "q":
-            print("Quit")
-            sys.exit(0)
-        else:
-            print("Skipped deleting extra text files")
+def _delete_streamed(
+    directory: str,
+    found: Iterator[str],
+    *,
+    description: str,
+    delete: Callable[[List[str]], List[str]],
+):
+    """Ask about found paths album by album, while the rest is still searched.
 
-
-def lower_extentions(directory):
-    filepaths = files_with_upper_case_extension(directory)
-    if not filepaths:
-        print(f"No files found with upper case extensions in: {directory}")
-    else:
-        print(f"Found {len(filepaths)} files with upper case extensions:")
-        for path in filepaths:
-            print(path)
-
-        decision = prompt("Change all extensions to lower case?", ["y", "n", "q"])
-        if decision == "y":
-            for path in filepaths:
-                extension = Path(path).suffix.lower()
-                new_path = path[: len(path) - len(extension)] + extension.lower()
-                try:
-                    os.rename(path, new_path)
-                except OSError as err:
-                    print(err)
-            print("Changed extensions to lower case")
+    After "a" (all remaining) paths in the rest of the albums are deleted without
+    asking.
+    """
+    count = 0
+    delete_all = False
+    for album, paths in stream_groups(found, directory):
+        count += len(paths)
+        echo(f"Found {len(paths)} {description} in: {album}")
+        listing(paths, title=f"{description} in {album}")
+        if delete_all:
+            decision = "y"
+        else:
+            decision = prompt(f"Delete these {description}?", ["y", "a", "n", "s", "q"])
+            delete_all = decision == "a"
+        if decision in ["y", "a"]:
+            errors = delete(paths)
+            with buffered():
+                for error in errors:
+                    echo(error)
+            echo(f"Deleted {len(paths) - len(errors)} {description} in: {album}")
+        elif decision == "s":
+            echo(f"Skipped deleting the remaining {description}")
+            return
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         else:
-            print("Skipped changing extensions to lower case")
-
-
-def non_audio_files_to_lower_case(directory):
-    filepaths = non_audio_files_with_upper_case_characters(directory)
+            echo(f"Skipped deleting {description} in: {album}")
+    if not count:
+        echo(f"No {description} found in: {directory}")
+
+
+def delete_extra_files(directory, *, index: LibraryIndex = None, stream: bool = False):
+    if stream:
+        _delete_streamed(
+            directory,
+            iter_extra_files(directory, index=index),
+            description="extra files",
+            delete=lambda paths: _remove_all(paths, index),
+        )
+        return
+    filepaths = prefetched(extra_files, directory, index=index)
     if not filepaths:
-        print(f"No non-audio files found with upper case characters in: {directory}")
+        echo(f"No extra files found in: {directory}")
     else:
-        print(f"Found {len(filepaths)} non-audio files with upper case charactres:")
-        for path in filepaths:
-            print(path)
+        echo(f"Found {len(filepaths)} extra files:")
+        listing(filepaths, title="extra files")
 
-        decision = prompt(
-            "Change all non-audio file names to lower case?", ["y", "n", "q"]
-        )
+        decision = prompt("Delete all extra files?", ["y", "n", "q"])
         if decision == "y":
-            for path in filepaths:
-                new_name = Path(path).name.lower()
-                new_path = path[: len(path) - len(new_name)] + new_name
-                try:
-                    os.rename(path, new_path)
-                except OSError as err:
-                    print(err)
-            print("Changed all non-audio file names to lower case")
+            with buffered():
+                for error in _remove_all(filepaths, index):
+                    echo(error)
+            echo("Deleted all extra files")
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         else:
-            print("Skipped changing non-audio file names to lower case")
-
-
-def change_extensions(directory):
-    filepaths = files_to_change_extension(directory)
+            echo("Skipped deleting extra files")
+
+
+def delete_extra_text_files(
+    directory, *, index: LibraryIndex = None, stream: bool = False
+):
+    if stream:
+        _delete_streamed(
+            directory,
+            iter_extra_text_files(directory, index=index),
+            description="extra text files",
+            delete=lambda paths: _remove_all(paths, index),
+        )
+        return
+    filepaths = prefetched(extra_text_files, directory, index=index)
     if not filepaths:
-        print(f"No files found to change extensions in: {directory}")
+        echo(f"No extra text files found in: {directory}")
     else:
-        print(
-            f"Found {len(filepaths)} files to change extensions: "
-            f"{change_extension_mapping}"
-        )
-        for path in filepaths:
-            print(path)
+        echo(f"Found {len(filepaths)} extra text files:")
+        listing(filepaths, title="extra text files")
 
-        decision = prompt("Change all extensions?", ["y", "n", "q"])
+        decision = prompt("Delete all extra text files?", ["y", "n", "q"])
         if decision == "y":
-            for path in filepaths:
-                extension = Path(path).suffix[1:].lower()
-                new_extension = change_extension_mapping[extension.lower()]
-                new_path = path[: len(path) - len(extension)] + new_extension
-                try:
-                    os.rename(path, new_path)
-                except OSError as err:
-                    print(err)
-            print("Changed all extensions")
+            with buffered():
+                for error in _remove_all(filepaths, index):
+                    echo(error)
+            echo("Deleted all extra text files")
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         else:
-            print("Skipped changing extensions")
-
-
-def replace_spaces_with_underscores(directory):
-    filepaths = directory_and_file_paths_with_spaces(directory)
-    if not filepaths:
-        print(f"No directories or files with white spaces found in: {directory}")
-    else:
-        print(f"Found {len(filepaths)} directories and files with white spaces")
-        for path in filepaths:
-            print(path)
-
-        decision = prompt("Replace white spaces with underscores?", ["y", "n", "q"])
+            echo("Skipped deleting extra text files")
+
+
+# Name normalisation rules with a description & a question for each
+NAME_RULES = [
+    (
+        LOWER_EXTENSIONS,
+        "files with upper case extensions",
+        "Change all extensions to lower case?",
+    ),
+    (
+        CHANGE_EXTENSIONS,
+        f"files to change extensions: {change_extension_mapping}",
+        "Change all extensions?",
+    ),
+    (
+        NON_AUDIO_TO_LOWER_CASE,
+        "non-audio files with upper case characters",
+        "Change all non-audio file names to lower case?",
+    ),
+    (
+        SPACES_TO_UNDERSCORES,
+        "directories and files with white spaces",
+        "Replace white spaces with underscores?",
+    ),
+]
+
+
+def normalise_names(directory, *, index: LibraryIndex = None):
+    """Ask which name normalisation rules to apply & rename every entry only once."""
+    preview = prefetched(plan_renames, directory, index=index)
+    rules = set()
+    for rule, description, question in NAME_RULES:
+        paths = [entry.source for entry in preview.renames if rule in entry.rules]
+        if not paths:
+            echo(f"No {description} in: {directory}")
+            continue
+        echo(f"Found {len(paths)} {description}:")
+        listing(sorted(paths), title=description)
+        decision = prompt(question, ["y", "n", "q"])
         if decision == "y":
-            for path, folders, files in os.walk(directory):
-                for filename in files:
-                    os.rename(
-                        os.path.join(path, filename),
-                        os.path.join(path, filename.replace(" ", "_")),
-                    )
-                for idx in range(len(folders)):
-                    new_name = folders[idx].replace(" ", "_")
-                    try:
-                        os.rename(
-                            os.path.join(path, folders[idx]),
-                            os.path.join(path, new_name),
-                        )
-                    except OSError as err:
-                        print(err)
-                    folders[idx] = new_name
-            print("Replaced all white spaces with underscores")
+            rules.add(rule)
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         else:
-            print("Skipped replacing white spaces with underscores")
+            echo(f"Skipped renaming {description}")
+    if not rules:
+        return
 
-
-def convert_album_art_to_jpg(directory):
-    filepaths = album_art_files_to_convert(directory)
+    if rules == ALL_RULES:
+        plan = preview
+    else:
+        plan = plan_renames(directory, index=index, rules=rules)
+    with buffered():
+        for target, paths in plan.conflicts.items():
+            echo(f"Not renaming {len(paths)} entries which would all become: {target}")
+            for path in paths:
+                echo(f"* {path}")
+    renamed, errors = apply_renames(plan, index=index)
+    with buffered():
+        for error in errors:
+            echo(error)
+    echo(f"Renamed {renamed} directories and files")
+
+
+def trash_redundant_album_art(
+    filepaths: List[str], *, index: LibraryIndex = None, hashes: ArtHasher = None
+) -> List[str]:
+    """Keep only the best of visually identical images before they're converted.
+
+    Returns album art files which are still there to convert.
+    """
+    try:
+        clusters = redundant_album_art(filepaths, index=index, hasher=hashes)
+    except ImportError as err:
+        echo(f"Can't compare album art: {err}")
+        return filepaths
+    if not clusters:
+        return filepaths
+
+    echo(f"Found {len(clusters)} groups of visually identical album art")
+    with buffered():
+        for group in clusters:
+            echo(f"* keep '{group.keep}', drop: {', '.join(group.redundant)}")
+    decision = prompt("Keep only the best image of each group?", ["y", "n", "q"])
+    if decision == "y":
+        redundant = [path for group in clusters for path in group.redundant]
+        with buffered():
+            for error in trash_many(redundant, index):
+                echo(error)
+        echo(f"Moved {len(redundant)} redundant album art files to trashbin")
+        return [path for path in filepaths if os.path.exists(path)]
+    elif decision == "q":
+        echo("Quit")
+        sys.exit(0)
+    return filepaths
+
+
+def convert_album_art_to_jpg(
+    directory,
+    *,
+    index: LibraryIndex = None,
+    jobs: int = None,
+    hashes: ArtHasher = None,
+    size_limit: SizeLimit = None,
+):
+    filepaths = prefetched(album_art_files_to_convert, directory, index=index)
+    if filepaths:
+        filepaths = trash_redundant_album_art(filepaths, index=index, hashes=hashes)
     if not filepaths:
-        print("Non album art files found to convert to jpg")
+        echo("Non album art files found to convert to jpg")
     else:
-        print(f"Found {len(filepaths)} album art files to convert to jpg")
-        for path in filepaths:
-            print(path)
+        echo(f"Found {len(filepaths)} album art files to convert to jpg")
+        listing(filepaths, title="album art files to convert to jpg")
 
         decision = prompt("Convert all album art to jpg?", ["y", "n", "q"])
         if decision == "y":
-            for path in filepaths:
-                new_path = path[: len(path) - len(Path(path).suffix)] + ".jpg"
-                with Image(filename=path) as image:
-                    image.compression_quality = 90
-                    image.save(filename=new_path)
-                    try:
-                        os.remove(path)
-                    except OSError as err:
-                        print(err)
-            print("Converted all album art to jpg")
+            failed = 0
+            conversions = []
+            for conversion in convert_to_jpg(
+                filepaths, jobs=jobs, size_limit=size_limit
+            ):
+                conversions.append(conversion)
+                if conversion.error:
+                    failed += 1
+                    echo(f"Failed to convert '{conversion.source}': {conversion.error}")
+                    continue
+                if conversion.size != conversion.original_size:
+                    echo(
+                        f"Scaled '{conversion.source}' down from "
+                        f"{'x'.join(map(str, conversion.original_size))} to "
+                        f"{'x'.join(map(str, conversion.size))}"
+                    )
+                if index is not None:
+                    index.add(conversion.target)
+                try:
+                    remove(conversion.source, index)
+                except OSError as err:
+                    echo(err)
+            if failed:
+                echo(f"Converted {len(filepaths) - failed} album art files to jpg")
+                echo(f"Failed to convert {failed} album art files")
+            else:
+                echo("Converted all album art to jpg")
+            summary = memory_summary(conversions)
+            if summary:
+                echo(summary)
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         else:
-            print("Skipped converting all album art to jpg")
+            echo("Skipped converting all album art to jpg")
+
+
+def _album_art_moves(art_dir: dict) -> List[Tuple[str, str]]:
+    """Return current & new paths of files in an album art directory."""
+    moves = []
+    for filename in art_dir["art_files"]:
+        new_name = filename
+        if Path(filename).stem.isdigit():
+            new_name = f"booklet-{filename}"
+        moves.append(
+            (
+                os.path.join(art_dir["art_dir"], filename),
+                os.path.join(art_dir["parent_dir"], new_name),
+            )
+        )
+    return moves
 
 
-def move_album_art_files_to_album_dir(directory):
-    art_directories = nested_album_art(directory)
+def move_album_art_files_to_album_dir(directory, *, index: LibraryIndex = None):
+    art_directories = prefetched(nested_album_art, directory, index=index)
     if art_directories["case1"]:
-        print(
+        echo(
             f"Let's deal with {len(art_directories['case1'])} album art directories "
             "of first type"
         )
@@ -232,61 +389,66 @@ def move_album_art_files_to_album_dir(directory):
             "Move all album art files to parent directory?", ["y", "n", "s", "q"]
         )
         if decision == "y":
+            # Hash all colliding files at once, so it's done in parallel
+            collisions = [
+                (old_path, new_path)
+                for art_dir in art_directories["case1"]
+                for old_path, new_path in _album_art_moves(art_dir)
+                if os.path.exists(new_path)
+            ]
+            identical = identical_pairs(collisions)
             for art_dir in art_directories["case1"]:
                 sub_dir = art_dir["art_dir"]
-                parent = art_dir["parent_dir"]
-                for filename in art_dir["art_files"]:
-                    ext = Path(filename).suffix
-                    name = Path(filename).name.replace(ext, "")
-                    old_path = os.path.join(sub_dir, filename)
-                    new_path = os.path.join(parent, filename)
-                    if name.isdigit():
-                        print(
-                            f"Numeric art file name: {name} will rename to "
-                            f"'booklet-{filename}'"
+                for old_path, new_path in _album_art_moves(art_dir):
+                    filename = os.path.basename(old_path)
+                    if os.path.basename(new_path) != filename:
+                        echo(
+                            f"Numeric art file name: {Path(filename).stem} will "
+                            f"rename to '{os.path.basename(new_path)}'"
                         )
-                        new_path = os.path.join(parent, f"booklet-{filename}")
                     if os.path.exists(new_path):
-                        print(f"File already exists: {new_path}")
-                        old_size = Path(new_path).stat().st_size // 8
-                        new_size = Path(old_path).stat().st_size // 8
-                        if old_size != new_size:
+                        echo(f"File already exists: {new_path}")
+                        if (old_path, new_path) not in identical:
+                            old_size = os.path.getsize(old_path)
+                            new_size = os.path.getsize(new_path)
                             replace_decision = prompt(
                                 f"Replace '{new_path}' ({new_size} bytes) with "
                                 f"'{old_path}' ({old_size} bytes)?",
                                 ["d", "y", "n", "s", "q"],
+                                key="Replace album art "
+                                f"{pattern(os.path.basename(new_path))}?",
                             )
                             if replace_decision == "y":
                                 try:
-                                    print(f"Moved '{new_path}' to trashbin")
-                                    send2trash(new_path)
-                                    os.rename(old_path, new_path)
-                                    print(f"Moved '{old_path}' to '{new_path}'")
+                                    echo(f"Moved '{new_path}' to trashbin")
+                                    trash(new_path, index)
+                                    move(old_path, new_path, index)
+                                    echo(f"Moved '{old_path}' to '{new_path}'")
                                 except OSError as err:
-                                    print(err)
+                                    echo(err)
                             elif replace_decision == "d":
-                                send2trash(old_path)
-                                print(f"Moved '{old_path}' to trashbin")
+                                trash(old_path, index)
+                                echo(f"Moved '{old_path}' to trashbin")
                             elif replace_decision == "q":
-                                print("Quit")
+                                echo("Quit")
                                 sys.exit(0)
                             elif replace_decision == "s":
-                                print("Skip this step")
+                                echo("Skip this step")
                                 return
                             else:
                                 continue
                         else:
-                            send2trash(old_path)
-                            print(
-                                f"Moved '{old_path}' to trashbin as it's the same "
-                                "size as the file with the same name in the parent "
+                            trash(old_path, index)
+                            echo(
+                                f"Moved '{old_path}' to trashbin as it's identical "
+                                "to the file with the same name in the parent "
                                 "directory"
                             )
                     else:
                         try:
-                            os.rename(old_path, new_path)
+                            move(old_path, new_path, index)
                         except OSError as err:
-                            print(err)
+                            echo(err)
 
                 leftover_files = [
                     f
@@ -294,92 +456,121 @@ def move_album_art_files_to_album_dir(directory):
                     if os.path.isfile(os.path.join(sub_dir, f))
                 ]
                 if not leftover_files:
-                    send2trash(sub_dir)
-                    print(f"Moved empty art dir '{sub_dir}' to trashbin")
+                    trash(sub_dir, index)
+                    echo(f"Moved empty art dir '{sub_dir}' to trashbin")
                 else:
-                    print(
+                    echo(
                         f"There are still files in album art directory '{sub_dir}': "
                         f"{leftover_files}"
                     )
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         elif decision == "s":
-            print("Skip this step")
+            echo("Skip this step")
             return
     else:
-        print("No album art directories of first type! :)")
-
-
-def process_command(command, *, stdout=None):
-    """Executes shell command with subprocess.Popen.
-    Returns tuple, where first element is a process return code,
-    and the second is a tuple of stdout and stderr output.
-    """
-    print(f"Executing shell command: {command}")
-    prc = Popen(command, shell=True, stdout=stdout)
-    std = prc.communicate()
-    return prc.returncode, std
-
-
-def delete_empty_directories(directory):
-    empty = empty_directories(directory)
+        echo("No album art directories of first type! :)")
+
+
+def trash_split_sources(
+    cue_dir: CuedAlbum,
+    cue_file: str,
+    *,
+    index: LibraryIndex = None,
+    cues: CueCache = None,
+):
+    """Trash CUE file and the audio image it has been split from."""
+    cue_path = os.path.join(cue_dir.dir, cue_file)
+    cue = _parse_cue(cue_path, cues)
+    cue_audio_file = (cue.meta.get("FILE") or "").replace(" ", "_").lower()
+    cue_audio_file_path = os.path.join(cue_dir.dir, cue_audio_file)
+    if cue_audio_file and os.path.isfile(cue_audio_file_path):
+        trash(cue_audio_file_path, index)
+        echo(f"Successfully deleted audio source file: {cue_audio_file}")
+    else:
+        echo(f"Couldn't find audio file '{cue_audio_file}' specified in '{cue_file}'")
+        for audio_file in cue_dir.audio_files:
+            trash(os.path.join(cue_dir.dir, audio_file), index)
+            echo(f"Successfully deleted audio source file: {audio_file}")
+    trash(cue_path, index)
+    echo(f"Successfully deleted cue file: {cue_file}")
+
+
+def delete_empty_directories(
+    directory, *, index: LibraryIndex = None, stream: bool = False
+):
+    if stream:
+        _delete_streamed(
+            directory,
+            iter_empty_directories(directory, index=index),
+            description="empty directories",
+            delete=lambda paths: trash_many(paths, index),
+        )
+        return
+    empty = prefetched(empty_directories, directory, index=index)
     if empty:
-        print(f"Found {len(empty)} empty directories.")
-        print("\n".join(empty))
+        echo(f"Found {len(empty)} empty directories.")
+        listing(empty, title="empty directories")
         decision = prompt("Delete all empty directories?", ["y", "n", "s", "q"])
         if decision == "y":
-            for sub_dir in empty:
-                try:
-                    send2trash(sub_dir)
-                    print(f"Moved '{sub_dir}' to trashbin")
-                except OSError as err:
-                    print(err)
+            errors = trash_many(empty, index)
+            with buffered():
+                for error in errors:
+                    echo(error)
+            echo(f"Moved {len(empty) - len(errors)} empty directories to trashbin")
         elif decision == "s":
-            print("Skip this step")
+            echo("Skip this step")
             return
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
     else:
-        print("No empty directories found")
-
-
-def what_to_do_with_cue(directory):
-    cue_directories = cue_files_and_audio_files(directory)
+        echo("No empty directories found")
+
+
+def what_to_do_with_cue(
+    directory,
+    *,
+    index: LibraryIndex = None,
+    split_jobs: int = None,
+    split_timeout: float = DEFAULT_TIMEOUT,
+    cues: CueCache = None,
+):
+    cue_directories = prefetched(cue_files_and_audio_files, directory, index=index)
     if not cue_directories:
-        print(f"No cue files found in: {directory}")
+        echo(f"No cue files found in: {directory}")
     else:
         single_cue = [d for d in cue_directories if len(d.cues) == 1]
         multi_cue = [d for d in cue_directories if len(d.cues) > 1]
-        print(
+        echo(
             f"Found {len(single_cue)} directories with single cue file & "
             f"{len(multi_cue)} directories with more than 1 cue file"
         )
         decision = prompt("Proceed with cue clean-up?", ["y", "n", "q"])
         if decision == "y":
-            print("Let's start with directories containing more than 1 cue file")
+            echo("Let's start with directories containing more than 1 cue file")
             for cue_dir in multi_cue:
-                print(
+                echo(
                     f"\n\nThere are {len(cue_dir.audio_files)} audio files in "
                     f"{cue_dir.dir} and {len(cue_dir.cues)} CUE files"
                 )
                 for f in sorted(cue_dir.audio_files):
-                    print(f"* {f}")
+                    echo(f"* {f}")
                 for cue_file in cue_dir.cues:
                     cue_path = os.path.join(cue_dir.dir, cue_file)
-                    cue = CueParser(cue_path)
+                    cue = _parse_cue(cue_path, cues)
                     if "FILE" in cue.meta:
-                        print(
+                        echo(
                             f"'{cue_file}' refers to {len(cue.tracks)} tracks in 1 "
                             f"file: {cue.meta['FILE']}"
                         )
                     else:
-                        print(
+                        echo(
                             f"'{cue_file}' refers to {len(cue.tracks)} tracks in "
                             f"{len(set(t['FILE'] for t in cue.tracks))} file(s)"
                         )
-                        print(
+                        echo(
                             "Files:\n*",
                             "\n* ".join(
                                 set(
@@ -388,7 +579,7 @@ def what_to_do_with_cue(directory):
                                 )
                             ),
                         )
-                    print(
+                    echo(
                         "Titles:\n*",
                         "\n* ".join(
                             t.get("TITLE", "NO TITLE ENTRY!!!")
@@ -402,23 +593,29 @@ def what_to_do_with_cue(directory):
                     cue_decision = prompt(
                         f"What do you want to do with '{cue_file}'?",
                         ["d", "p", "s", "q"],
+                        key=f"What do you want to do with {pattern(cue_file)}?",
                     )
 
                     if cue_decision == "d":
-                        send2trash(cue_path)
-                        print(f"Moved '{cue_path}' to trash bin")
+                        trash(cue_path, index)
+                        echo(f"Moved '{cue_path}' to trash bin")
                     elif cue_decision == "p":
-                        cmd = f"flacon -s '{cue_path}'"
-                        return_code, std = process_command(cmd)
-                        if return_code == 0:
-                            print(f"Flacon successfully processed '{cue_path}'")
+                        job = run_job(split_job(cue_path), timeout=split_timeout)
+                        if job.succeeded:
+                            echo(
+                                f"{splitter_name(job)} successfully processed "
+                                f"'{cue_path}'"
+                            )
+                            if index is not None:
+                                index.refresh(cue_dir.dir)
                             deleted_cue_decision = prompt(
                                 f"Delete '{cue_file}' and source audio?",
                                 ["d", "n", "s", "q"],
+                                key="Delete split Cue Sheet and source audio?",
                             )
                             if deleted_cue_decision in ["d", "y"]:
                                 cue_path = os.path.join(cue_dir.dir, cue_file)
-                                cue = CueParser(cue_path)
+                                cue = _parse_cue(cue_path, cues)
                                 cue_audio_file = (
                                     cue.meta.get("FILE").replace(" ", "_").lower()
                                 )
@@ -426,7 +623,7 @@ def what_to_do_with_cue(directory):
                                     cue_dir.dir, cue_audio_file
                                 )
                                 if not os.path.exists(cue_audio_file_path):
-                                    print(
+                                    echo(
                                         f"Couldn't find audio file '{cue_audio_file}'"
                                         f" specified in '{cue_file}'"
                                     )
@@ -439,35 +636,38 @@ def what_to_do_with_cue(directory):
                                             audio_file_path = os.path.join(
                                                 cue_dir, audio_file
                                             )
-                                            send2trash(audio_file_path)
-                                            print(
+                                            trash(audio_file_path, index)
+                                            echo(
                                                 "Successfully deleted audio source "
                                                 f"file: {audio_file}"
                                             )
                                 else:
-                                    send2trash(cue_audio_file_path)
-                                    print(
+                                    trash(cue_audio_file_path, index)
+                                    echo(
                                         "Successfully deleted audio source file: "
                                         f"{cue_audio_file}"
                                     )
-                                    send2trash(cue_path)
-                                    print(f"Successfully deleted cue file: {cue_file}")
+                                    trash(cue_path, index)
+                                    echo(f"Successfully deleted cue file: {cue_file}")
                             elif cue_decision == "q":
-                                print("Quit")
+                                echo("Quit")
                                 sys.exit(0)
                             else:
-                                print(f"Skipped '{cue_file}'")
+                                echo(f"Skipped '{cue_file}'")
                                 continue
                         else:
-                            print(f"Flacon had some issues with '{cue_path}': {std}")
+                            echo(
+                                f"{splitter_name(job)} had some issues with "
+                                f"'{cue_path}', see: {job.log_path}"
+                            )
                     elif cue_decision == "q":
-                        print("Quit")
+                        echo("Quit")
                         sys.exit(0)
                     else:
-                        print(f"Skipped '{cue_path}'")
+                        echo(f"Skipped '{cue_path}'")
                         continue
 
-            print("Let's now deal with directories with single cue file")
+            echo("Let's now deal with directories with single cue file")
 
             cues_to_split = []
             cues_to_delete = []
@@ -475,7 +675,7 @@ def what_to_do_with_cue(directory):
             for cue_dir in single_cue:
                 cue_file = cue_dir.cues[0]
                 cue_path = os.path.join(cue_dir.dir, cue_file)
-                cue = CueParser(cue_path)
+                cue = _parse_cue(cue_path, cues)
                 files_equal_tracks = len(cue_dir.audio_files) == len(cue.tracks)
                 more_files_than_min = len(cue_dir.audio_files) > min_audio_files
                 if files_equal_tracks and more_files_than_min:
@@ -484,21 +684,21 @@ def what_to_do_with_cue(directory):
                     cues_to_split.append(cue_dir)
             assert len(cues_to_delete) + len(cues_to_split) == len(single_cue)
             if cues_to_delete:
-                print(
+                echo(
                     f"Found {len(cues_to_delete)} cue files with more than "
                     f"{min_audio_files} track that looks to be already extracted"
                 )
                 for cue_dir in cues_to_delete:
                     cue_file = cue_dir.cues[0]
                     cue_path = os.path.join(cue_dir.dir, cue_file)
-                    cue = CueParser(cue_path)
-                    print(
+                    cue = _parse_cue(cue_path, cues)
+                    echo(
                         f"\n\nThere are {len(cue_dir.audio_files)} audio files in "
                         f"{cue_dir.dir}"
                     )
                     for f in sorted(cue_dir.audio_files):
-                        print(f"* {f}")
-                    print(
+                        echo(f"* {f}")
+                    echo(
                         "CUE Titles:\n*",
                         "\n* ".join(
                             f'{t.get("TRACK_NUM")} - {t.get("TITLE", "NO TITLE ENTRY")}'
@@ -508,33 +708,42 @@ def what_to_do_with_cue(directory):
                 delete_extracted_cues = prompt(
                     f"Delete '{len(cues_to_delete)}' already extracted CUE files?",
                     ["d", "s", "q"],
+                    key="Delete already extracted CUE files?",
                 )
                 if delete_extracted_cues in ["d", "y"]:
-                    for cue_dir in cues_to_delete:
-                        cue_file = cue_dir.cues[0]
-                        cue_path = os.path.join(cue_dir.dir, cue_file)
-                        send2trash(cue_path)
-                    print(f"Deleted {len(cues_to_delete)} extracted CUE files")
+                    errors = trash_many(
+                        [
+                            os.path.join(cue_dir.dir, cue_dir.cues[0])
+                            for cue_dir in cues_to_delete
+                        ],
+                        index,
+                    )
+                    for error in errors:
+                        echo(error)
+                    echo(
+                        f"Deleted {len(cues_to_delete) - len(errors)} extracted "
+                        f"CUE files"
+                    )
                 elif delete_extracted_cues == "q":
-                    print("Quit")
+                    echo("Quit")
                     sys.exit(0)
                 else:
-                    print(f"Skipped '{cue_file}'")
+                    echo(f"Skipped '{cue_file}'")
 
             if cues_to_split:
                 for cue_dir in cues_to_split:
                     cue_file = cue_dir.cues[0]
                     cue_path = os.path.join(cue_dir.dir, cue_file)
-                    cue = CueParser(cue_path)
-                    print(
+                    cue = _parse_cue(cue_path, cues)
+                    echo(
                         f"\n\nOnly {len(cue_dir.audio_files)} audio file "
                         f"'{cue_dir.audio_files[0]}' in '{cue_dir.dir}'"
                     )
-                    print(
+                    echo(
                         f"Looks like it should be split into {len(cue.tracks)} tracks "
                         f"defined in '{cue_file}':"
                     )
-                    print(
+                    echo(
                         "CUE Tracks:\n*",
                         "\n* ".join(
                             f'{t.get("TRACK_NUM")} - {t.get("TITLE", "NO TITLE ENTRY")}'
@@ -543,79 +752,98 @@ def what_to_do_with_cue(directory):
                     )
 
                 cue_decision = prompt(
-                    "Would you like to split those cue files with Flacon and delete "
-                    "them afterwards?",
+                    "Would you like to split those cue files and delete them "
+                    "afterwards?",
                     ["p", "s", "q"],
                 )
 
                 if cue_decision == "p":
-                    for cue_dir in cues_to_split:
-                        cue_file = cue_dir.cues[0]
-                        cue_path = os.path.join(cue_dir.dir, cue_file)
-                        cue = CueParser(cue_path)
-                        cmd = f"flacon -s '{cue_path}'"
-                        return_code, std = process_command(cmd)
-                        if return_code == 0:
-                            print(f"Flacon successfully processed '{cue_path}'")
-                            cue_audio_file = (
-                                cue.meta.get("FILE").replace(" ", "_").lower()
+                    cue_dirs = {
+                        os.path.join(cue_dir.dir, cue_dir.cues[0]): cue_dir
+                        for cue_dir in cues_to_split
+                    }
+                    jobs = [split_job(cue_path) for cue_path in cue_dirs]
+                    finished = []
+                    for job in run_jobs(
+                        jobs, workers=split_jobs, timeout=split_timeout
+                    ):
+                        finished.append(job)
+                        cue_dir = cue_dirs[job.cue_path]
+                        if job.succeeded:
+                            echo(
+                                f"{splitter_name(job)} successfully processed "
+                                f"'{job.cue_path}'"
                             )
-                            cue_audio_file_path = os.path.join(
-                                cue_dir.dir, cue_audio_file
+                            if index is not None:
+                                index.refresh(cue_dir.dir)
+                            trash_split_sources(
+                                cue_dir, cue_dir.cues[0], index=index, cues=cues
                             )
-                            if os.path.exists(cue_audio_file_path):
-                                send2trash(cue_audio_file_path)
-                                print(
-                                    "Successfully deleted audio source file: "
-                                    f"{cue_audio_file}"
-                                )
-                                send2trash(cue_path)
-                                print(f"Successfully deleted cue file: {cue_file}")
-                            else:
-                                print(
-                                    f"Couldn't find audio file '{cue_audio_file}' "
-                                    f"specified in '{cue_file}'"
-                                )
-                                for audio_file in cue_dir.audio_files:
-                                    audio_file_path = os.path.join(
-                                        cue_dir.dir, audio_file
-                                    )
-                                    send2trash(audio_file_path)
-                                    print(
-                                        "Successfully deleted audio source file: "
-                                        f"{audio_file}"
-                                    )
-                                    send2trash(cue_path)
-                                    print(f"Successfully deleted cue file: {cue_file}")
                         else:
-                            print(f"Flacon had some issues with '{cue_path}': {std}")
+                            echo(
+                                f"{splitter_name(job)} had some issues with "
+                                f"'{job.cue_path}', see: {job.log_path}"
+                            )
+                    echo(split_summary(finished))
                 elif cue_decision == "q":
-                    print("Quit")
+                    echo("Quit")
                     sys.exit(0)
                 else:
-                    print(f"Skipped '{cue_path}'")
+                    echo(f"Skipped '{cue_path}'")
 
-            print("Cleaned up all directories with cue files")
+            echo("Cleaned up all directories with cue files")
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         else:
-            print("Skipped cleaning up directories with cue files")
-
-
-def clean_up_jpg_album_art_file_names(directory):
-    filepaths = album_art_jpg_files(directory)
+            echo("Skipped cleaning up directories with cue files")
+
+
+def _review_jpg_album_art_file_names(directory, *, index: LibraryIndex = None):
+    items = (
+        ReviewItem(label=path, choices=suggestions, value=path)
+        for path, suggestions in iter_album_art_jpg_suggestions(directory, index=index)
+    )
+    flush()
+    decisions = review_findings(
+        items, title=f"Album art file name suggestions in: {directory}"
+    )
+    if decisions is None:
+        echo("Skipped cleaning up jpg album art file names")
+        return
+    renamed = 0
+    with buffered():
+        for item, suggestion in decisions:
+            new_path = os.path.join(os.path.dirname(item.value), suggestion)
+            if os.path.exists(new_path):
+                echo(f"File already exists: {new_path}")
+                continue
+            try:
+                rename(item.value, new_path, index)
+                renamed += 1
+            except OSError as err:
+                echo(err)
+    echo(f"Renamed {renamed} of {len(decisions)} reviewed jpg album art files")
+
+
+def clean_up_jpg_album_art_file_names(
+    directory, *, index: LibraryIndex = None, review: bool = False
+):
+    if review and review_available():
+        _review_jpg_album_art_file_names(directory, index=index)
+        return
+    filepaths = prefetched(album_art_jpg_files, directory, index=index)
     if not filepaths:
-        print(f"No jpg album art files found to clean-up in: {directory}")
+        echo(f"No jpg album art files found to clean-up in: {directory}")
     else:
-        print(
+        echo(
             f"Found {len(filepaths)} suggestions for changing jpg album art file names"
         )
         decision = prompt(
             "Proceed with album art file name change suggestions?", ["y", "n", "q"]
         )
         if decision == "y":
-            for sub_dir, _, files in os.walk(directory):
+            for sub_dir, _, files in walk(directory, index):
                 album_art_files = []
                 for file in files:
                     extension = Path(file).suffix[1:]
@@ -625,16 +853,16 @@ def clean_up_jpg_album_art_file_names(directory):
                         if suggestions:
                             album_art_files.append((file, suggestions))
                 if album_art_files:
-                    print(f"\n\nSuggestions for album art in: {sub_dir}")
+                    echo(f"\n\nSuggestions for album art in: {sub_dir}")
                     for filename, suggestions in album_art_files:
                         if len(suggestions) == 1:
-                            print(f"    {filename} -> {suggestions[0]}")
+                            echo(f"    {filename} -> {suggestions[0]}")
                         else:
                             txt_suggestions = "; ".join(
                                 f"({idx+1}): {sug}"
                                 for idx, sug in enumerate(suggestions)
                             )
-                            print(f"    {filename} -> {txt_suggestions}")
+                            echo(f"    {filename} -> {txt_suggestions}")
 
                     decision = prompt(
                         "Apply suggested file name changes?", ["y", "n", "s", "q"]
@@ -648,7 +876,10 @@ def clean_up_jpg_album_art_file_names(directory):
                                     [str(n) for n in range(1, len(suggestions) + 1)]
                                 )
                                 num = prompt(
-                                    f"Choose suggestion for {filename}?", options
+                                    f"Choose suggestion for {filename}?",
+                                    options,
+                                    key=f"Choose suggestion for {pattern(filename)}: "
+                                    f"{'; '.join(suggestions)}?",
                                 )
                                 if num not in ["n", "q"]:
                                     num = int(num) - 1
@@ -664,23 +895,104 @@ def clean_up_jpg_album_art_file_names(directory):
                             old_path = os.path.join(sub_dir, filename)
                             new_path = os.path.join(sub_dir, suggestion)
                             if os.path.exists(new_path):
-                                print(f"File already exists: {new_path}")
+                                echo(f"File already exists: {new_path}")
                             else:
                                 try:
-                                    os.rename(old_path, new_path)
+                                    rename(old_path, new_path, index)
                                 except OSError as err:
-                                    print(err)
+                                    echo(err)
                     elif decision == "q":
-                        print("Quit")
+                        echo("Quit")
                         sys.exit(0)
                     elif decision == "s":
-                        print("Skip this step")
+                        echo("Skip this step")
                         return
                     else:
                         continue
-            print("Cleaned up all jpg album art file names")
+            echo("Cleaned up all jpg album art file names")
         elif decision == "q":
-            print("Quit")
+            echo("Quit")
             sys.exit(0)
         else:
-            print("Skipped cleaning up jpg album art file names")
+            echo("Skipped cleaning up jpg album art file names")
+
+
+def optimise_album_art_jpg(
+    directory,
+    *,
+    index: LibraryIndex = None,
+    jobs: int = None,
+    target_size: int = DEFAULT_TARGET_SIZE,
+    min_ssim: float = DEFAULT_MIN_SSIM,
+):
+    filepaths = prefetched(
+        oversized_jpg_files, directory, index=index, min_size=target_size
+    )
+    if not filepaths:
+        echo(f"No jpg files larger than {human_size(target_size)} found")
+        return
+
+    echo(f"Found {len(filepaths)} jpg files larger than {human_size(target_size)}")
+    decision = prompt(
+        "Strip metadata & re-encode them to fit in that size?", ["y", "r", "n", "q"]
+    )
+    if decision == "q":
+        echo("Quit")
+        sys.exit(0)
+    elif decision not in ["y", "r"]:
+        echo("Skipped re-encoding jpg files")
+        return
+
+    dry_run = decision == "r"
+    results = []
+    optimised = optimise_jpgs(
+        filepaths,
+        jobs=jobs,
+        target_size=target_size,
+        min_ssim=min_ssim,
+        dry_run=dry_run,
+    )
+    # Files whose results haven't been handled yet
+    pending = set(filepaths)
+    try:
+        for result in optimised:
+            results.append(result)
+            pending.discard(result.path)
+            if result.error:
+                echo(f"Failed to re-encode '{result.path}': {result.error}")
+                continue
+            if result.saved <= 0:
+                continue
+            if not dry_run:
+                try:
+                    # Original stays in trash bin, so the run can be undone
+                    trashed = trash(result.path, index)
+                    try:
+                        rename(result.temporary_path, result.path)
+                    except OSError:
+                        if trashed is not None:
+                            restore(trashed, result.path, index)
+                        raise
+                    if index is not None:
+                        index.add(result.path)
+                except OSError as err:
+                    echo(err)
+                    result.error = f"{err}"
+                    if not os.path.exists(result.path):
+                        echo(
+                            f"Re-encoded '{result.path}' is kept in: {result.temporary_path}"
+                        )
+                    elif os.path.exists(result.temporary_path):
+                        os.remove(result.temporary_path)
+                    continue
+            echo(
+                f"'{result.path}': {human_size(result.original_size)} -> "
+                f"{human_size(result.size)} at quality {result.quality}"
+            )
+    finally:
+        # Workers may have written files which weren't put in place, e.g. when the
+        # run is interrupted
+        optimised.close()
+        if not dry_run:
+            remove_temporary_files(sorted(pending))
+    echo(optimise_summary(results, dry_run=dry_run))
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Process albums concurrently with questions asked one at a time.
+
+By default teeb runs every step over the whole library, so it waits for the user
+to answer questions about all albums before it moves on with any slow I/O. In album
+mode every top-level sub-directory of the library is an independent unit of work,
+handled by a pool of worker threads running all steps on it.
+
+Workers never touch the terminal. Their questions are queued to the prompt channel,
+which is served by the main thread, so while the user answers questions about one
+album, files of other albums are converted, split & moved. Output of each worker is
+buffered & printed just before its next question or when its album is done, so the
+output of different albums never interleaves.
+"""
+import io
+import logging
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+from typing import (
+    Callable,
+    List,
+    Optional,
+)
+
+import teeb.prompt
+from teeb.index import LibraryIndex
+
+DEFAULT_WORKERS = 4
+
+
+class _WorkerOutput(io.TextIOBase):
+    """stdout which collects output of each worker thread in its own buffer."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def _buffer(self) -> Optional[io.StringIO]:
+        return getattr(self._local, "buffer", None)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        buffer = self._buffer()
+        if buffer is None:
+            return self._stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if self._buffer() is None:
+            self._stream.flush()
+
+    def capture(self):
+        self._local.buffer = io.StringIO()
+
+    def release(self) -> str:
+        """Stop capturing output of current thread & return what it printed."""
+        buffer = self._local.buffer
+        self._local.buffer = None
+        return buffer.getvalue()
+
+    def take(self) -> str:
+        """Return output captured so far in current thread."""
+        buffer = self._buffer()
+        if buffer is None:
+            return ""
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+
+class PromptChannel:
+    """Questions of worker threads, asked one by one by the thread serving it."""
+
+    def __init__(self, output: _WorkerOutput = None):
+        self._output = output
+        self._questions: "queue.Queue" = queue.Queue()
+        self._closed = threading.Event()
+        self._local = threading.local()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def label(self, label: str):
+        """Set the label questions asked from current thread are prefixed with."""
+        self._local.label = label
+
+    def ask(self, question: str, options: list) -> str:
+        """Queue a question & wait for the answer, called by worker threads."""
+        if self.closed:
+            return "q"
+        printed = self._output.take() if self._output is not None else ""
+        label = getattr(self._local, "label", None)
+        if label:
+            question = f"[{label}] {question}"
+        answer: Future = Future()
+        self._questions.put((printed, question, options, answer))
+        if self.closed:  # Closed after the check above, nobody will answer it
+            self._answer_all("q")
+        return answer.result()
+
+    def tell(self, text: str):
+        """Queue output to be printed by the thread serving the channel."""
+        self._questions.put((text, None, None, None))
+
+    def serve(self, until: Callable[[], bool], ask: Callable[[str, list], str]):
+        """Ask queued questions until the condition is met & nothing is queued."""
+        while not (until() and self._questions.empty()):
+            try:
+                printed, question, options, answer = self._questions.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if printed:
+                print(printed, end="")
+            if answer is None:
+                continue
+            try:
+                answer.set_result(ask(question, options))
+            except BaseException:
+                answer.set_result("q")
+                raise
+
+    def _answer_all(self, answer: str):
+        told = []
+        while True:
+            try:
+                printed, question, options, future = self._questions.get_nowait()
+            except queue.Empty:
+                break
+            if printed:
+                # Output is still printed by the thread serving the channel
+                told.append((printed, None, None, None))
+            if future is not None and not future.done():
+                future.set_result(answer)
+        for item in told:
+            self._questions.put(item)
+
+    def close(self):
+        """Answer all waiting & future questions with quit."""
+        self._closed.set()
+        self._answer_all("q")
+
+
+def album_directories(directory: str, *, index: LibraryIndex = None) -> List[str]:
+    """Return top-level sub-directories of a library, each one is an album."""
+    if index is not None:
+        names = [
+            name
+            for name in index.listdir(directory)
+            if index.isdir(os.path.join(directory, name))
+        ]
+    else:
+        names = [entry.name for entry in os.scandir(directory) if entry.is_dir()]
+    return [os.path.join(directory, name) for name in sorted(names)]
+
+
+def process_albums(
+    albums: List[str],
+    process: Callable[[str], None],
+    *,
+    workers: int = DEFAULT_WORKERS,
+) -> int:
+    """Run process(album) for every album in a pool of threads.
+
+    Questions asked with teeb.prompt.prompt() from workers are asked by the calling
+    thread one at a time. If the user quits, albums that haven't started are
+    skipped & every following question is answered with quit.
+    Returns the number of albums that were processed completely.
+    """
+    output = _WorkerOutput(sys.stdout)
+    channel = PromptChannel(output)
+    ask = teeb.prompt.ask
+    quit_requested = threading.Event()
+    completed = []
+
+    def work(album: str):
+        if quit_requested.is_set():
+            return
+        output.capture()
+        channel.label(os.path.basename(album))
+        try:
+            process(album)
+            completed.append(album)
+        except SystemExit:  # User chose to quit
+            quit_requested.set()
+            channel.close()
+        except Exception as err:
+            logging.debug(f"Failed to process album: {album}", exc_info=True)
+            print(f"Failed to process '{album}': {err}")
+        finally:
+            printed = output.release()
+            if printed:
+                channel.tell(printed)
+
+    original_stdout = sys.stdout
+    sys.stdout = output
+    teeb.prompt.channel = channel
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(work, album) for album in albums]
+            try:
+                channel.serve(lambda: all(f.done() for f in futures), ask)
+            except BaseException:
+                quit_requested.set()
+                channel.close()
+                raise
+    finally:
+        teeb.prompt.channel = None
+        sys.stdout = original_stdout
+    if quit_requested.is_set():
+        sys.exit(0)
+    return len(completed)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Find visually identical album art with perceptual hashes.
+
+The same cover is often stored as cover.png, folder.jpg & front.bmp. Converting all
+of them to jpg wastes time & space and leaves renames that collide, so images in
+the same directory are clustered first and only the best one of each cluster is
+kept.
+
+Images are compared by their difference hash (dHash): an image is shrunk to 9x8
+grey pixels & each of the 64 bits tells whether a pixel is brighter than its right
+neighbour. Re-encoding, resizing or a different format flips a few bits at most,
+while unrelated images differ in about half of them. JPEGs are decoded at reduced
+size by libjpeg, so a 600 dpi scan is never decoded in full just to be hashed.
+Hashes are cached by file size & mtime.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+)
+
+import teeb.default
+from teeb.cache import ScanCache
+from teeb.data_type import (
+    ArtCluster,
+    ArtHash,
+)
+from teeb.index import LibraryIndex
+
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+# Images which hashes differ in up to this many bits are considered identical
+MAX_DISTANCE = 6
+# Images with aspect ratios differing more than that are never identical
+MAX_ASPECT_DIFFERENCE = 0.05
+DEFAULT_WORKERS = 4
+ART_EXTENSIONS = ["jpg", "jpeg"] + teeb.default.album_art_extentions_to_convert
+
+
+def dhash(pixels: Sequence[int], width: int = HASH_WIDTH) -> int:
+    """Compute difference hash from rows of grey pixels of the shrunk image."""
+    value = 0
+    for row in range(0, len(pixels), width):
+        for column in range(row, row + width - 1):
+            value = (value << 1) | (pixels[column] > pixels[column + 1])
+    return value
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+def read_art_hash(path: str) -> ArtHash:
+    """Hash an image with ImageMagick, only the first frame of multi-page files."""
+    from wand.image import Image
+
+    frame = f"{path}[0]"
+    with Image.ping(filename=frame) as image:
+        width, height = image.width, image.height
+    with Image() as image:
+        # Lets libjpeg scale the image down by up to 8 times while decoding it
+        image.options["jpeg:size"] = f"{HASH_WIDTH * 8}x{HASH_HEIGHT * 8}"
+        image.read(filename=frame)
+        image.transform_colorspace("gray")
+        image.resize(HASH_WIDTH, HASH_HEIGHT)
+        pixels = image.export_pixels(channel_map="I", storage="char")
+    return ArtHash(
+        path=path,
+        dhash=dhash(pixels),
+        width=width,
+        height=height,
+        size=os.path.getsize(path),
+    )
+
+
+class ArtHasher:
+    """Perceptual hashes of images, persisted in ScanCache if one is given."""
+
+    def __init__(self, store: ScanCache = None):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        # Images are hashed by a pool of threads, which all update the counts
+        self._lock = threading.Lock()
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def hash(self, path: str) -> Optional[ArtHash]:
+        """Return hash of an image or None if it can't be read."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if self.store is not None:
+            data = self.store.art_hash(path, stat)
+            if data is not None:
+                self._count(hit=True)
+                return ArtHash(path=path, **data)
+        self._count(hit=False)
+        try:
+            art = read_art_hash(path)
+        except ImportError:
+            raise
+        except Exception as err:  # Wand raises its own exceptions for broken images
+            logging.debug(f"Can't hash {path}: {err}")
+            return None
+        if self.store is not None:
+            data = {
+                "dhash": art.dhash,
+                "width": art.width,
+                "height": art.height,
+                "size": art.size,
+            }
+            self.store.store_art_hash(path, stat, data)
+        return art
+
+    def hash_many(
+        self, paths: Iterable[str], *, workers: int = DEFAULT_WORKERS
+    ) -> Dict[str, ArtHash]:
+        """Hash images in a pool of threads, ImageMagick runs without the GIL."""
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = dict(zip(paths, executor.map(self.hash, paths)))
+        return {path: art for path, art in hashes.items() if art is not None}
+
+    def summary(self) -> Optional[str]:
+        total = self.hits + self.misses
+        if not total:
+            return None
+        return f"Album art cache: {self.hits} hits, {self.misses} images hashed"
+
+
+def _quality(art: ArtHash) -> tuple:
+    """Sort key of images, the best one has the most pixels & is lossless."""
+    lossless = Path(art.path).suffix[1:].lower() not in ["jpg", "jpeg"]
+    return art.width * art.height, lossless, art.size, art.path
+
+
+def _alike(first: ArtHash, second: ArtHash) -> bool:
+    if not (first.height and second.height):
+        return False
+    first_ratio = first.width / first.height
+    second_ratio = second.width / second.height
+    if abs(first_ratio - second_ratio) > MAX_ASPECT_DIFFERENCE * first_ratio:
+        return False
+    return hamming_distance(first.dhash, second.dhash) <= MAX_DISTANCE
+
+
+def cluster(arts: List[ArtHash]) -> List[ArtCluster]:
+    """Cluster visually identical images, images without a twin are left out.
+
+    Every image in a cluster has to be alike all the others, so a chain of
+    images which are each a little different from the previous one isn't
+    mistaken for copies of the first one.
+    """
+    # Album directories hold a handful of images, so comparing all pairs is fine
+    remaining = sorted(arts, key=_quality, reverse=True)
+    clusters = []
+    while remaining:
+        group, rest = remaining[:1], []
+        for art in remaining[1:]:
+            if all(_alike(member, art) for member in group):
+                group.append(art)
+            else:
+                rest.append(art)
+        remaining = rest
+        if len(group) > 1:
+            clusters.append(
+                ArtCluster(
+                    keep=group[0].path,
+                    redundant=sorted(art.path for art in group[1:]),
+                )
+            )
+    return sorted(clusters, key=lambda group: group.keep)
+
+
+def _listdir(path: str, index: Optional[LibraryIndex]) -> List[str]:
+    if index is not None:
+        return [
+            name
+            for name in index.listdir(path)
+            if index.isfile(os.path.join(path, name))
+        ]
+    return [
+        entry.name for entry in os.scandir(path) if entry.is_file(follow_symlinks=False)
+    ]
+
+
+def redundant_album_art(
+    paths: Iterable[str],
+    *,
+    index: LibraryIndex = None,
+    hasher: ArtHasher = None,
+    origin: Callable[[str], Optional[str]] = None,
+    workers: int = DEFAULT_WORKERS,
+) -> List[ArtCluster]:
+    """Cluster given images with visually identical images in their directories.
+
+    origin maps a path to where the file is on disk now, when the index is a plan
+    of future changes, and returns None for files that don't exist yet.
+    """
+    hasher = hasher or ArtHasher()
+    origin = origin or (lambda path: path)
+    directories = {}
+    for path in paths:
+        directory = os.path.dirname(path)
+        if directory in directories:
+            continue
+        directories[directory] = [
+            os.path.join(directory, name)
+            for name in sorted(_listdir(directory, index))
+            if Path(name).suffix[1:].lower() in ART_EXTENSIONS
+        ]
+
+    on_disk = {
+        path: origin(path)
+        for images in directories.values()
+        if len(images) > 1
+        for path in images
+    }
+    hashes = hasher.hash_many(
+        [disk_path for disk_path in on_disk.values() if disk_path], workers=workers
+    )
+    clusters = []
+    for images in directories.values():
+        arts = []
+        for path in images:
+            art = hashes.get(on_disk.get(path))
+            if art is not None:
+                arts.append(replace(art, path=path))
+        clusters.extend(cluster(arts))
+    return clusters
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache of directory listings & parsed Cue Sheets.
+
+A directory's mtime changes whenever an entry is added to it, removed from it or
+renamed, so a listing stored together with the directory's mtime & inode number can
+be safely reused for as long as both stay the same.
+This lets subsequent runs against an unchanged library replace a full directory
+listing with a single stat() call per directory.
+Parsed Cue Sheets & perceptual hashes of album art are stored in the same way, but
+keyed by file size & mtime.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import (
+    Callable,
+    List,
+    Optional,
+    Tuple,
+)
+
+# Sub-directory names, file names & names of sub-directories to descend into
+Listing = Tuple[List[str], List[str], List[str]]
+
+# Directories modified less than this many seconds before they were listed aren't
+# cached, as on file systems with coarse mtime resolution (e.g. SMB or FAT) another
+# change within the same tick wouldn't be noticed. It's the same "racy" problem git
+# has with its index.
+RACY_MTIME_WINDOW = 2
+
+
+def default_cache_dir() -> str:
+    """Return teeb's cache directory as defined by the XDG Base Directory spec."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "teeb")
+
+
+class ScanCache:
+    """SQLite backed store of directory listings keyed by directory mtime & inode.
+
+    It's safe to use from multiple scanning threads. Only database access is
+    serialised, so slow stat() and listing calls still run in parallel.
+    """
+
+    def __init__(self, path: str = None):
+        if path is None:
+            path = os.path.join(default_cache_dir(), "scan.sqlite3")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, inode INTEGER, "
+            "dirs TEXT, files TEXT, descend TEXT)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cues ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, data TEXT)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS art_hashes ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, data TEXT)"
+        )
+
+    def listing(
+        self,
+        path: str,
+        list_directory: Callable[[str], Listing],
+        *,
+        stat: os.stat_result = None,
+    ) -> Listing:
+        """Return cached directory listing or list the directory if it has changed.
+
+        stat of the directory can be passed in, if the caller has it already.
+        """
+        key = os.path.abspath(path)
+        if stat is None:
+            try:
+                stat = os.stat(path)
+            except OSError as err:
+                logging.debug(f"Can't stat directory: {path} -> {err}")
+                return list_directory(path)
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT mtime_ns, inode, dirs, files, descend FROM listings "
+                "WHERE path = ?",
+                (key,),
+            ).fetchone()
+            if row and row[0] == stat.st_mtime_ns and row[1] == stat.st_ino:
+                self.hits += 1
+                return json.loads(row[2]), json.loads(row[3]), json.loads(row[4])
+            self.misses += 1
+
+        dirs, files, descend = list_directory(path)
+        if time.time() - stat.st_mtime < RACY_MTIME_WINDOW:
+            logging.debug(f"Not caching recently modified directory: {path}")
+            return dirs, files, descend
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    stat.st_mtime_ns,
+                    stat.st_ino,
+                    json.dumps(dirs),
+                    json.dumps(files),
+                    json.dumps(descend),
+                ),
+            )
+        return dirs, files, descend
+
+    def _file_data(self, table: str, path: str, stat: os.stat_result) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT size, mtime_ns, data FROM {table} WHERE path = ?",
+                (os.path.abspath(path),),
+            ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return json.loads(row[2])
+        return None
+
+    def _store_file_data(self, table: str, path: str, stat: os.stat_result, data: dict):
+        if time.time() - stat.st_mtime < RACY_MTIME_WINDOW:
+            logging.debug(f"Not caching data of recently modified file: {path}")
+            return
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?)",
+                (
+                    os.path.abspath(path),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    json.dumps(data),
+                ),
+            )
+
+    def cue(self, path: str, stat: os.stat_result) -> Optional[dict]:
+        """Return cached data of a parsed Cue Sheet unless the file has changed."""
+        return self._file_data("cues", path, stat)
+
+    def store_cue(self, path: str, stat: os.stat_result, data: dict):
+        self._store_file_data("cues", path, stat, data)
+
+    def art_hash(self, path: str, stat: os.stat_result) -> Optional[dict]:
+        """Return cached perceptual hash of an image unless the file has changed."""
+        return self._file_data("art_hashes", path, stat)
+
+    def store_art_hash(self, path: str, stat: os.stat_result, data: dict):
+        self._store_file_data("art_hashes", path, stat, data)
+
+    def clear(self, directory: str):
+        """Forget cached listings of given directory and all its sub-directories."""
+        key = os.path.abspath(directory)
+        prefix = key.rstrip(os.sep) + os.sep
+        self._connection.execute(
+            "DELETE FROM listings WHERE path = ? OR substr(path, 1, ?) = ?",
+            (key, len(prefix), prefix),
+        )
+        self._connection.commit()
+
+    def prune(self, directory: str, seen: List[str]):
+        """Drop listings of directories under given path that no longer exist.
+
+        Cue Sheets & album art hashes from directories which no longer exist are
+        dropped as well.
+        """
+        key = os.path.abspath(directory)
+        prefix = key.rstrip(os.sep) + os.sep
+        cached = self._connection.execute(
+            "SELECT path FROM listings WHERE substr(path, 1, ?) = ?",
+            (len(prefix), prefix),
+        ).fetchall()
+        existing = {os.path.abspath(path) for path in seen}
+        stale = [(path,) for (path,) in cached if path not in existing]
+        if stale:
+            logging.debug(f"Removing {len(stale)} stale listings from scan cache")
+            self._connection.executemany("DELETE FROM listings WHERE path = ?", stale)
+        for table in ["cues", "art_hashes"]:
+            files = self._connection.execute(
+                f"SELECT path FROM {table} WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+            stale_files = [
+                (path,) for (path,) in files if os.path.dirname(path) not in existing
+            ]
+            if stale_files:
+                self._connection.executemany(
+                    f"DELETE FROM {table} WHERE path = ?", stale_files
+                )
+
+    def save(self):
+        self._connection.commit()
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+    def summary(self) -> Optional[str]:
+        total = self.hits + self.misses
+        if not total:
+            return None
+        return (
+            f"Scan cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hits * 100 // total}% of {total} directories reused)"
+        )
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Progress of long runs, so they can be resumed where they were left off.
+
+Every completed step is recorded in a state file per album, i.e. per top-level
+sub-directory of the library, whether albums are processed one by one (see
+teeb.albums) or all at once. The library directory itself is recorded separately,
+for its own files & names of its albums. The file is replaced atomically after each
+step, so it survives the user quitting as well as teeb being killed.
+
+Together with the steps, a fingerprint of the album is stored: names of all its
+directories & files and mtimes of its directories, as recorded by the library index.
+With --resume, steps recorded for an album are skipped only if its fingerprint
+hasn't changed since, so only albums which were changed by something else than teeb
+are organised again. Fingerprints are refreshed when teeb exits, also when it's
+stopped by a signal, so changes made by an interrupted step don't invalidate the
+steps completed before it.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+
+from teeb.find import walk
+from teeb.index import LibraryIndex
+from teeb.journal import default_state_dir
+
+# Step recorded once all steps are done in an album or library
+FINISHED = "finished"
+
+
+def checkpoint_dir() -> str:
+    return os.path.join(default_state_dir(), "checkpoints")
+
+
+def checkpoint_path(directory: str) -> str:
+    """Return path of the state file of a library, one per library directory."""
+    key = hashlib.sha1(os.path.abspath(directory).encode("utf-8")).hexdigest()
+    return os.path.join(checkpoint_dir(), f"{key}.json")
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError as err:
+        logging.debug(f"Can't stat {path}: {err}")
+        return None
+
+
+def fingerprint(
+    directory: str, *, index: LibraryIndex = None, recursive: bool = True
+) -> str:
+    """Return digest of names of all entries & mtimes of directories in a directory.
+
+    With an index, mtimes recorded by its scan are used instead of stat'ing every
+    directory. Without recursion only the directory itself is taken into account.
+    Trash directories are left out, as teeb itself might create them.
+    """
+    lines = []
+    for sub_dir, dirs, files in walk(directory, index):
+        dirs[:] = [name for name in dirs if not name.startswith(".Trash")]
+        mtime = _mtime(sub_dir) if index is None else index.mtime(sub_dir)
+        relative = os.path.relpath(sub_dir, directory)
+        lines.append(json.dumps([relative, mtime, sorted(dirs), sorted(files)]))
+        if not recursive:
+            dirs[:] = []
+    digest = hashlib.sha1()
+    for line in sorted(lines):
+        digest.update(line.encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Steps completed in a library & its albums, saved after every step."""
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        index: LibraryIndex = None,
+        path: str = None,
+        resume: bool = False,
+    ):
+        """Start recording progress, continuing the last one if resume is True."""
+        self.directory = os.path.abspath(directory)
+        self.index = index
+        self.path = path or checkpoint_path(directory)
+        self._scopes: Dict[str, dict] = self._load() if resume else {}
+        self._verified: Set[str] = set()
+        # Albums processed concurrently complete their steps at the same time
+        self._lock = threading.RLock()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            logging.warning(f"Ignoring unreadable checkpoint {self.path}: {err}")
+            return {}
+        if data.get("directory") != self.directory:
+            return {}
+        return data.get("scopes", {})
+
+    def _fingerprint(self, record: dict) -> str:
+        return fingerprint(
+            record["path"], index=self.index, recursive=record.get("recursive", True)
+        )
+
+    def _record(self, scope: str) -> Optional[dict]:
+        """Return steps recorded for a scope, if it hasn't changed since."""
+        key = os.path.abspath(scope)
+        with self._lock:
+            record = self._scopes.get(key)
+            if record is None or key in self._verified:
+                return record
+            self._verified.add(key)
+            record["path"] = scope
+            if record.get("fingerprint") != self._fingerprint(record):
+                print(f"{scope} has changed since it was checkpointed, starting over")
+                del self._scopes[key]
+                return None
+            return record
+
+    def done(self, scope: str, step: str) -> bool:
+        """Tell if a step was completed in an album or library which is unchanged."""
+        record = self._record(scope)
+        return record is not None and step in record["steps"]
+
+    def pending(
+        self, directory: str, albums: List[str], step: str
+    ) -> Optional[List[str]]:
+        """Return albums of a library in which a step is still to be done.
+
+        None means that it's to be done in the whole library, as it wasn't completed
+        in the library directory itself. Albums with all steps done are left out.
+        """
+        if not self.done(directory, step):
+            return None
+        return [
+            album
+            for album in albums
+            if not (self.done(album, step) or self.done(album, FINISHED))
+        ]
+
+    def _mark(self, scope: str, step: str, *, recursive: bool = True):
+        key = os.path.abspath(scope)
+        record = self._scopes.get(key)
+        if record is None or record.get("recursive", True) != recursive:
+            record = self._scopes[key] = {
+                "path": scope,
+                "steps": [],
+                "recursive": recursive,
+            }
+        if step not in record["steps"]:
+            record["steps"].append(step)
+        record["path"] = scope
+        record["fingerprint"] = self._fingerprint(record)
+        self._verified.add(key)
+
+    def complete(self, scope: str, step: str):
+        """Record a step completed in an album & save the checkpoint."""
+        with self._lock:
+            self._mark(scope, step)
+            self.save()
+
+    def complete_library(self, directory: str, albums: List[str], step: str):
+        """Record a step completed in all albums of a library & save the checkpoint."""
+        with self._lock:
+            for album in albums:
+                self._mark(album, step)
+            self._mark(directory, step, recursive=False)
+            self.save()
+
+    def save(self):
+        """Replace the state file atomically."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(
+                    {"directory": self.directory, "scopes": self._scopes},
+                    file,
+                    indent=2,
+                )
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+
+    def close(self):
+        """Refresh fingerprints of albums changed by an interrupted step & save."""
+        with self._lock:
+            for key in self._verified:
+                record = self._scopes.get(key)
+                if record is not None and FINISHED not in record["steps"]:
+                    record["fingerprint"] = self._fingerprint(record)
+            self.save()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Album art conversion to jpg.
+
+Large scans are converted in a pool of worker processes. Each worker gets its own
+ImageMagick resource limits, so a few 600 dpi booklet scans converted at the same
+time won't exhaust all memory. ImageMagick moves pixel data to a disk cache once a
+limit is reached, which is slower, but doesn't kill the whole batch.
+
+Images larger than an optional SizeLimit are scaled down. The size of a source is
+read from its header first, so JPEG sources are decoded straight at reduced size.
+Other formats have no reduced size decoding, but their pixels stay within the
+worker's memory limit. Every conversion reports peak RSS of its process.
+"""
+import os
+import resource
+import sys
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+from typing import (
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from teeb.data_type import (
+    Conversion,
+    SizeLimit,
+)
+from teeb.trash import human_size
+
+JPG_QUALITY = 90
+# Per worker ImageMagick limits
+WORKER_MEMORY_LIMIT = 512 * 1024**2
+WORKER_THREADS = 1
+
+Result = TypeVar("Result")
+
+
+def jpg_path(path: str) -> str:
+    """Return the path of a jpg file that given album art file will be converted to."""
+    return path[: len(path) - len(Path(path).suffix)] + ".jpg"
+
+
+def peak_rss() -> int:
+    """Return peak resident memory of current process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # It's in bytes on macOS & in KiB everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def to_jpg(
+    path: str, new_path: str, *, size_limit: SizeLimit = None
+) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """Convert an image to jpg, scaled down to fit in the size limit.
+
+    Returns width & height of the source image & of the converted one.
+    """
+    # Wand loads ImageMagick library on import, which isn't needed unless teeb
+    # actually converts something, e.g. when it's only asked to make a plan.
+    from wand.image import Image
+
+    # Only the first frame of multi-page files, e.g. a TIFF with a thumbnail
+    frame = f"{path}[0]"
+    with Image.ping(filename=frame) as header:
+        original_size = header.width, header.height
+    size = original_size
+    if size_limit is not None:
+        size = size_limit.fit(*original_size)
+
+    with Image() as image:
+        if size != original_size:
+            # JPEG is decoded with DCT scaling at 1/2, 1/4 or 1/8 of its size
+            image.options["jpeg:size"] = f"{size[0]}x{size[1]}"
+        image.read(filename=frame)
+        if image.size != size:
+            image.resize(*size)
+        image.compression_quality = JPG_QUALITY
+        image.save(filename=new_path)
+    return original_size, size
+
+
+def set_resource_limits(*, memory: int = WORKER_MEMORY_LIMIT, threads: int = None):
+    """Limit memory & number of threads ImageMagick can use in current process."""
+    from wand.resource import limits
+
+    limits["memory"] = memory
+    limits["map"] = memory * 2
+    if threads:
+        limits["thread"] = threads
+
+
+def _init_worker(memory_limit: int):
+    set_resource_limits(memory=memory_limit, threads=WORKER_THREADS)
+
+
+def _run_alone(
+    function: Callable[[str], Result],
+    path: str,
+    memory_limit: int,
+    failed: Callable[[str, str], Result],
+) -> Result:
+    """Run a single call in a worker process of its own."""
+    with ProcessPoolExecutor(
+        max_workers=1, initializer=_init_worker, initargs=(memory_limit,)
+    ) as executor:
+        try:
+            return executor.submit(function, path).result()
+        except BrokenProcessPool as err:
+            return failed(path, f"{err}")
+
+
+def run_in_workers(
+    function: Callable[[str], Result],
+    paths: List[str],
+    *,
+    jobs: int,
+    memory_limit: int,
+    failed: Callable[[str, str], Result],
+) -> Iterator[Result]:
+    """Call a function with every path in a pool of processes.
+
+    Results are generated in the order in which calls complete.
+    When a worker dies, e.g. it's killed by the OOM killer, the whole pool breaks
+    & every call it hasn't finished yet fails. These calls are retried, each in a
+    worker process of its own, so only the file which kills its worker again is
+    reported with failed(path, error) & the rest of the batch still gets done.
+    """
+    if not paths:
+        return
+    # ImageMagick would start a thread per core in every worker, so with one worker
+    # per core each worker should do with a single thread.
+    unfinished = []
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(jobs, len(paths))),
+        initializer=_init_worker,
+        initargs=(memory_limit,),
+    ) as executor:
+        futures = {executor.submit(function, path): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                unfinished.append(futures[future])
+    if not unfinished:
+        return
+    retry = partial(_run_alone, function, memory_limit=memory_limit, failed=failed)
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(unfinished)))) as executor:
+        yield from executor.map(retry, unfinished)
+
+
+def _failed_conversion(path: str, error: str) -> Conversion:
+    return Conversion(source=path, target=jpg_path(path), error=error)
+
+
+def _convert(path: str, size_limit: Optional[SizeLimit] = None) -> Conversion:
+    """Convert a single file and report any error instead of raising it."""
+    conversion = Conversion(source=path, target=jpg_path(path), worker=os.getpid())
+    try:
+        conversion.original_size, conversion.size = to_jpg(
+            path, conversion.target, size_limit=size_limit
+        )
+    except Exception as err:  # Wand raises its own exceptions for broken images
+        conversion.error = f"{err}"
+    conversion.peak_rss = peak_rss()
+    return conversion
+
+
+def convert_to_jpg(
+    paths: List[str],
+    *,
+    jobs: int = None,
+    memory_limit: int = WORKER_MEMORY_LIMIT,
+    size_limit: SizeLimit = None,
+) -> Iterator[Conversion]:
+    """Convert images to jpg in a pool of processes.
+
+    Results are generated in the order in which conversions complete.
+    A file that fails to convert is reported with an error and doesn't stop others.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) == 1:
+        set_resource_limits(memory=memory_limit)
+        for path in paths:
+            yield _convert(path, size_limit)
+        return
+
+    yield from run_in_workers(
+        partial(_convert, size_limit=size_limit),
+        paths,
+        jobs=jobs,
+        memory_limit=memory_limit,
+        failed=_failed_conversion,
+    )
+
+
+def memory_summary(conversions: List[Conversion]) -> Optional[str]:
+    """Summarise peak RSS of every process that converted album art."""
+    peaks = {}
+    for conversion in conversions:
+        if conversion.peak_rss is not None:
+            peaks[conversion.worker] = max(
+                conversion.peak_rss, peaks.get(conversion.worker, 0)
+            )
+    if not peaks:
+        return None
+    return (
+        f"Peak memory of {len(peaks)} conversion workers: "
+        f"{', '.join(human_size(peak) for peak in sorted(peaks.values()))}"
+    )
@@ -8,12 +8,169 @@ Improvements:
     * auto text encoding detection with chardet
     * support Cue Sheets with multiple FILE entries
     * support extra fields: ISRC, PREGAP etc
+    * single pass tokenizer that skips malformed lines instead of raising errors
+    * tracks are compact records which look up global fields in .meta by reference
+    * chardet is used only when text is neither ASCII, UTF-8 nor UTF-16/32 with BOM
+    * tracks start at INDEX 01, or INDEX 00 without it, never at a sub-index
 """
+import codecs
 import logging
-from copy import deepcopy
+import os
+from collections.abc import MutableMapping
+from typing import (
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+)
 
 import chardet
 
+# CD audio sampling rate & number of frames per second of audio
+CD_SAMPLE_RATE = 44100
+CD_FRAMES_PER_SECOND = 75
+# Version of data returned by CueParser.to_dict(), cached data of other versions
+# is parsed again
+DATA_VERSION = 2
+
+
+def detect_encoding(data: bytes) -> str:
+    """Detect text encoding of a Cue Sheet.
+
+    Most Cue Sheets are plain ASCII or UTF-8, which is much quicker to check by
+    decoding them than with chardet's statistical analysis.
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return "UTF-8-SIG"
+    if data.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        return "UTF-32"
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "UTF-16"
+    if data.isascii():
+        return "ascii"
+    try:
+        data.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    # Only lines with non-ASCII characters tell single byte encodings apart & chardet
+    # takes time proportional to the length of its input
+    sample = b"\n".join(line for line in data.splitlines() if not line.isascii())
+    return chardet.detect(sample)["encoding"] or "utf-8"
+
+
+def timestr_to_samples(timestr: str, sample_rate: int = CD_SAMPLE_RATE) -> int:
+    """Converts `mm:ss:ff` time string into samples integer.
+
+    There are 75 frames per second of CD audio.
+    """
+    *minutes_seconds, frames = timestr.split(":")
+    if len(minutes_seconds) == 2:
+        seconds = int(minutes_seconds[0]) * 60 + int(minutes_seconds[1])
+    else:
+        seconds = 0
+        for chunk in minutes_seconds:
+            seconds = seconds * 60 + int(chunk)
+    return seconds * sample_rate + int(frames) * sample_rate // CD_FRAMES_PER_SECOND
+
+
+class CueTrack(MutableMapping):
+    """A dictionary like record with track data.
+
+    Most common fields are stored in slots & any other ones in a dictionary created
+    only when needed. Fields missing in the track, e.g. GENRE or DATE, are looked up
+    in the global CD data, except for FILE, which is always track specific.
+    """
+
+    __slots__ = (
+        "_meta",
+        "_extra",
+        "TRACK_NUM",
+        "TITLE",
+        "PERFORMER",
+        "FILE",
+        "INDEX",
+        "POS_START_SAMPLES",
+        "POS_END_SAMPLES",
+    )
+    _fields = frozenset(__slots__[2:])
+
+    def __init__(self, meta: dict, track_num: Optional[int], file: Optional[str]):
+        self._meta = meta
+        self._extra = None
+        self.TRACK_NUM = track_num
+        self.FILE = file
+
+    def _own(self, key):
+        if key in self._fields:
+            return getattr(self, key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __getitem__(self, key):
+        try:
+            return self._own(key)
+        except (AttributeError, KeyError):
+            if key == "FILE":
+                raise KeyError(key) from None
+            return self._meta[key]
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        try:
+            self._own(key)
+        except AttributeError:
+            raise KeyError(key) from None
+        if key in self._fields:
+            delattr(self, key)
+        else:
+            del self._extra[key]
+
+    def _own_keys(self) -> Iterator[str]:
+        for key in self.__slots__[2:]:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def own_items(self) -> dict:
+        """Return only track specific fields, without the ones borrowed from meta."""
+        return {key: self._own(key) for key in self._own_keys()}
+
+    def __iter__(self) -> Iterator[str]:
+        own = list(self._own_keys())
+        yield from own
+        for key in self._meta:
+            if key != "FILE" and key not in own:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"CueTrack({dict(self)})"
+
 
 class CueParser:
     """Simple Cue Sheet file parser."""
@@ -30,38 +187,24 @@ class CueParser:
         }
         self._context_tracks = []
 
-        self._current_context = self._context_global
         with open(cue_file, "rb") as file:
-            self.encoding = chardet.detect(file.read())["encoding"]
+            data = file.read()
+        self.encoding = detect_encoding(data)
         try:
-            with open(cue_file, "r", encoding=self.encoding) as f:
-                lines = f.readlines()
-        except UnicodeDecodeError:
-            raise UnicodeDecodeError(
-                "Unable to read data from .cue file. Please set correct encoding."
-            )
+            text = data.decode(self.encoding)
+        except (LookupError, UnicodeDecodeError):
+            logging.debug(f"Can't decode {cue_file} as {self.encoding}")
+            text = data.decode("utf-8", errors="replace")
 
-        for line in lines:
-            if line.strip():
-                command, args = line.strip().split(" ", 1)
-                logging.debug(f"Command `{command}`. Args: {args}")
-                method = getattr(self, f"_cmd_{command.lower()}", None)
-                if method is not None:
-                    method(args)
-                else:
-                    print(
-                        f"Unknown command `{command}`. Skipping ...",
-                    )
-
-        for idx, track_data in enumerate(self._context_tracks):
-            track_end_pos = None
-            try:
-                track_end_pos = self._context_tracks[idx + 1]["POS_START_SAMPLES"]
-            except IndexError:
-                pass
-            track_data["POS_END_SAMPLES"] = track_end_pos
-
-        unique_track_files = list(set(track["FILE"] for track in self.tracks))
+        self._parse(text)
+
+        tracks = self._context_tracks
+        for track, next_track in zip(tracks, tracks[1:]):
+            track.POS_END_SAMPLES = next_track.get("POS_START_SAMPLES")
+        if tracks:
+            tracks[-1].POS_END_SAMPLES = None
+
+        unique_track_files = list(set(track.FILE for track in tracks))
         if [self._context_global["FILE"]] != unique_track_files:
             logging.debug(
                 "Remove global FILE entry as it's different from track specific ones"
@@ -71,8 +214,69 @@ class CueParser:
             logging.debug(
                 "Remove track FILE entries as they're the same as the global one"
             )
-            for idx in range(len(self.tracks)):
-                del self.tracks[idx]["FILE"]
+            for track in tracks:
+                del track.FILE
+
+    def _parse(self, text: str):
+        """Tokenize Cue Sheet line by line.
+
+        Unknown commands and malformed lines are logged and skipped.
+        """
+        meta = self._context_global
+        context = meta
+        current_file = None
+        # Rank of the INDEX recorded as the start of the current context
+        start_rank = None
+        for line in text.splitlines():
+            command, _, args = line.strip().partition(" ")
+            if not command:
+                continue
+            command = command.upper()
+            args = args.strip()
+            if command == "TRACK":
+                num = args.split(" ", 1)[0]
+                if num.isdigit():
+                    track_num = int(num)
+                else:
+                    # Tracks are sorted by number, so a malformed one keeps its place
+                    track_num = len(self._context_tracks) + 1
+                    logging.debug(f"Malformed TRACK: `{line}`. Numbered {track_num}")
+                track = CueTrack(meta, track_num, current_file)
+                self._context_tracks.append(track)
+                context = track
+                start_rank = None
+            elif command == "INDEX":
+                parts = args.split()
+                time_str = parts[-1] if parts else ""
+                try:
+                    position = timestr_to_samples(time_str)
+                except ValueError:
+                    logging.debug(f"Malformed INDEX: `{line}`. Skipping ...")
+                    continue
+                rank = _index_rank(parts[0] if len(parts) > 1 else "01")
+                if start_rank is not None and rank >= start_rank:
+                    continue
+                start_rank = rank
+                context["INDEX"] = time_str
+                context["POS_START_SAMPLES"] = position
+            elif command == "TITLE":
+                context["ALBUM" if context is meta else "TITLE"] = _unquote(args)
+            elif command == "FILE":
+                current_file = _unquote(args.rsplit(" ", 1)[0])
+                if not context.get("FILE"):
+                    context["FILE"] = current_file
+            elif command == "REM":
+                sub_command, _, sub_args = args.partition(" ")
+                if not sub_args:
+                    logging.debug(f"Found empty: `{line}`. Skipping ...")
+                    continue
+                if sub_args.startswith('"'):
+                    sub_args = _unquote(sub_args)
+                context[sub_command.upper()] = sub_args
+            elif command in _QUOTED_COMMANDS:
+                context[command] = _unquote(args)
+            else:
+                logging.debug(f"Unknown command `{command}`. Skipping ...")
 
     @property
     def meta(self):
@@ -86,91 +290,93 @@ class CueParser:
         """
         return self._context_tracks
 
-    def _unquote(self, in_str):
-        return in_str.strip(' "')
+    def to_dict(self) -> dict:
+        """Return parsed data as a JSON serializable dictionary."""
+        return {
+            "version": DATA_VERSION,
+            "encoding": self.encoding,
+            "meta": dict(self._context_global),
+            "tracks": [track.own_items() for track in self._context_tracks],
+        }
 
-    def _timestr_to_sec(self, timestr):
-        """Converts `mm:ss:` time string into seconds integer."""
-        splitted = timestr.split(":")[:-1]
-        splitted.reverse()
-        seconds = 0
-        for i, chunk in enumerate(splitted, 0):
-            factor = pow(60, i)
-            if i == 0:
-                factor = 1
-            seconds += int(chunk) * factor
-        return seconds
-
-    def _timestr_to_samples(self, timestr):
-        """Converts `mm:ss:ff` time string into samples integer, assuming the
-        CD sampling rate of 44100Hz."""
-        seconds_factor = 44100
-        # 75 frames per second of audio
-        frames_factor = seconds_factor // 75
-        full_seconds = self._timestr_to_sec(timestr)
-        frames = int(timestr.split(":")[-1])
-        return full_seconds * seconds_factor + frames * frames_factor
-
-    def _in_global_context(self):
-        return self._current_context == self._context_global
-
-    def _cmd_rem(self, args):
+    @classmethod
+    def from_dict(cls, data: dict) -> "CueParser":
+        """Recreate parsed Cue Sheet from data returned by to_dict()."""
+        cue = cls.__new__(cls)
+        cue.encoding = data["encoding"]
+        cue._context_global = dict(data["meta"])
+        cue._context_tracks = []
+        for fields in data["tracks"]:
+            track = CueTrack(cue._context_global, None, None)
+            del track.FILE
+            for key, value in fields.items():
+                track[key] = value
+            cue._context_tracks.append(track)
+        return cue
+
+
+class CueCache:
+    """Memo of parsed Cue Sheets keyed by path, file size & mtime.
+
+    Parsed Cue Sheets can also be kept in a persistent store, like ScanCache, so
+    that subsequent runs don't have to parse unchanged files again.
+    """
+
+    def __init__(self, store=None):
+        self.hits = 0
+        self.misses = 0
+        self._store = store
+        self._parsed: Dict[Tuple[str, int, int], CueParser] = {}
+
+    def parse(self, cue_file: str) -> CueParser:
+        """Return parsed Cue Sheet, parsing it only if it has changed."""
+        path = os.path.abspath(cue_file)
         try:
-            sub_command, sub_args = args.split(" ", 1)
-        except ValueError:
-            print(f"Found empty: {args}")
-        else:
-            if sub_args.startswith('"'):
-                sub_args = self._unquote(sub_args)
-            self._current_context[sub_command.upper()] = sub_args
-
-    def _cmd_performer(self, args):
-        unquoted = self._unquote(args)
-        self._current_context["PERFORMER"] = unquoted
-
-    def _cmd_title(self, args):
-        unquoted = self._unquote(args)
-        if self._in_global_context():
-            self._current_context["ALBUM"] = unquoted
-        else:
-            self._current_context["TITLE"] = unquoted
-
-    def _cmd_isrc(self, args):
-        unquoted = self._unquote(args)
-        self._current_context["ISRC"] = unquoted
-
-    def _cmd_comment(self, args):
-        unquoted = self._unquote(args)
-        self._current_context["COMMENT"] = unquoted
-
-    def _cmd_catalog(self, args):
-        unquoted = self._unquote(args)
-        self._current_context["CATALOG"] = unquoted
-
-    def _cmd_flags(self, args):
-        unquoted = self._unquote(args)
-        self._current_context["FLAGS"] = unquoted
-
-    def _cmd_pregap(self, args):
-        unquoted = self._unquote(args)
-        self._current_context["PREGAP"] = unquoted
-
-    def _cmd_file(self, args):
-        filename = self._unquote(args.rsplit(" ", 1)[0])
-        self._current_file_context = filename
-        if not self._current_context["FILE"]:
-            self._current_context["FILE"] = filename
-
-    def _cmd_index(self, args):
-        time_str = args.split()[1]
-        self._current_context["INDEX"] = time_str
-        self._current_context["POS_START_SAMPLES"] = self._timestr_to_samples(time_str)
-
-    def _cmd_track(self, args):
-        num, _ = args.split()
-        new_track_context = deepcopy(self._context_global)
-        self._context_tracks.append(new_track_context)
-        self._current_context = new_track_context
-        self._current_context["TRACK_NUM"] = int(num)
-        if self._current_context["FILE"] != self._current_file_context:
-            self._current_context["FILE"] = self._current_file_context
+            stat = os.stat(path)
+        except OSError as err:
+            logging.debug(f"Can't stat Cue Sheet: {cue_file} -> {err}")
+            return CueParser(cue_file)
+
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        cue = self._parsed.get(key)
+        if cue is None and self._store is not None:
+            data = self._store.cue(path, stat)
+            if data is not None and data.get("version") == DATA_VERSION:
+                cue = self._parsed[key] = CueParser.from_dict(data)
+        if cue is not None:
+            self.hits += 1
+            return cue
+
+        self.misses += 1
+        cue = self._parsed[key] = CueParser(cue_file)
+        if self._store is not None:
+            self._store.store_cue(path, stat, cue.to_dict())
+        return cue
+
+    def summary(self) -> Optional[str]:
+        total = self.hits + self.misses
+        if not total:
+            return None
+        return f"Cue cache: {self.hits} hits, {self.misses} Cue Sheets parsed"
+
+
+# Commands with a single, optionally quoted, argument stored as is
+_QUOTED_COMMANDS = frozenset(
+    ["PERFORMER", "SONGWRITER", "ISRC", "COMMENT", "CATALOG", "FLAGS", "PREGAP"]
+)
+
+
+def _index_rank(number: str) -> int:
+    """Rank an INDEX by how well it marks the start of a track, lower is better.
+
+    A track starts at INDEX 01. INDEX 00 marks the start of its pregap, so it's used
+    only when there's no INDEX 01. INDEX 02 & later ones are sub-indexes within
+    the track.
+    """
+    if number.isdigit() and int(number) <= 1:
+        return 1 - int(number)
+    return 2
+
+
+def _unquote(in_str: str) -> str:
+    return in_str.strip(' "')
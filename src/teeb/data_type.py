@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
-from dataclasses import dataclass
-from typing import List
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
 
 
 @dataclass
@@ -8,3 +16,226 @@ class CuedAlbum:
     dir: str
     cues: List[str]
     audio_files: List[str]
+
+
+@dataclass
+class Operation:
+    """A single planned change to the library.
+
+    action: one of delete, trash, rename, convert, move or split
+    source: path of a file or a directory to act on
+    target: new path for rename, convert & move operations
+    related: other files trashed with a successfully split CUE sheet
+    size & mtime_ns: stat of the source file when the plan was made
+    related_stats: [size, mtime_ns] of each related file when the plan was made
+    """
+
+    step: str
+    action: str
+    source: str
+    target: Optional[str] = None
+    related: List[str] = field(default_factory=list)
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+    related_stats: List[Optional[List[int]]] = field(default_factory=list)
+
+
+@dataclass
+class SizeLimit:
+    """Maximum size of converted album art, larger images are scaled down.
+
+    max_dimension: maximum width & height in pixels
+    max_megapixels: maximum number of pixels in millions
+    """
+
+    max_dimension: Optional[int] = None
+    max_megapixels: Optional[float] = None
+
+    def fit(self, width: int, height: int) -> Tuple[int, int]:
+        """Return the largest size within the limit with the same aspect ratio."""
+        scale = 1.0
+        if self.max_dimension:
+            scale = min(scale, self.max_dimension / max(width, height))
+        if self.max_megapixels:
+            scale = min(
+                scale, (self.max_megapixels * 10**6 / (width * height)) ** 0.5
+            )
+        if scale >= 1:
+            return width, height
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+@dataclass
+class Conversion:
+    """Result of album art conversion.
+
+    original_size & size: width & height of the source image & the converted one
+    peak_rss: peak resident memory of the process which converted it in bytes
+    worker: ID of the process which converted it
+    """
+
+    source: str
+    target: str
+    error: Optional[str] = None
+    original_size: Optional[Tuple[int, int]] = None
+    size: Optional[Tuple[int, int]] = None
+    peak_rss: Optional[int] = None
+    worker: Optional[int] = None
+
+
+@dataclass
+class Optimisation:
+    """Result of re-encoding a jpg file.
+
+    original_size & size: file size before & after re-encoding in bytes
+    quality: JPEG quality chosen by the search
+    ssim: structural similarity to the original, if it was measured
+    encodes: number of times the image was encoded to find the quality
+    temporary_path: re-encoded file waiting to replace the original
+    """
+
+    path: str
+    original_size: int = 0
+    size: int = 0
+    quality: Optional[int] = None
+    ssim: Optional[float] = None
+    encodes: int = 0
+    temporary_path: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def saved(self) -> int:
+        return self.original_size - self.size if self.size else 0
+
+
+@dataclass
+class SplitJob:
+    """A single run of a CUE splitter."""
+
+    cue_path: str
+    argv: List[str]
+    returncode: Optional[int] = None
+    error: Optional[str] = None
+    log_path: Optional[str] = None
+    duration: float = 0.0
+
+    @property
+    def succeeded(self) -> bool:
+        return self.returncode == 0 and self.error is None
+
+
+@dataclass
+class WavFormat:
+    """Audio format & location of PCM data in a WAV file.
+
+    fmt_chunk: raw body of the "fmt " chunk, copied as is to split tracks
+    block_align: size of a single sample frame (all channels) in bytes
+    data_offset: position of the first byte of PCM data in the file
+    data_size: size of PCM data in bytes, rounded down to whole sample frames
+    """
+
+    fmt_chunk: bytes
+    sample_rate: int
+    channels: int
+    block_align: int
+    data_offset: int
+    data_size: int
+
+
+@dataclass
+class JournalEntry:
+    """A file operation recorded in a run journal.
+
+    done: operation was confirmed as made
+    error: operation failed with this error
+    trashed: location of a trashed file in trash bin
+    copied: how a moved file was copied to another file system
+    """
+
+    sequence: int
+    action: str
+    source: str
+    target: Optional[str] = None
+    done: bool = False
+    error: Optional[str] = None
+    trashed: Optional[str] = None
+    copied: Optional[str] = None
+
+
+@dataclass
+class DuplicateGroup:
+    """Files with identical content.
+
+    digest: hex digest of their content
+    """
+
+    size: int
+    digest: str
+    paths: List[str]
+
+    @property
+    def reclaimable(self) -> int:
+        """Bytes freed by keeping just one of the files."""
+        return self.size * (len(self.paths) - 1)
+
+
+@dataclass
+class ArtHash:
+    """Perceptual hash of an image.
+
+    dhash: 64 bit difference hash of the image shrunk to 9x8 grey pixels
+    width & height: size of the image in pixels
+    size: size of the file in bytes
+    """
+
+    path: str
+    dhash: int
+    width: int
+    height: int
+    size: int
+
+
+@dataclass
+class ArtCluster:
+    """Visually identical images, the best one is kept & others are redundant."""
+
+    keep: str
+    redundant: List[str]
+
+
+@dataclass
+class Rename:
+    """A planned rename of a file or a directory.
+
+    rules: names of normalisation rules which changed the name
+    """
+
+    source: str
+    target: str
+    is_dir: bool = False
+    rules: List[str] = field(default_factory=list)
+
+
+@dataclass
+class RenamePlan:
+    """Renames ordered bottom-up & conflicting entries that won't be renamed.
+
+    conflicts: maps a target path to all paths that would end up with it
+    """
+
+    renames: List[Rename] = field(default_factory=list)
+    conflicts: Dict[str, List[str]] = field(default_factory=dict)
+
+
+@dataclass
+class ReviewItem:
+    """A finding shown on the review screen.
+
+    label: text of the item, which search & filter match against
+    choices: alternatives the user picks from, e.g. suggested new names
+    value: anything the caller needs to act on the item, e.g. its path
+    """
+
+    label: str
+    choices: List[str] = field(default_factory=list)
+    value: object = None
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Find files with identical content.
+
+Candidates are narrowed down in three stages, so most files are never read at all:
+
+1. files are grouped by exact size, which only needs a stat() call,
+2. files of the same size are grouped by a hash of their first & last 64 KiB,
+3. only files which are still alike are hashed in full.
+
+Files are read with pread() & mmap and hashed in a thread pool, hashlib releases the
+GIL while hashing, so reads & hashing of different files overlap.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from teeb.data_type import DuplicateGroup
+from teeb.find import walk
+from teeb.index import LibraryIndex
+from teeb.trash import human_size
+
+PARTIAL_SIZE = 64 * 1024
+DEFAULT_WORKERS = 8
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=20)
+
+
+def _partial_digest(path: str, size: int) -> bytes:
+    """Hash first & last PARTIAL_SIZE bytes, i.e. the whole content of small files."""
+    digest = _new_hash()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if size <= 2 * PARTIAL_SIZE:
+            digest.update(os.pread(fd, size, 0))
+        else:
+            digest.update(os.pread(fd, PARTIAL_SIZE, 0))
+            digest.update(os.pread(fd, PARTIAL_SIZE, size - PARTIAL_SIZE))
+    finally:
+        os.close(fd)
+    return digest.digest()
+
+
+def _full_digest(path: str, size: int) -> bytes:
+    digest = _new_hash()
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            digest.update(data)
+    return digest.digest()
+
+
+def _split(
+    groups: List[Tuple[int, List[str]]],
+    digest: Callable[[str, int], bytes],
+    executor: ThreadPoolExecutor,
+) -> List[Tuple[int, bytes, List[str]]]:
+    """Split groups of files of the same size by digest & drop unique files."""
+    jobs = [
+        (size, path, executor.submit(digest, path, size))
+        for size, paths in groups
+        for path in paths
+    ]
+    by_digest: Dict[Tuple[int, bytes], List[str]] = {}
+    for size, path, job in jobs:
+        try:
+            key = (size, job.result())
+        # Removed or unreadable since it was listed, mmap raises ValueError for a
+        # file which has become empty
+        except (OSError, ValueError) as err:
+            logging.debug(f"Can't hash {path}: {err}")
+            continue
+        by_digest.setdefault(key, []).append(path)
+    return [
+        (size, key, paths) for (size, key), paths in by_digest.items() if len(paths) > 1
+    ]
+
+
+def duplicate_groups(
+    paths: Iterable[str], *, workers: int = DEFAULT_WORKERS
+) -> List[DuplicateGroup]:
+    """Group files with identical content, files without a duplicate are left out."""
+    by_size: Dict[int, List[str]] = {}
+    for path in dict.fromkeys(paths):
+        try:
+            path_stat = os.lstat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(path_stat.st_mode):
+            by_size.setdefault(path_stat.st_size, []).append(path)
+    candidates = [(size, group) for size, group in by_size.items() if len(group) > 1]
+    if not candidates:
+        return []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        partial = _split(candidates, _partial_digest, executor)
+        # Partial digest of small files already covers their whole content
+        duplicates = [group for group in partial if group[0] <= 2 * PARTIAL_SIZE]
+        duplicates += _split(
+            [(size, paths) for size, _, paths in partial if size > 2 * PARTIAL_SIZE],
+            _full_digest,
+            executor,
+        )
+    return sorted(
+        (
+            DuplicateGroup(size=size, digest=digest.hex(), paths=sorted(paths))
+            for size, digest, paths in duplicates
+        ),
+        key=lambda group: (-group.reclaimable, group.paths),
+    )
+
+
+def identical_pairs(
+    pairs: Iterable[Tuple[str, str]], *, workers: int = DEFAULT_WORKERS
+) -> Set[Tuple[str, str]]:
+    """Return those pairs of files which have identical content."""
+    pairs = list(pairs)
+    group_of: Dict[str, int] = {}
+    paths = [path for pair in pairs for path in pair]
+    for number, group in enumerate(duplicate_groups(paths, workers=workers)):
+        for path in group.paths:
+            group_of[path] = number
+    return {
+        (first, second)
+        for first, second in pairs
+        if first in group_of and group_of[first] == group_of.get(second)
+    }
+
+
+def same_content(first: str, second: str) -> bool:
+    return (first, second) in identical_pairs([(first, second)], workers=1)
+
+
+def find_duplicates(
+    directory: str, *, index: LibraryIndex = None, workers: int = DEFAULT_WORKERS
+) -> List[DuplicateGroup]:
+    """Find all files with identical content in a library."""
+    paths = (
+        os.path.join(path, name)
+        for path, _, files in walk(directory, index)
+        for name in files
+    )
+    return duplicate_groups(paths, workers=workers)
+
+
+def summary(groups: List[DuplicateGroup]) -> Optional[str]:
+    if not groups:
+        return None
+    files = sum(len(group.paths) for group in groups)
+    reclaimable = sum(group.reclaimable for group in groups)
+    return (
+        f"Found {files} files in {len(groups)} groups of identical files, "
+        f"{human_size(reclaimable)} can be reclaimed by removing duplicates"
+    )
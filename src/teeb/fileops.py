@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""File operations that keep the library index in sync with the file system.
+
+All operations are recorded in the journal of the current run, if there's one.
+"""
+import errno
+import logging
+import os
+from typing import (
+    Iterable,
+    List,
+    Optional,
+)
+
+from teeb import journal
+from teeb.index import LibraryIndex
+from teeb.transfer import move_across_devices
+from teeb.trash import (
+    default_trash,
+    trash_info_path,
+)
+
+
+def rename(old_path: str, new_path: str, index: LibraryIndex = None):
+    """Rename a file or a directory and update the library index."""
+    with journal.operation("rename", old_path, new_path):
+        os.rename(old_path, new_path)
+    if index is not None:
+        index.rename(old_path, new_path)
+
+
+def move(old_path: str, new_path: str, index: LibraryIndex = None):
+    """Move a file or a directory, also to another file system.
+
+    Unlike rename, it never replaces an existing file.
+    """
+    with journal.operation("move", old_path, new_path) as details:
+        if os.path.lexists(new_path):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), new_path)
+        try:
+            os.rename(old_path, new_path)
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            details["copied"] = move_across_devices(old_path, new_path) or "tree"
+            logging.debug(f"Copied {old_path} to {new_path}: {details['copied']}")
+    if index is not None:
+        index.rename(old_path, new_path)
+
+
+def remove(path: str, index: LibraryIndex = None):
+    """Delete a file and remove it from the library index."""
+    with journal.operation("remove", path):
+        os.remove(path)
+    if index is not None:
+        index.remove(path)
+
+
+def trash(path: str, index: LibraryIndex = None) -> Optional[str]:
+    """Move a file or a directory to trash bin and remove it from the library index.
+
+    Returns its path in trash bin or None if it's not known.
+    """
+    with journal.operation("trash", path) as details:
+        details["trashed"] = default_trash().trash(path)
+    if index is not None:
+        index.remove(path)
+    return details["trashed"]
+
+
+def trash_many(paths: Iterable[str], index: LibraryIndex = None) -> List[str]:
+    """Move files & directories to trash bin and return errors of failed ones."""
+    errors = []
+    for path in paths:
+        try:
+            trash(path, index)
+        except OSError as err:
+            errors.append(f"{err}")
+    return errors
+
+
+def restore(trashed: str, path: str, index: LibraryIndex = None):
+    """Move a file or a directory back from trash bin to where it was."""
+    rename(trashed, path, index)
+    try:
+        os.remove(trash_info_path(trashed))
+    except FileNotFoundError:
+        pass
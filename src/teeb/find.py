@@ -4,6 +4,7 @@ import os
 from pathlib import Path
 from typing import (
     Dict,
+    Iterator,
     List,
     Optional,
     Tuple,
@@ -12,35 +13,69 @@ from typing import (
 import teeb.data_type
 import teeb.default
 import teeb.suggest
+from teeb.index import LibraryIndex
 
 
-def extra_files(directory: str) -> List[str]:
-    """Find extra files, like .accurip .m3u"""
-    result = []
-    for sub_dir, directories, files in os.walk(directory):
+def walk(directory: str, index: LibraryIndex = None):
+    """Walk the directory tree with os.walk() or query a prebuilt library index."""
+    if index is not None:
+        return index.walk(directory)
+    return os.walk(directory)
+
+
+def _listdir(path: str, index: Optional[LibraryIndex]) -> List[str]:
+    if index is not None:
+        return index.listdir(path)
+    return os.listdir(path)
+
+
+def _isdir(path: str, index: Optional[LibraryIndex]) -> bool:
+    if index is not None:
+        return index.isdir(path)
+    return os.path.isdir(path)
+
+
+def _isfile(path: str, index: Optional[LibraryIndex]) -> bool:
+    if index is not None:
+        return index.isfile(path)
+    return os.path.isfile(path)
+
+
+def iter_extra_files(directory: str, *, index: LibraryIndex = None) -> Iterator[str]:
+    """Generate extra files, like .accurip .m3u, as soon as they're found."""
+    for sub_dir, directories, files in walk(directory, index):
         for filename in files:
             extension = Path(filename).suffix[1:]
             if extension.lower() in teeb.default.ignored_extensions:
-                filepath = os.path.join(sub_dir, filename)
-                result.append(filepath)
-    return result
+                yield os.path.join(sub_dir, filename)
 
 
-def extra_text_files(directory: str) -> List[str]:
-    """Find extra text files, like: dr_analysis.txt foo_dr.txt"""
-    result = []
-    for sub_dir, directories, files in os.walk(directory):
+def extra_files(directory: str, *, index: LibraryIndex = None) -> List[str]:
+    """Find extra files, like .accurip .m3u"""
+    return list(iter_extra_files(directory, index=index))
+
+
+def iter_extra_text_files(
+    directory: str, *, index: LibraryIndex = None
+) -> Iterator[str]:
+    """Generate extra text files, like: dr_analysis.txt, as soon as they're found."""
+    for sub_dir, directories, files in walk(directory, index):
         for filename in files:
             if filename.lower() in teeb.default.redundant_text_files:
-                filepath = os.path.join(sub_dir, filename)
-                result.append(filepath)
-    return result
+                yield os.path.join(sub_dir, filename)
 
 
-def files_with_upper_case_extension(directory: str) -> List[str]:
+def extra_text_files(directory: str, *, index: LibraryIndex = None) -> List[str]:
+    """Find extra text files, like: dr_analysis.txt foo_dr.txt"""
+    return list(iter_extra_text_files(directory, index=index))
+
+
+def files_with_upper_case_extension(
+    directory: str, *, index: LibraryIndex = None
+) -> List[str]:
     """Find files with mixed or uppercase extension, e.g. .Flac .APE .Jpeg .NFO"""
     result = []
-    for sub_dir, directories, files in os.walk(directory):
+    for sub_dir, directories, files in walk(directory, index):
         for filename in files:
             extension = Path(filename).suffix[1:]
             if extension.lower() != extension:
@@ -49,10 +84,12 @@ def files_with_upper_case_extension(directory: str) -> List[str]:
     return result
 
 
-def non_audio_files_with_upper_case_characters(directory: str) -> List[str]:
+def non_audio_files_with_upper_case_characters(
+    directory: str, *, index: LibraryIndex = None
+) -> List[str]:
     """Find non-audio files with mixed or upper case extension, e.g. .Jpeg"""
     result = []
-    for sub_dir, directories, files in os.walk(directory):
+    for sub_dir, directories, files in walk(directory, index):
         for filename in files:
             extension = Path(filename).suffix[1:]
             not_an_audio_file = extension.lower() not in teeb.default.audio_extentions
@@ -63,10 +100,12 @@ def non_audio_files_with_upper_case_characters(directory: str) -> List[str]:
     return result
 
 
-def files_to_change_extension(directory: str) -> List[str]:
+def files_to_change_extension(
+    directory: str, *, index: LibraryIndex = None
+) -> List[str]:
     """Find files which need their extension changed, e.g. from jpeg to jpg"""
     result = []
-    for sub_dir, directories, files in os.walk(directory):
+    for sub_dir, directories, files in walk(directory, index):
         for filename in files:
             extension = Path(filename).suffix[1:]
             if extension.lower() in teeb.default.change_extension_mapping.keys():
@@ -75,10 +114,12 @@ def files_to_change_extension(directory: str) -> List[str]:
     return result
 
 
-def directory_and_file_paths_with_spaces(directory: str) -> List[str]:
+def directory_and_file_paths_with_spaces(
+    directory: str, *, index: LibraryIndex = None
+) -> List[str]:
     """Find directory and file paths containing spaces."""
     result = []
-    for sub_dir, directories, files in os.walk(directory):
+    for sub_dir, directories, files in walk(directory, index):
         for filename in files:
             filepath = os.path.join(sub_dir, filename)
             if " " in filepath:
@@ -86,24 +127,62 @@ def directory_and_file_paths_with_spaces(directory: str) -> List[str]:
     return result
 
 
-def album_art_files_to_convert(directory: str) -> List[str]:
-    """Find album art files that should be converted to preferred type."""
-    result = []
-    for sub_dir, directories, files in os.walk(directory):
+def iter_album_art_files_to_convert(
+    directory: str, *, index: LibraryIndex = None
+) -> Iterator[str]:
+    """Generate album art files to convert, as soon as they're found."""
+    for sub_dir, directories, files in walk(directory, index):
         for filename in files:
             extension = Path(filename).suffix[1:]
             if extension.lower() in teeb.default.album_art_extentions_to_convert:
-                filepath = os.path.join(sub_dir, filename)
-                result.append(filepath)
-    return result
+                yield os.path.join(sub_dir, filename)
+
+
+def album_art_files_to_convert(
+    directory: str, *, index: LibraryIndex = None
+) -> List[str]:
+    """Find album art files that should be converted to preferred type."""
+    return list(iter_album_art_files_to_convert(directory, index=index))
+
+
+def iter_oversized_jpg_files(
+    directory: str, *, index: LibraryIndex = None, min_size: int
+) -> Iterator[str]:
+    """Generate jpg files larger than given number of bytes, as they're found.
+
+    Only files kept by their name are stat'ed, which is a round-trip per file on
+    network shares. Hidden files, e.g. AppleDouble `._cover.jpg` files left by macOS
+    or files re-encoded by an interrupted run, are never art to re-encode.
+    """
+    for sub_dir, _, files in walk(directory, index):
+        for filename in files:
+            if filename.startswith(".") or not filename.lower().endswith(
+                (".jpg", ".jpeg")
+            ):
+                continue
+            filepath = os.path.join(sub_dir, filename)
+            try:
+                if os.lstat(filepath).st_size > min_size:
+                    yield filepath
+            except OSError as err:
+                logging.debug(f"Can't stat {filepath}: {err}")
+
+
+def oversized_jpg_files(
+    directory: str, *, index: LibraryIndex = None, min_size: int
+) -> List[str]:
+    """Find jpg files larger than given number of bytes."""
+    return list(iter_oversized_jpg_files(directory, index=index, min_size=min_size))
 
 
 def album_art_jpg_files(
     directory: str,
+    *,
+    index: LibraryIndex = None,
 ) -> List[Optional[Tuple[str, Optional[List[str]]]]]:
     """Find all jpg album art that might need a file name change."""
     result = []
-    for sub_dir, _, files in os.walk(directory):
+    for sub_dir, _, files in walk(directory, index):
         for file in files:
             extension = Path(file).suffix[1:]
             filename = Path(file).name
@@ -114,10 +193,24 @@ def album_art_jpg_files(
     return result
 
 
-def cue_files_and_audio_files(directory: str) -> List[teeb.data_type.CuedAlbum]:
+def iter_album_art_jpg_suggestions(
+    directory: str, *, index: LibraryIndex = None
+) -> Iterator[Tuple[str, List[str]]]:
+    """Generate paths of jpg album art with suggested new names, as they're found."""
+    for sub_dir, _, files in walk(directory, index):
+        for file in files:
+            if Path(file).suffix[1:] == "jpg":
+                suggestions = teeb.suggest.new_art_file_name(Path(file).name)
+                if suggestions:
+                    yield os.path.join(sub_dir, file), suggestions
+
+
+def cue_files_and_audio_files(
+    directory: str, *, index: LibraryIndex = None
+) -> List[teeb.data_type.CuedAlbum]:
     """Find albums containing CUE files and audio files."""
     result = []
-    for sub_dir, _, files in os.walk(directory):
+    for sub_dir, _, files in walk(directory, index):
         cues = [f for f in files if Path(f).suffix[1:] == "cue"]
         if cues:
             audio_files = list(
@@ -134,24 +227,31 @@ def cue_files_and_audio_files(directory: str) -> List[teeb.data_type.CuedAlbum]:
     return result
 
 
-def empty_directories(directory: str) -> List[str]:
-    """Return a list of empty directories found in given directory.
-    See https://docs.python.org/3/library/os.html#os.listdir
-    """
-    result = []
-    for sub_dir, _, files in os.walk(directory):
+def iter_empty_directories(
+    directory: str, *, index: LibraryIndex = None
+) -> Iterator[str]:
+    """Generate empty directories in walk order, as soon as they're found."""
+    for sub_dir, _, files in walk(directory, index):
         if not files:
             child_directories = [
                 name
-                for name in os.listdir(sub_dir)
-                if os.path.isdir(os.path.join(sub_dir, name))
+                for name in _listdir(sub_dir, index)
+                if _isdir(os.path.join(sub_dir, name), index)
             ]
             if not child_directories:
-                result.append(sub_dir)
-    return sorted(result)
+                yield sub_dir
+
+
+def empty_directories(directory: str, *, index: LibraryIndex = None) -> List[str]:
+    """Return a list of empty directories found in given directory.
+    See https://docs.python.org/3/library/os.html#os.listdir
+    """
+    return sorted(iter_empty_directories(directory, index=index))
 
 
-def nested_album_art(directory: str) -> Dict[str, List[str]]:
+def nested_album_art(
+    directory: str, *, index: LibraryIndex = None
+) -> Dict[str, List[str]]:
     """Find nested album art directories.
 
     People organise their albums and album art in many different ways.
@@ -242,14 +342,14 @@ def nested_album_art(directory: str) -> Dict[str, List[str]]:
     """
 
     def is_not_preferred_case(path, parent, name) -> bool:
-        is_file = os.path.isfile(os.path.join(parent, name))
+        is_file = _isfile(os.path.join(parent, name), index)
         return not is_file and name != path.name
 
     result = {
         "case1": [],
         "case2": [],
     }
-    for sub_dir, _, files in os.walk(directory):
+    for sub_dir, _, files in walk(directory, index):
         art_files = [name for name in files if Path(name).suffix[1:] == "jpg"]
         if art_files:
             audio_files = list(
@@ -266,8 +366,8 @@ def nested_album_art(directory: str) -> Dict[str, List[str]]:
                 parent = path.parent
                 parent_files = [
                     name
-                    for name in os.listdir(parent)
-                    if os.path.isfile(os.path.join(parent, name))
+                    for name in _listdir(parent, index)
+                    if _isfile(os.path.join(parent, name), index)
                 ]
                 if parent_files:
                     parent_audio_files = list(
@@ -291,7 +391,7 @@ def nested_album_art(directory: str) -> Dict[str, List[str]]:
                 else:
                     parent_directories = [
                         name
-                        for name in os.listdir(parent)
+                        for name in _listdir(parent, index)
                         if is_not_preferred_case(path, parent, name)
                     ]
                     if parent_directories:
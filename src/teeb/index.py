@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""In-memory index of a music library built with a single directory traversal.
+
+Every step in teeb used to run its own `os.walk` over the whole library, which on a
+network share meant re-reading the same directory listings over and over again.
+`LibraryIndex` lists every directory once with `os.scandir` and then answers all
+`teeb.find` queries from memory. Actions that rename or delete files keep it up to
+date, so later steps see the current state of the library without another scan.
+Modification times of directories are recorded by the scan as well & only
+directories changed since then are stat'ed again.
+"""
+
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from teeb.cache import ScanCache
+
+# Directory listing: a tuple of sub-directory names and file names
+Listing = Tuple[List[str], List[str]]
+# Number of recent changes remembered to tell if a directory changed since
+CHANGE_LOG_SIZE = 10_000
+
+
+class LibraryIndex:
+    """Directory & file entries of a library, keyed by normalised directory path."""
+
+    def __init__(self, directory: str, *, cache: ScanCache = None, workers: int = 1):
+        """Index given directory.
+
+        With a scan cache only directories whose mtime has changed since the last
+        scan are listed again.
+        With more than 1 worker, sub-directories are listed concurrently by a pool
+        of threads, which hides the round-trip latency of network file systems.
+        The resulting index is the same regardless of the number of workers.
+        """
+        self.directory = directory
+        self._cache = cache
+        self._workers = max(1, workers)
+        self._listings: Dict[str, Listing] = {}
+        # mtime_ns of directories, left out for directories changed since the scan
+        self._mtimes: Dict[str, Optional[int]] = {}
+        # Incremented on every change, the log holds (generation, changed path)
+        self.generation = 0
+        self._changes: "deque[Tuple[int, str]]" = deque(maxlen=CHANGE_LOG_SIZE)
+        # Serialises updates made by albums processed concurrently
+        self._lock = threading.RLock()
+        self._scan(directory)
+        if cache is not None:
+            cache.prune(directory, list(self._listings))
+            cache.save()
+
+    def _scan(self, directory: str):
+        if self._workers > 1:
+            self._scan_concurrently(directory)
+        else:
+            pending = [directory]
+            while pending:
+                path = pending.pop()
+                dirs, files, descend, mtime = self._list_directory(path)
+                self._listings[os.path.normpath(path)] = (dirs, files)
+                self._mtimes[os.path.normpath(path)] = mtime
+                pending.extend(os.path.join(path, name) for name in reversed(descend))
+        logging.debug(f"Indexed {len(self._listings)} directories in: {directory}")
+
+    def _scan_concurrently(self, directory: str):
+        """List every sub-directory as soon as its parent has been listed.
+
+        Only the worker threads touch the file system. Listings are recorded by
+        the calling thread, so the index itself doesn't need any locking.
+        """
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            pending = {executor.submit(self._list_directory, directory): directory}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    dirs, files, descend, mtime = future.result()
+                    self._listings[os.path.normpath(path)] = (dirs, files)
+                    self._mtimes[os.path.normpath(path)] = mtime
+                    for name in descend:
+                        sub_dir = os.path.join(path, name)
+                        listing = executor.submit(self._list_directory, sub_dir)
+                        pending[listing] = sub_dir
+
+    def _list_directory(
+        self, path: str
+    ) -> Tuple[List[str], List[str], List[str], Optional[int]]:
+        """List a directory & return its listing with its mtime_ns."""
+        try:
+            stat = os.stat(path)
+        except OSError as err:
+            logging.debug(f"Can't stat directory: {path} -> {err}")
+            return (*self._list(path), None)
+        if self._cache is not None:
+            return (*self._cache.listing(path, self._list, stat=stat), stat.st_mtime_ns)
+        return (*self._list(path), stat.st_mtime_ns)
+
+    @staticmethod
+    def _list(path: str) -> Tuple[List[str], List[str], List[str]]:
+        """List directory with os.scandir.
+
+        Returns names of sub-directories, files and sub-directories to descend into.
+        Just like os.walk(), symbolic links to directories are listed as directories,
+        but aren't followed.
+        """
+        dirs, files, descend = [], [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        dirs.append(entry.name)
+                        if not entry.is_symlink():
+                            descend.append(entry.name)
+                    else:
+                        files.append(entry.name)
+        except OSError as err:
+            logging.debug(f"Can't list directory: {path} -> {err}")
+        return dirs, files, descend
+
+    def __contains__(self, path: str) -> bool:
+        return self.isdir(path) or self.isfile(path)
+
+    def __len__(self) -> int:
+        return len(self._listings)
+
+    def walk(self, top: str = None) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """Generate the same (dirpath, dirnames, filenames) tuples as os.walk().
+
+        Just like with top-down os.walk(), dirnames can be modified in-place to
+        prune or rename sub-directories before they're visited.
+        """
+        top = self.directory if top is None else top
+        pending = [top]
+        while pending:
+            path = pending.pop()
+            listing = self._listings.get(os.path.normpath(path))
+            if listing is None:
+                continue
+            dirs, files = list(listing[0]), list(listing[1])
+            yield path, dirs, files
+            pending.extend(os.path.join(path, name) for name in reversed(dirs))
+
+    def listdir(self, path: str) -> List[str]:
+        """Return names of all entries in given directory, like os.listdir()."""
+        dirs, files = self._listings.get(os.path.normpath(path), ([], []))
+        return dirs + files
+
+    def isfile(self, path: str) -> bool:
+        parent, name = os.path.split(os.path.normpath(path))
+        listing = self._listings.get(parent or ".")
+        return bool(listing) and name in listing[1]
+
+    def isdir(self, path: str) -> bool:
+        return os.path.normpath(path) in self._listings
+
+    def mtime(self, path: str) -> Optional[int]:
+        """Return mtime_ns of an indexed directory.
+
+        It's the one recorded by the scan, unless the directory was changed since.
+        """
+        key = os.path.normpath(path)
+        with self._lock:
+            mtime = self._mtimes.get(key)
+            if mtime is None and key in self._listings:
+                try:
+                    mtime = self._mtimes[key] = os.stat(path).st_mtime_ns
+                except OSError as err:
+                    logging.debug(f"Can't stat directory: {path} -> {err}")
+            return mtime
+
+    def _subtree(self, key: str) -> List[str]:
+        """Return keys of an indexed directory & all its indexed sub-directories.
+
+        Only the listings in the subtree are visited, not the whole index.
+        """
+        keys, pending = [], [key]
+        while pending:
+            path = pending.pop()
+            listing = self._listings.get(path)
+            if listing is None:
+                continue
+            keys.append(path)
+            pending.extend(os.path.join(path, name) for name in listing[0])
+        return keys
+
+    def _changed(self, *paths: str):
+        self.generation += 1
+        for path in paths:
+            key = os.path.normpath(path)
+            self._changes.append((self.generation, key))
+            # Both the entry & the directory it's in get a new mtime
+            self._mtimes.pop(key, None)
+            self._mtimes.pop(os.path.dirname(key) or ".", None)
+
+    def changed_since(self, generation: int, directory: str = None) -> bool:
+        """Tell if anything in or above given directory changed since a generation.
+
+        Without a directory, any change counts.
+        """
+        with self._lock:
+            if generation >= self.generation:
+                return False
+            if directory is None:
+                return True
+            if not self._changes or self._changes[0][0] > generation + 1:
+                return True  # Some of the changes were forgotten already
+            key = os.path.normpath(directory)
+            for changed_at, path in reversed(self._changes):
+                if changed_at <= generation:
+                    break
+                if (
+                    path == key
+                    or path.startswith(key + os.sep)
+                    or key.startswith(path + os.sep)
+                ):
+                    return True
+            return False
+
+    def refresh(self, directory: str):
+        """Re-list given directory and all its sub-directories.
+
+        Use it after an external tool (e.g. flacon) created files in the library.
+        """
+        with self._lock:
+            for sub_dir in self._subtree(os.path.normpath(directory)):
+                del self._listings[sub_dir]
+                self._mtimes.pop(sub_dir, None)
+            self._scan(directory)
+            self._changed(directory)
+            if self._cache is not None:
+                self._cache.save()
+
+    def add(self, path: str):
+        """Record a new file."""
+        with self._lock:
+            self._changed(path)
+            parent, name = os.path.split(os.path.normpath(path))
+            listing = self._listings.get(parent or ".")
+            if listing is not None and name not in listing[1]:
+                listing[1].append(name)
+
+    def remove(self, path: str):
+        """Forget a file or a directory with all its content."""
+        with self._lock:
+            self._changed(path)
+            key = os.path.normpath(path)
+            parent, name = os.path.split(key)
+            listing = self._listings.get(parent or ".")
+            if key in self._listings:
+                for sub_dir in self._subtree(key):
+                    del self._listings[sub_dir]
+                    self._mtimes.pop(sub_dir, None)
+                if listing is not None and name in listing[0]:
+                    listing[0].remove(name)
+            elif listing is not None and name in listing[1]:
+                listing[1].remove(name)
+
+    def rename(self, old: str, new: str):
+        """Move a file or a directory with all its content to a new path."""
+        with self._lock:
+            self._changed(old, new)
+            old_key, new_key = os.path.normpath(old), os.path.normpath(new)
+            old_parent, old_name = os.path.split(old_key)
+            new_parent, new_name = os.path.split(new_key)
+            old_listing = self._listings.get(old_parent or ".")
+            new_listing = self._listings.get(new_parent or ".")
+            if old_key in self._listings:
+                for key in self._subtree(old_key):
+                    moved_key = new_key + key[len(old_key) :]
+                    self._listings[moved_key] = self._listings.pop(key)
+                    self._mtimes[moved_key] = self._mtimes.pop(key, None)
+                entries = 0
+            else:
+                entries = 1
+            if old_listing is not None and old_name in old_listing[entries]:
+                old_listing[entries].remove(old_name)
+            if new_listing is not None and new_name not in new_listing[entries]:
+                new_listing[entries].append(new_name)
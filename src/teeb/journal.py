@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""Append-only journal of file operations made during a run.
+
+Every rename, move, delete & trash is recorded as an intent line before it's made
+and confirmed with another line once it has succeeded. Lines are written to the OS
+immediately, so they survive teeb being killed, but are fsync'ed in batches, as an
+fsync per operation would make renaming 100k files many times slower. On power
+loss only the last, not yet synced, batch can be lost.
+
+A journal without a "finished" line belongs to a run that was interrupted.
+Operation which was in flight at that time is settled by checking the disk, after
+which the run can either be kept as it is (rolled forward) or undone (rolled back).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from teeb.data_type import JournalEntry
+
+# Sync journal to disk after that many lines or seconds, whichever comes first
+SYNC_EVERY_LINES = 256
+SYNC_EVERY_SECONDS = 1.0
+
+# Journal of the current run, see start_run()
+_journal: Optional["Journal"] = None
+
+
+def default_state_dir() -> str:
+    """Return teeb's state directory as defined by the XDG Base Directory spec."""
+    state_home = os.environ.get("XDG_STATE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "state"
+    )
+    return os.path.join(state_home, "teeb")
+
+
+def journal_dir() -> str:
+    return os.path.join(default_state_dir(), "journal")
+
+
+def journal_path(run_id: str) -> str:
+    return os.path.join(journal_dir(), f"{run_id}.jsonl")
+
+
+def new_run_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+
+class Journal:
+    """Append-only JSON lines file with fsync batching."""
+
+    def __init__(self, path: str, header: dict):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.run_id = header["run"]
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        # Albums processed concurrently share the journal of a run
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._write(header)
+        self.sync()
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._unsynced += 1
+        if (
+            self._unsynced >= SYNC_EVERY_LINES
+            or time.monotonic() - self._last_sync >= SYNC_EVERY_SECONDS
+        ):
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def begin(self, action: str, source: str, target: str = None) -> int:
+        with self._lock:
+            self._sequence += 1
+            record = {"seq": self._sequence, "action": action, "source": source}
+            if target is not None:
+                record["target"] = target
+            self._write(record)
+            return self._sequence
+
+    def done(self, sequence: int, **details):
+        with self._lock:
+            self._write({"seq": sequence, "done": True, **details})
+
+    def failed(self, sequence: int, error: str):
+        with self._lock:
+            self._write({"seq": sequence, "error": error})
+
+    def close(self, **footer):
+        with self._lock:
+            if footer:
+                self._write(footer)
+            self.sync()
+            self._file.close()
+
+
+def start_run(directory: str, **header) -> Journal:
+    """Start journaling all file operations made with teeb.fileops."""
+    global _journal
+    run_id = new_run_id()
+    _journal = Journal(
+        journal_path(run_id),
+        {
+            "run": run_id,
+            "directory": os.path.abspath(directory),
+            "pid": os.getpid(),
+            "started": time.time(),
+            **header,
+        },
+    )
+    return _journal
+
+
+def finish_run(*, finished: bool = True):
+    """Close journal of the current run.
+
+    Journal of an unfinished run is left without a footer, so it's found by
+    interrupted_runs() & recovered next time teeb starts.
+    """
+    global _journal
+    if _journal is None:
+        return
+    if finished:
+        _journal.close(finished=time.time())
+    else:
+        _journal.close()
+    _journal = None
+
+
+@contextmanager
+def operation(action: str, source: str, target: str = None) -> Iterator[dict]:
+    """Journal an operation made in the body of the with statement.
+
+    Body can add details, e.g. location of a trashed file, to the yielded dict.
+    """
+    if _journal is None:
+        yield {}
+        return
+    details: dict = {}
+    sequence = _journal.begin(action, source, target)
+    try:
+        yield details
+    except BaseException as err:
+        _journal.failed(sequence, f"{err}")
+        raise
+    _journal.done(sequence, **details)
+
+
+def read_journal(path: str) -> Tuple[dict, List[JournalEntry], dict]:
+    """Read journal header, operations & footer.
+
+    A line that was cut short by a crash is ignored.
+    """
+    header: dict = {}
+    footer: dict = {}
+    entries = {}
+    with open(path, encoding="utf-8") as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.debug(f"Skipping corrupted journal line: {line!r}")
+                continue
+            if "run" in record:
+                header = record
+            elif "seq" in record and "action" in record:
+                entries[record["seq"]] = JournalEntry(
+                    sequence=record["seq"],
+                    action=record["action"],
+                    source=record["source"],
+                    target=record.get("target"),
+                )
+            elif "seq" in record:
+                if record["seq"] in entries:
+                    entry = entries[record["seq"]]
+                    entry.done = bool(record.get("done"))
+                    entry.error = record.get("error")
+                    entry.trashed = record.get("trashed")
+                    entry.copied = record.get("copied")
+            else:
+                footer.update(record)
+    return header, list(entries.values()), footer
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Process of another user
+        return True
+    return True
+
+
+def interrupted_runs() -> List[str]:
+    """Return paths to journals of runs that neither finished nor are running."""
+    if not os.path.isdir(journal_dir()):
+        return []
+    interrupted = []
+    for name in sorted(os.listdir(journal_dir())):
+        path = os.path.join(journal_dir(), name)
+        header, _, footer = read_journal(path)
+        if footer or not header:
+            continue
+        pid = header.get("pid")
+        if pid == os.getpid() or (pid and _is_running(pid)):
+            continue
+        interrupted.append(path)
+    return interrupted
+
+
+def settle(entry: JournalEntry) -> bool:
+    """Tell whether an operation without confirmation was made, by checking disk."""
+    if entry.done or entry.error:
+        return entry.done
+    if entry.target is not None:
+        return not os.path.lexists(entry.source) and os.path.lexists(entry.target)
+    return not os.path.lexists(entry.source)
+
+
+def _undo_entry(entry: JournalEntry) -> Optional[str]:
+    """Reverse a single operation and return a reason if that's not possible."""
+    # fileops journals operations made with it, so it can't be imported on top
+    from teeb.fileops import (
+        move,
+        rename,
+        restore,
+    )
+
+    if entry.action in ("rename", "move"):
+        current = entry.target
+    elif entry.action == "trash" and entry.trashed:
+        current = entry.trashed
+    else:
+        return f"can't undo {entry.action} of '{entry.source}'"
+    if os.path.lexists(entry.source):
+        return f"'{entry.source}' already exists"
+    if not os.path.lexists(current):
+        return f"'{current}' no longer exists"
+    try:
+        if entry.action == "trash":
+            restore(current, entry.source)
+        elif entry.action == "move":
+            move(current, entry.source)
+        else:
+            rename(current, entry.source)
+    except OSError as err:
+        return f"{err}"
+    return None
+
+
+def _append_footer(path: str, footer: dict):
+    with open(path, "a+b") as journal:
+        line = json.dumps(footer).encode() + b"\n"
+        if journal.tell():
+            journal.seek(-1, os.SEEK_END)
+            if journal.read(1) != b"\n":  # Last line was cut short by a crash
+                line = b"\n" + line
+        journal.write(line)
+        journal.flush()
+        os.fsync(journal.fileno())
+
+
+def undo(path: str) -> Tuple[int, List[str]]:
+    """Reverse all operations of a run, latest first.
+
+    Returns the number of reversed operations & a list of problems.
+    """
+    _, entries, footer = read_journal(path)
+    if "undone" in footer:
+        return 0, [f"Run was already undone by: {footer.get('undone_by')}"]
+    undone = 0
+    problems = []
+    for entry in reversed(entries):
+        if not settle(entry):
+            continue
+        problem = _undo_entry(entry)
+        if problem:
+            problems.append(problem)
+        else:
+            undone += 1
+    _append_footer(
+        path,
+        {"undone": time.time(), "undone_by": _journal.run_id if _journal else None},
+    )
+    return undone, problems
+
+
+def recover(path: str, *, rollback: bool) -> Tuple[int, List[str]]:
+    """Settle an interrupted run & either keep or undo its operations.
+
+    Returns the number of reversed operations & a list of problems.
+    """
+    if rollback:
+        return undo(path)
+    _append_footer(path, {"recovered": time.time()})
+    return 0, []
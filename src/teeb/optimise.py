@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""Re-encode oversized jpg album art.
+
+Scans ripped at high quality are often several megabytes, most of it spent on
+invisible detail, EXIF data & embedded thumbnails. Each oversized file is stripped
+of metadata (its colour profile is kept) & re-encoded with a binary search over the
+JPEG quality:
+
+* with a target size, the highest quality that fits in it is used,
+* with a similarity floor, quality is never lower than the lowest one which keeps
+  the structural similarity (SSIM) to the original at or above the floor.
+
+A handful of encodes per file are enough to find the quality. The result is kept
+only if it's smaller than the original. ImageMagick measures SSIM only since version
+7, with older versions the similarity floor is left out. Files are re-encoded in a pool of worker
+processes with the same memory limits as album art conversion.
+"""
+import logging
+import os
+from functools import partial
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from teeb.convert import (
+    WORKER_MEMORY_LIMIT,
+    run_in_workers,
+    set_resource_limits,
+)
+from teeb.data_type import Optimisation
+from teeb.trash import human_size
+
+MIN_QUALITY = 50
+MAX_QUALITY = 95
+DEFAULT_TARGET_SIZE = 500 * 1024
+DEFAULT_MIN_SSIM = 0.97
+# ImageMagick compare metric, available since ImageMagick 7
+SSIM_METRIC = "structural_dissimilarity"
+
+
+def _highest(low: int, high: int, fits: Callable[[int], bool]) -> Optional[int]:
+    """Find the highest quality that fits, when all lower ones fit as well."""
+    found = None
+    while low <= high:
+        middle = (low + high) // 2
+        if fits(middle):
+            found, low = middle, middle + 1
+        else:
+            high = middle - 1
+    return found
+
+
+def _lowest(low: int, high: int, fits: Callable[[int], bool]) -> Optional[int]:
+    """Find the lowest quality that fits, when all higher ones fit as well."""
+    found = None
+    while low <= high:
+        middle = (low + high) // 2
+        if fits(middle):
+            found, high = middle, middle - 1
+        else:
+            low = middle + 1
+    return found
+
+
+def choose_quality(
+    size: Callable[[int], int],
+    similarity: Callable[[int], float],
+    *,
+    target_size: int = None,
+    min_ssim: float = None,
+) -> int:
+    """Binary search JPEG quality for a target size, not going below an SSIM floor.
+
+    size & similarity return size of the image encoded at given quality & its SSIM
+    to the original. They are only called for the qualities the search visits.
+    """
+    quality = None
+    if target_size:
+        quality = _highest(MIN_QUALITY, MAX_QUALITY, lambda q: size(q) <= target_size)
+    if min_ssim and (quality is None or similarity(quality) < min_ssim):
+        low = MIN_QUALITY if quality is None else quality + 1
+        quality = _lowest(low, MAX_QUALITY, lambda q: similarity(q) >= min_ssim)
+    if quality is None:
+        # Target size can't be reached or SSIM floor can't be kept
+        quality = MIN_QUALITY if target_size and not min_ssim else MAX_QUALITY
+    return quality
+
+
+def ssim_available() -> bool:
+    """Tell if ImageMagick can measure structural similarity of images."""
+    from wand.image import COMPARE_METRICS
+
+    return SSIM_METRIC in COMPARE_METRICS
+
+
+def temporary_path(path: str) -> str:
+    """Return path a re-encoded file is written to before it replaces the original."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.teeb-optimised")
+
+
+def optimise_jpg(
+    path: str,
+    *,
+    target_size: int = None,
+    min_ssim: float = None,
+    dry_run: bool = False,
+) -> Optimisation:
+    """Re-encode a jpg file & write it next to the original unless it's a dry run."""
+    from wand.image import Image
+
+    if min_ssim and not ssim_available():
+        min_ssim = None
+    result = Optimisation(path=path, original_size=os.path.getsize(path))
+    with Image(filename=path) as original:
+        # Stripped EXIF Orientation tag won't rotate the picture anymore
+        original.auto_orient()
+        icc = original.profiles.get("icc")
+        original.strip()
+        if icc:
+            original.profiles["icc"] = icc
+        blobs: Dict[int, bytes] = {}
+        similarities: Dict[int, float] = {}
+
+        def encode(quality: int) -> bytes:
+            if quality not in blobs:
+                with original.clone() as image:
+                    image.compression_quality = quality
+                    blobs[quality] = image.make_blob("jpeg")
+            return blobs[quality]
+
+        def similarity(quality: int) -> float:
+            if quality not in similarities:
+                with Image(blob=encode(quality)) as image:
+                    _, dissimilarity = original.compare(image, metric=SSIM_METRIC)
+                # DSSIM is (1 - SSIM) / 2
+                similarities[quality] = 1 - 2 * dissimilarity
+            return similarities[quality]
+
+        result.quality = choose_quality(
+            lambda quality: len(encode(quality)),
+            similarity,
+            target_size=target_size,
+            min_ssim=min_ssim,
+        )
+        blob = encode(result.quality)
+        result.size = len(blob)
+        result.ssim = similarities.get(result.quality)
+        result.encodes = len(blobs)
+
+    if result.saved > 0 and not dry_run:
+        result.temporary_path = temporary_path(path)
+        try:
+            with open(result.temporary_path, "wb") as file:
+                file.write(blob)
+        except BaseException:  # Including an interrupted run
+            if os.path.exists(result.temporary_path):
+                os.remove(result.temporary_path)
+            raise
+    return result
+
+
+def remove_temporary_files(paths: List[str]):
+    """Remove re-encoded files which haven't replaced their originals.
+
+    A re-encoded file is kept if its original is gone, as it's the only copy left
+    in place then.
+    """
+    for path in paths:
+        leftover = temporary_path(path)
+        if os.path.exists(leftover) and os.path.exists(path):
+            logging.debug(f"Removing re-encoded file: {leftover}")
+            os.remove(leftover)
+
+
+def _failed_optimisation(path: str, error: str) -> Optimisation:
+    return Optimisation(path=path, error=error)
+
+
+def _optimise(path: str, options: dict) -> Optimisation:
+    """Re-encode a single file and report any error instead of raising it."""
+    try:
+        return optimise_jpg(path, **options)
+    except Exception as err:  # Wand raises its own exceptions for broken images
+        return Optimisation(path=path, error=f"{err}")
+
+
+def optimise_jpgs(
+    paths: List[str],
+    *,
+    jobs: int = None,
+    memory_limit: int = WORKER_MEMORY_LIMIT,
+    target_size: int = DEFAULT_TARGET_SIZE,
+    min_ssim: float = DEFAULT_MIN_SSIM,
+    dry_run: bool = False,
+) -> Iterator[Optimisation]:
+    """Re-encode jpg files in a pool of processes.
+
+    Results are generated in the order in which files are done.
+    """
+    try:
+        if min_ssim and not ssim_available():
+            logging.warning(
+                "ImageMagick can't measure SSIM before version 7, re-encoding "
+                "without the similarity floor"
+            )
+            min_ssim = None
+    except ImportError:  # Every file will fail with the same error anyway
+        pass
+    options = {"target_size": target_size, "min_ssim": min_ssim, "dry_run": dry_run}
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) == 1:
+        set_resource_limits(memory=memory_limit)
+        for path in paths:
+            yield _optimise(path, options)
+        return
+
+    yield from run_in_workers(
+        partial(_optimise, options=options),
+        paths,
+        jobs=jobs,
+        memory_limit=memory_limit,
+        failed=_failed_optimisation,
+    )
+
+
+def summary(results: List[Optimisation], *, dry_run: bool = False) -> str:
+    smaller = [result for result in results if not result.error and result.saved > 0]
+    saved = sum(result.saved for result in smaller)
+    verb = "Would save" if dry_run else "Saved"
+    return (
+        f"{verb} {human_size(saved)} by re-encoding {len(smaller)} of "
+        f"{len(results)} oversized jpg files"
+    )
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Console output of actions, summarised & written in as few writes as possible.
+
+Listing every path found in a big library takes minutes over SSH & scrolls the
+question about them off the screen. Listings longer than a handful of examples are
+therefore summarised: paths are counted per extension & directory and only the
+first few are shown. With verbose output everything is listed, and all listings
+can also be written in full to a file.
+
+Each listing is written with a single write. Messages printed one per file, e.g.
+while moving many files, can be collected with `buffered()` & are written when the
+block ends, the buffer is full or a question is asked.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+)
+
+# Number of paths shown before a listing gets summarised
+DEFAULT_EXAMPLES = 10
+# Buffered output is written once it grows over this many characters
+BUFFER_SIZE = 64 * 1024
+
+
+def summarise(paths: List[str], *, examples: int = DEFAULT_EXAMPLES) -> List[str]:
+    """Return lines with counts of paths per extension & directory and examples."""
+    extensions = Counter(Path(path).suffix.lower() or "no extension" for path in paths)
+    directories = Counter(os.path.dirname(path) for path in paths)
+    lines = [
+        "By extension: "
+        + ", ".join(
+            f"{count} {extension}"
+            for extension, count in extensions.most_common(examples)
+        )
+    ]
+    if len(extensions) > examples:
+        lines[0] += f" & {len(extensions) - examples} more"
+    lines.append(f"By directory ({len(directories)}):")
+    for directory, count in directories.most_common(examples):
+        lines.append(f"  {count} in {directory}")
+    if len(directories) > examples:
+        lines.append(f"  ... & {len(directories) - examples} more directories")
+    lines.append(f"First {examples}:")
+    lines.extend(f"  {path}" for path in paths[:examples])
+    return lines
+
+
+class Output:
+    """Console output with long listings summarised unless it's verbose."""
+
+    def __init__(
+        self,
+        stream: TextIO = None,
+        *,
+        verbose: bool = False,
+        examples: int = DEFAULT_EXAMPLES,
+        listing_path: str = None,
+    ):
+        """Write to the stream or to whatever sys.stdout is at the time of writing.
+
+        With a listing path, all listings are written to that file in full.
+        """
+        self._stream = stream
+        self.verbose = verbose
+        self.examples = examples
+        self.listing_path = listing_path
+        self._listing_file: Optional[TextIO] = None
+        if listing_path:
+            self._listing_file = open(listing_path, "w", encoding="utf-8")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def stream(self) -> TextIO:
+        return self._stream or sys.stdout
+
+    def _buffer(self) -> Optional[List[str]]:
+        return getattr(self._local, "buffer", None)
+
+    def write(self, text: str):
+        buffer = self._buffer()
+        if buffer is None:
+            self.stream.write(text)
+            return
+        buffer.append(text)
+        self._local.size += len(text)
+        if self._local.size >= BUFFER_SIZE:
+            self.flush()
+
+    def echo(self, *values, sep: str = " ", end: str = "\n"):
+        """Same as print()."""
+        self.write(sep.join(f"{value}" for value in values) + end)
+
+    def listing(self, paths: Iterable[str], *, title: str = None):
+        """List paths, summarised if there are more of them than examples."""
+        paths = list(paths)
+        if self._listing_file is not None:
+            with self._lock:
+                self._listing_file.write(f"# {title or 'Listing'}: {len(paths)}\n")
+                self._listing_file.writelines(f"{path}\n" for path in paths)
+                self._listing_file.flush()
+        if self.verbose or len(paths) <= self.examples:
+            lines = paths
+        else:
+            lines = summarise(paths, examples=self.examples)
+            hint = f"Use --verbose to list all {len(paths)}"
+            if self.listing_path:
+                hint += f" or see {self.listing_path}"
+            lines.append(hint)
+        if lines:
+            self.write("\n".join(lines) + "\n")
+
+    @contextmanager
+    def buffered(self) -> Iterator[None]:
+        """Collect output of current thread & write it at once when the block ends."""
+        if self._buffer() is not None:  # Nested block
+            yield
+            return
+        self._local.buffer, self._local.size = [], 0
+        try:
+            yield
+        finally:
+            self.flush()
+            self._local.buffer = None
+
+    def flush(self):
+        """Write output collected by current thread."""
+        buffer = self._buffer()
+        if buffer:
+            self.stream.write("".join(buffer))
+            buffer.clear()
+            self._local.size = 0
+        self.stream.flush()
+
+    def close(self):
+        if self._listing_file is not None:
+            self._listing_file.close()
+            self._listing_file = None
+
+
+_output: Optional[Output] = None
+
+
+def configure(
+    *, verbose: bool = False, listing_path: str = None, examples: int = DEFAULT_EXAMPLES
+) -> Output:
+    """Set up output of actions for the rest of the run."""
+    global _output
+    if _output is not None:
+        _output.close()
+    _output = Output(verbose=verbose, listing_path=listing_path, examples=examples)
+    return _output
+
+
+def default_output() -> Output:
+    global _output
+    if _output is None:
+        _output = Output()
+    return _output
+
+
+def echo(*values, sep: str = " ", end: str = "\n"):
+    default_output().echo(*values, sep=sep, end=end)
+
+
+def listing(paths: Iterable[str], *, title: str = None):
+    default_output().listing(paths, title=title)
+
+
+def buffered():
+    return default_output().buffered()
+
+
+def flush():
+    if _output is not None:
+        _output.flush()
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""Non-interactive plan & apply mode.
+
+A plan is made by running every step against the library index only. Changes are
+applied to the index instead of the disk, so each step sees the library as it would
+look after all previous steps, e.g. album art moved by
+`move_album_art_files_to_album_dir` already has a normalised name.
+The resulting list of operations is saved as JSON, so it can be reviewed, edited and
+then applied in bulk without any prompts.
+"""
+import json
+import logging
+import os
+from dataclasses import (
+    asdict,
+    dataclass,
+    field,
+)
+from pathlib import Path
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+import teeb.suggest
+from teeb.arthash import (
+    ArtHasher,
+    redundant_album_art,
+)
+from teeb.convert import (
+    jpg_path,
+    to_jpg,
+)
+from teeb.cueparser import (
+    CueCache,
+    CueParser,
+)
+from teeb.data_type import (
+    Operation,
+    SizeLimit,
+)
+from teeb.dedupe import same_content
+from teeb.fileops import (
+    move,
+    remove,
+    rename,
+    trash,
+)
+from teeb.find import (
+    album_art_files_to_convert,
+    cue_files_and_audio_files,
+    empty_directories,
+    extra_files,
+    extra_text_files,
+    nested_album_art,
+)
+from teeb.index import LibraryIndex
+from teeb.rename import plan_renames
+from teeb.split import (
+    run_job,
+    split_job,
+    splitter_name,
+)
+
+
+@dataclass
+class Plan:
+    directory: str
+    operations: List[Operation] = field(default_factory=list)
+    # Things that need a human decision, e.g. which of the multiple CUE files to use
+    skipped: List[Dict[str, str]] = field(default_factory=list)
+
+
+def save_plan(plan: Plan, path: str):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(asdict(plan), file, indent=2, ensure_ascii=False)
+
+
+def load_plan(path: str) -> Plan:
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    return Plan(
+        directory=data["directory"],
+        operations=[Operation(**operation) for operation in data["operations"]],
+        skipped=data.get("skipped", []),
+    )
+
+
+class Planner:
+    """Plan all steps teeb would take if every question was answered with yes."""
+
+    def __init__(
+        self,
+        directory: str,
+        index: LibraryIndex,
+        cues: CueCache = None,
+        hashes: ArtHasher = None,
+    ):
+        self.directory = directory
+        self.index = index
+        self.cues = cues
+        self.hashes = hashes
+        self.plan = Plan(directory=directory)
+        # Maps planned file paths to the paths they have on disk now.
+        # None means that the file doesn't exist yet, e.g. it'll be converted to jpg.
+        self._origins: Dict[str, Optional[str]] = {}
+        self._directory_renames: List[Tuple[str, str]] = []
+        self._split_directories: List[str] = []
+
+    def make(self) -> Plan:
+        self.delete_extra_files()
+        self.delete_extra_text_files()
+        self.normalise_names()
+        self.convert_album_art_to_jpg()
+        self.move_album_art_files_to_album_dir()
+        self.what_to_do_with_cue()
+        self.clean_up_jpg_album_art_file_names()
+        self.delete_empty_directories()
+        return self.plan
+
+    def _origin(self, path: str) -> Optional[str]:
+        if path in self._origins:
+            return self._origins[path]
+        for old, new in reversed(self._directory_renames):
+            if path.startswith(new + os.sep):
+                return self._origin(old + path[len(new) :])
+        return path
+
+    def _add(
+        self,
+        step: str,
+        action: str,
+        source: str,
+        target: str = None,
+        related: List[str] = None,
+    ):
+        """Record an operation and apply it to the index."""
+        operation = Operation(
+            step=step,
+            action=action,
+            source=source,
+            target=target,
+            related=related or [],
+        )
+        origin = self._origin(source)
+        if origin is not None and os.path.isfile(origin):
+            stat = os.stat(origin)
+            operation.size, operation.mtime_ns = stat.st_size, stat.st_mtime_ns
+        for path in operation.related:
+            related_origin = self._origin(path)
+            if related_origin is not None and os.path.isfile(related_origin):
+                stat = os.stat(related_origin)
+                operation.related_stats.append([stat.st_size, stat.st_mtime_ns])
+            else:
+                operation.related_stats.append(None)
+        self.plan.operations.append(operation)
+
+        if action in ["rename", "move"]:
+            if self.index.isdir(source):
+                self._directory_renames.append((source, target))
+            else:
+                self._origins[target] = origin
+            self.index.rename(source, target)
+        elif action == "convert":
+            self.index.remove(source)
+            self.index.add(target)
+            self._origins[target] = None
+        else:
+            for path in [source] + (related or []):
+                self.index.remove(path)
+
+    def _skip(self, step: str, path: str, reason: str):
+        self.plan.skipped.append({"step": step, "path": path, "reason": reason})
+
+    def delete_extra_files(self):
+        for path in extra_files(self.directory, index=self.index):
+            self._add("delete_extra_files", "delete", path)
+
+    def delete_extra_text_files(self):
+        for path in extra_text_files(self.directory, index=self.index):
+            self._add("delete_extra_text_files", "delete", path)
+
+    def normalise_names(self):
+        step = "normalise_names"
+        renames = plan_renames(self.directory, index=self.index)
+        for target, paths in renames.conflicts.items():
+            self._skip(step, target, f"would be the new name of: {', '.join(paths)}")
+        for entry in renames.renames:
+            self._add(step, "rename", entry.source, entry.target)
+
+    def convert_album_art_to_jpg(self):
+        step = "convert_album_art_to_jpg"
+        paths = album_art_files_to_convert(self.directory, index=self.index)
+        try:
+            clusters = redundant_album_art(
+                paths, index=self.index, hasher=self.hashes, origin=self._origin
+            )
+        except ImportError as err:
+            logging.debug(f"Can't compare album art: {err}")
+            clusters = []
+        redundant = set()
+        for group in clusters:
+            for path in group.redundant:
+                self._add(step, "trash", path)
+                redundant.add(path)
+        for path in paths:
+            if path not in redundant:
+                self._add(step, "convert", path, jpg_path(path))
+
+    def move_album_art_files_to_album_dir(self):
+        step = "move_album_art_files_to_album_dir"
+        art_directories = nested_album_art(self.directory, index=self.index)
+        for art_dir in art_directories["case1"]:
+            sub_dir = art_dir["art_dir"]
+            parent = str(art_dir["parent_dir"])
+            for filename in art_dir["art_files"]:
+                name = Path(filename).stem
+                old_path = os.path.join(sub_dir, filename)
+                new_path = os.path.join(parent, filename)
+                if name.isdigit():
+                    new_path = os.path.join(parent, f"booklet-{filename}")
+                if self.index.isfile(new_path):
+                    old_origin = self._origin(old_path)
+                    new_origin = self._origin(new_path)
+                    if (
+                        old_origin
+                        and new_origin
+                        and same_content(old_origin, new_origin)
+                    ):
+                        self._add(step, "trash", old_path)
+                    else:
+                        self._skip(step, old_path, f"{new_path} already exists")
+                else:
+                    self._add(step, "move", old_path, new_path)
+            leftover_files = [
+                name
+                for name in self.index.listdir(sub_dir)
+                if self.index.isfile(os.path.join(sub_dir, name))
+            ]
+            if not leftover_files:
+                self._add(step, "trash", sub_dir)
+
+    def what_to_do_with_cue(self):
+        step = "what_to_do_with_cue"
+        min_audio_files = 1
+        for cue_dir in cue_files_and_audio_files(self.directory, index=self.index):
+            if len(cue_dir.cues) > 1:
+                self._skip(step, cue_dir.dir, f"{len(cue_dir.cues)} CUE files")
+                continue
+            cue_path = os.path.join(cue_dir.dir, cue_dir.cues[0])
+            origin = self._origin(cue_path)
+            if origin is None:
+                continue
+            cue = CueParser(origin) if self.cues is None else self.cues.parse(origin)
+            files_equal_tracks = len(cue_dir.audio_files) == len(cue.tracks)
+            more_files_than_min = len(cue_dir.audio_files) > min_audio_files
+            if files_equal_tracks and more_files_than_min:
+                self._add(step, "trash", cue_path)
+                continue
+
+            related = [
+                os.path.join(cue_dir.dir, audio_file)
+                for audio_file in cue_dir.audio_files
+            ]
+            if cue.meta.get("FILE"):
+                cue_audio_file = cue.meta["FILE"].replace(" ", "_").lower()
+                cue_audio_file_path = os.path.join(cue_dir.dir, cue_audio_file)
+                if self.index.isfile(cue_audio_file_path):
+                    related = [cue_audio_file_path]
+            self._add(step, "split", cue_path, related=related)
+            self._split_directories.append(os.path.normpath(cue_dir.dir))
+
+    def clean_up_jpg_album_art_file_names(self):
+        step = "clean_up_jpg_album_art_file_names"
+        for sub_dir, _, files in self.index.walk(self.directory):
+            for filename in files:
+                if Path(filename).suffix[1:] != "jpg":
+                    continue
+                suggestions = teeb.suggest.new_art_file_name(filename)
+                if not suggestions:
+                    continue
+                old_path = os.path.join(sub_dir, filename)
+                new_path = os.path.join(sub_dir, suggestions[0])
+                if len(suggestions) > 1:
+                    self._skip(step, old_path, f"multiple suggestions: {suggestions}")
+                elif self.index.isfile(new_path):
+                    self._skip(step, old_path, f"{new_path} already exists")
+                else:
+                    self._add(step, "rename", old_path, new_path)
+
+    def delete_empty_directories(self):
+        for sub_dir in empty_directories(self.directory, index=self.index):
+            # Split tracks will land in directories, which seem empty for now
+            if os.path.normpath(sub_dir) not in self._split_directories:
+                self._add("delete_empty_directories", "trash", sub_dir)
+
+
+def _stat_differs(path: str, size: int, mtime_ns: int) -> bool:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return True
+    return (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns)
+
+
+def _has_changed(operation: Operation) -> bool:
+    """Check if operation source is gone or differs from when the plan was made.
+
+    Files related to the source, e.g. audio images trashed after a split, are
+    checked as well.
+    """
+    if not os.path.exists(operation.source):
+        return True
+    if operation.size is not None and _stat_differs(
+        operation.source, operation.size, operation.mtime_ns
+    ):
+        return True
+    for path, stat in zip(operation.related, operation.related_stats):
+        if stat is not None and _stat_differs(path, *stat):
+            return True
+    return False
+
+
+def _contains_files(directory: str) -> bool:
+    return any(files for _, _, files in os.walk(directory))
+
+
+def apply_operation(operation: Operation, *, size_limit: SizeLimit = None) -> bool:
+    """Execute a single planned operation without asking any questions.
+
+    Returns False if operation couldn't be applied.
+    """
+    if operation.action == "delete":
+        remove(operation.source)
+    elif operation.action == "trash":
+        if os.path.isdir(operation.source) and _contains_files(operation.source):
+            print(f"Skipped trashing non-empty directory: {operation.source}")
+            return False
+        trash(operation.source)
+    elif operation.action in ["rename", "move"]:
+        # On case insensitive file systems target of a case only rename "exists"
+        if os.path.exists(operation.target) and not os.path.samefile(
+            operation.source, operation.target
+        ):
+            print(f"File already exists: {operation.target}")
+            return False
+        if operation.action == "move":
+            move(operation.source, operation.target)
+        else:
+            rename(operation.source, operation.target)
+    elif operation.action == "convert":
+        to_jpg(operation.source, operation.target, size_limit=size_limit)
+        remove(operation.source)
+    elif operation.action == "split":
+        job = run_job(split_job(operation.source))
+        if not job.succeeded:
+            print(
+                f"{splitter_name(job)} had some issues with '{operation.source}', "
+                f"see: {job.log_path}"
+            )
+            return False
+        for path in operation.related + [operation.source]:
+            if os.path.exists(path):
+                trash(path)
+    else:
+        raise ValueError(f"Unknown operation: {operation.action}")
+    return True
+
+
+def apply_plan(plan: Plan, *, size_limit: SizeLimit = None) -> Tuple[int, int]:
+    """Apply all planned operations in order.
+
+    Operations on files that were changed since the plan was made are skipped.
+    Returns the number of applied and skipped operations.
+    """
+    applied = skipped = 0
+    for operation in plan.operations:
+        if _has_changed(operation):
+            print(
+                f"Skipped {operation.action} of '{operation.source}' as it has "
+                "changed since the plan was made"
+            )
+            skipped += 1
+            continue
+        try:
+            if apply_operation(operation, size_limit=size_limit):
+                applied += 1
+            else:
+                skipped += 1
+        except OSError as err:
+            print(err)
+            skipped += 1
+    return applied, skipped
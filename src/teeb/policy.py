@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Record answers to questions & replay them in later runs.
+
+Most questions are answered the same way every time, e.g. extra files are always
+deleted & extensions always changed to lower case. With a policy file, every
+answer given by the user is recorded in it, keyed by the question. Questions about
+particular files are keyed by a pattern of the file name instead, with digits left
+out & in lower case, so an answer applies to all files named alike, e.g. the
+suggestion chosen for "01-Front.JPG" is used for "02-front.jpg" as well.
+
+Next time a recorded question is asked, the recorded answer is used without
+asking. Only questions the policy hasn't seen are asked. Quitting is never
+recorded.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from typing import (
+    Dict,
+    List,
+    Optional,
+)
+
+# Answers which are never recorded nor replayed
+NOT_RECORDED = ["q"]
+
+
+def pattern(name: str) -> str:
+    """Generalise a file name, e.g. 01-Front.JPG -> #-front.jpg"""
+    return re.sub(r"\d+", "#", name.lower())
+
+
+class Policy:
+    """Answers to questions keyed by the question or a pattern of what it asks about."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.replayed = 0
+        self.recorded = 0
+        self._answers: Dict[str, str] = self._load()
+        # Albums processed concurrently ask questions from many threads
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file).get("answers", {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            logging.warning(f"Ignoring unreadable policy {self.path}: {err}")
+            return {}
+
+    def answer(self, key: str, options: List[str]) -> Optional[str]:
+        """Return recorded answer to a question, if it's one of its options."""
+        with self._lock:
+            answer = self._answers.get(key)
+            if answer is None or answer not in options:
+                return None
+            self.replayed += 1
+            return answer
+
+    def record(self, key: str, answer: str):
+        """Record an answer given by the user & save the policy."""
+        if answer in NOT_RECORDED:
+            return
+        with self._lock:
+            if self._answers.get(key) == answer:
+                return
+            self._answers[key] = answer
+            self.recorded += 1
+            self._save()
+
+    def _save(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"answers": self._answers}, file, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def summary(self) -> Optional[str]:
+        if not self.replayed and not self.recorded:
+            return None
+        return (
+            f"Policy {self.path}: {self.replayed} answers replayed, "
+            f"{self.recorded} recorded"
+        )
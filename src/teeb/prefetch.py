@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Prepare the next step while the user reads a prompt.
+
+Most of the time teeb waits for the user to answer a question, and as soon as the
+answer is given the next step starts its own scan. Before each step, the calls
+that the step after it will make are registered with `expect()`. When a prompt is
+shown, they are started in a background thread, so by the time the user answers,
+the next step's files are found & its Cue Sheets & image headers are read.
+
+Speculative results are only used if they can't be stale:
+
+* results of finders are discarded if anything in their directory changed in the
+  index after they started, e.g. because the user agreed to delete some files,
+* Cue Sheets & image hashes are stored in CueCache & ArtHasher, which key them by
+  file size & mtime, so a file changed after it was read is simply read again.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from teeb.arthash import (
+    ArtHasher,
+    redundant_album_art,
+)
+from teeb.cueparser import CueCache
+from teeb.find import (
+    album_art_files_to_convert,
+    cue_files_and_audio_files,
+)
+from teeb.index import LibraryIndex
+
+# Finders read directory listings from the index, so a single thread is enough &
+# keeps speculative work from competing with the step that runs in the foreground
+DEFAULT_WORKERS = 1
+
+
+def _key(function: Callable, args: tuple, kwargs: dict) -> Optional[tuple]:
+    key = (function, args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class Prefetcher:
+    """Speculative calls of upcoming steps, started when a prompt is shown."""
+
+    def __init__(self, index: LibraryIndex, *, workers: int = DEFAULT_WORKERS):
+        self.index = index
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="prefetch"
+        )
+        self._lock = threading.Lock()
+        self._expected: List[Tuple[Callable, tuple, dict]] = []
+        self._started: Dict[tuple, Tuple[int, Future]] = {}
+
+    def expect(self, function: Callable, *args, **kwargs):
+        """Register a call which an upcoming step will make."""
+        with self._lock:
+            self._expected.append((function, args, kwargs))
+
+    def idle(self):
+        """Start registered calls, the user is busy reading a prompt."""
+        with self._lock:
+            expected, self._expected = self._expected, []
+            for function, args, kwargs in expected:
+                key = _key(function, args, kwargs)
+                if key is not None and key in self._started:
+                    continue
+                generation = self.index.generation
+                future = self._executor.submit(function, *args, **kwargs)
+                if key is not None:
+                    self._started[key] = (generation, future)
+
+    def take(self, function: Callable, *args, **kwargs):
+        """Return result of a speculative call if it's still valid or call it now.
+
+        The first positional argument is the directory the call depends on.
+        """
+        key = _key(function, args, kwargs)
+        with self._lock:
+            started = self._started.pop(key, None) if key is not None else None
+            # Nothing was prompted for since it was registered, it's not needed now
+            self._expected = [
+                call for call in self._expected if key is None or _key(*call) != key
+            ]
+        if started is not None and started[1].cancel():
+            started = None  # Still queued behind other calls, it's quicker to run it
+        if started is None:
+            self.misses += 1
+            return function(*args, **kwargs)
+
+        generation, future = started
+        try:
+            result = future.result()
+        except Exception as err:
+            logging.debug(f"Prefetching {function.__name__} failed: {err}")
+            self.misses += 1
+            return function(*args, **kwargs)
+        directory = args[0] if args else None
+        if self.index.changed_since(generation, directory):
+            self.stale += 1
+            return function(*args, **kwargs)
+        self.hits += 1
+        return result
+
+    def close(self):
+        """Drop calls that haven't started yet & wait for the running ones."""
+        with self._lock:
+            self._expected = []
+            started, self._started = self._started, {}
+        for _, future in started.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+    def summary(self) -> Optional[str]:
+        total = self.hits + self.stale + self.misses
+        if not total:
+            return None
+        return (
+            f"Prefetched {self.hits} of {total} scans, {self.stale} were discarded "
+            f"as stale"
+        )
+
+
+_prefetcher: Optional[Prefetcher] = None
+
+
+def start(index: LibraryIndex, *, workers: int = DEFAULT_WORKERS) -> Prefetcher:
+    global _prefetcher
+    stop()
+    _prefetcher = Prefetcher(index, workers=workers)
+    return _prefetcher
+
+
+def current() -> Optional[Prefetcher]:
+    return _prefetcher
+
+
+def stop():
+    global _prefetcher
+    if _prefetcher is not None:
+        _prefetcher.close()
+    _prefetcher = None
+
+
+def expect(function: Callable, *args, **kwargs):
+    """Register a call of an upcoming step, if prefetching is on."""
+    if _prefetcher is not None:
+        _prefetcher.expect(function, *args, **kwargs)
+
+
+def idle():
+    """Start prefetching, called when a prompt is shown."""
+    if _prefetcher is not None:
+        _prefetcher.idle()
+
+
+def prefetched(function: Callable, *args, **kwargs):
+    """Call function(*args, **kwargs) or return its valid prefetched result."""
+    if _prefetcher is None:
+        return function(*args, **kwargs)
+    return _prefetcher.take(function, *args, **kwargs)
+
+
+def parse_cues(directory: str, *, index: LibraryIndex = None, cues: CueCache = None):
+    """Parse Cue Sheets which the cue clean-up step is going to read."""
+    if cues is None:
+        return
+    for cue_dir in cue_files_and_audio_files(directory, index=index):
+        for cue_file in cue_dir.cues:
+            cues.parse(os.path.join(cue_dir.dir, cue_file))
+
+
+def hash_album_art(
+    directory: str, *, index: LibraryIndex = None, hashes: ArtHasher = None
+):
+    """Hash images which the album art conversion step is going to compare."""
+    if hashes is None:
+        return
+    paths = album_art_files_to_convert(directory, index=index)
+    try:
+        redundant_album_art(paths, index=index, hasher=hashes)
+    except ImportError:  # ImageMagick isn't installed, the step will tell the user
+        pass
@@ -1,16 +1,53 @@
 # -*- coding: utf-8 -*-
+import threading
+
+import teeb.output
+import teeb.prefetch
 from teeb.ansii import (
     ANSIIColor,
     ANSIIStyle,
 )
 
+# Questions asked from other threads than the main one are sent to it through this
+# channel, see teeb.albums
+channel = None
+# Answers recorded in previous runs, see teeb.policy
+policy = None
+
 
-def prompt(question: str, options: list) -> str:
-    """Print colorful prompt.
+def prompt(question: str, options: list, *, key: str = None) -> str:
+    """Print colorful prompt, unless the policy already knows the answer.
 
+    key identifies the question in the policy, it's the question by default.
     returns: a lower case decision option key.
     """
+    key = key or question
+    # Buffered output of the current thread has to be shown before the question
+    teeb.output.flush()
+    if policy is not None:
+        answer = policy.answer(key, options)
+        if answer is not None:
+            print(f"{question} {answer} (from policy)")
+            return answer
+    if (
+        channel is not None
+        and threading.current_thread() is not threading.main_thread()
+    ):
+        answer = channel.ask(question, options)
+    else:
+        answer = ask(question, options)
+    if policy is not None:
+        policy.record(key, answer)
+    return answer
+
+
+def ask(question: str, options: list) -> str:
+    """Ask the user in the terminal until one of the options is chosen."""
     default_options = {
+        "a": {
+            "name": "All remaining",
+            "style": ANSIIStyle(bold=True, color=ANSIIColor.BRIGHT_PURPLE),
+        },
         "d": {"name": "Delete", "style": ANSIIStyle(bold=True, color=ANSIIColor.RED)},
         "n": {
             "name": "No",
@@ -21,6 +58,10 @@ def prompt(question: str, options: list) -> str:
             "style": ANSIIStyle(bold=True, color=ANSIIColor.BRIGHT_RED),
         },
         "q": {"name": "Quit", "style": ANSIIStyle(bold=True, color=ANSIIColor.GRAY)},
+        "r": {
+            "name": "Report only",
+            "style": ANSIIStyle(bold=True, color=ANSIIColor.BRIGHT_CYAN),
+        },
         "s": {
             "name": "Skip",
             "style": ANSIIStyle(bold=True, color=ANSIIColor.BRIGHT_YELLOW),
@@ -82,6 +123,9 @@ def prompt(question: str, options: list) -> str:
         f"{props['style'].start}{key} ({props['name']}){props['style'].end}"
         for key, props in matching_options.items()
     )
+    teeb.output.flush()
+    # The next step is prepared while the user reads the question
+    teeb.prefetch.idle()
     while result not in matching_options:
         result = input(f"{question} {formatted_options}: ").lower()
 
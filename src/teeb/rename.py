@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Normalise file & directory names in a single pass.
+
+All name normalisation rules are combined into the final name of every entry, so a
+file like `Cover Art/Front Cover.JPEG` is renamed once instead of once per rule.
+Conflicts, e.g. `Cover.JPG` & `cover.jpg` in the same directory, are found in memory
+before anything is renamed. Renames are applied bottom-up, so entries are renamed
+before the directory they're in and their paths never go stale.
+"""
+import os
+from pathlib import Path
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Tuple,
+)
+
+from teeb.data_type import (
+    Rename,
+    RenamePlan,
+)
+from teeb.default import (
+    audio_extentions,
+    change_extension_mapping,
+)
+from teeb.fileops import rename
+from teeb.find import walk
+from teeb.index import LibraryIndex
+
+LOWER_EXTENSIONS = "lower_extensions"
+CHANGE_EXTENSIONS = "change_extensions"
+NON_AUDIO_TO_LOWER_CASE = "non_audio_to_lower_case"
+SPACES_TO_UNDERSCORES = "spaces_to_underscores"
+ALL_RULES = frozenset(
+    [
+        LOWER_EXTENSIONS,
+        CHANGE_EXTENSIONS,
+        NON_AUDIO_TO_LOWER_CASE,
+        SPACES_TO_UNDERSCORES,
+    ]
+)
+
+
+def normalised_name(
+    name: str, *, is_dir: bool = False, rules: FrozenSet[str] = ALL_RULES
+) -> str:
+    """Apply name normalisation rules to a single file or directory name.
+
+    Only spaces are replaced in directory names.
+    """
+    if not is_dir:
+        suffix = Path(name).suffix
+        extension = suffix[1:]
+        if LOWER_EXTENSIONS in rules:
+            extension = extension.lower()
+        if CHANGE_EXTENSIONS in rules:
+            extension = change_extension_mapping.get(extension.lower(), extension)
+        if suffix:
+            name = f"{name[: len(name) - len(suffix)]}.{extension}"
+        if (
+            NON_AUDIO_TO_LOWER_CASE in rules
+            and extension.lower() not in audio_extentions
+        ):
+            name = name.lower()
+    if SPACES_TO_UNDERSCORES in rules:
+        name = name.replace(" ", "_")
+    return name
+
+
+def _changed_by(name: str, is_dir: bool, rules: FrozenSet[str]) -> List[str]:
+    return sorted(
+        rule
+        for rule in rules
+        if normalised_name(name, is_dir=is_dir, rules=frozenset([rule])) != name
+    )
+
+
+def plan_renames(
+    directory: str, *, index: LibraryIndex = None, rules: Iterable[str] = ALL_RULES
+) -> RenamePlan:
+    """Work out the final name of every entry with a single walk of the tree."""
+    rules = frozenset(rules)
+    plan = RenamePlan()
+    batches = []
+    for path, dirs, files in walk(directory, index):
+        # Keyed by case folded name to catch entries that would differ only by case
+        targets: Dict[str, List[Tuple[str, str, bool]]] = {}
+        for names, is_dir in [(files, False), (dirs, True)]:
+            for name in names:
+                new_name = normalised_name(name, is_dir=is_dir, rules=rules)
+                targets.setdefault(new_name.casefold(), []).append(
+                    (name, new_name, is_dir)
+                )
+
+        batch = []
+        for entries in targets.values():
+            if all(name == new_name for name, new_name, _ in entries):
+                continue
+            if len(entries) > 1:
+                target = os.path.join(path, entries[0][1])
+                plan.conflicts[target] = [
+                    os.path.join(path, name) for name, _, _ in entries
+                ]
+                continue
+            name, new_name, is_dir = entries[0]
+            batch.append(
+                Rename(
+                    source=os.path.join(path, name),
+                    target=os.path.join(path, new_name),
+                    is_dir=is_dir,
+                    rules=_changed_by(name, is_dir, rules),
+                )
+            )
+        batches.append(batch)
+
+    # Walk is top-down, so reversed batches put entries before their parents
+    plan.renames = [entry for batch in reversed(batches) for entry in batch]
+    return plan
+
+
+def apply_renames(
+    plan: RenamePlan, *, index: LibraryIndex = None
+) -> Tuple[int, List[str]]:
+    """Rename all planned entries with a single rename() call each.
+
+    Returns the number of renamed entries & errors of failed renames.
+    """
+    renamed = 0
+    errors = []
+    for entry in plan.renames:
+        try:
+            rename(entry.source, entry.target, index)
+            renamed += 1
+        except OSError as err:
+            errors.append(f"{err}")
+    return renamed, errors
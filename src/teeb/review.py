@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+"""Full-screen review of findings, for when there are too many to scroll through.
+
+An item with a single choice, e.g. a single suggested name, starts selected. An item
+with several choices starts skipped, marked with "?", until the user picks one of
+them. The user moves through the list, skips items or picks another choice &
+confirms all decisions at once.
+
+Only as many items as fit on the screen are read from the finder producing them,
+and only the visible rows are rendered, so the screen shows up immediately & stays
+responsive with hundreds of thousands of items. Filtering scans items only as far
+as needed to fill the screen as well. Decisions are kept only for items the user
+changed.
+
+Keys:
+  up/down, k/j, page up/down, home/end, g/G  move
+  space        skip or select an item
+  tab          pick the next choice of an item
+  a / x        select / skip all items matching the filter, apart from items
+               with several choices none of which was picked
+  /            search, n finds the next match
+  f            filter, an empty filter shows all items
+  enter        apply decisions
+  q / esc      cancel
+"""
+import os
+import shutil
+import sys
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from teeb.ansii import (
+    ANSIIColor,
+    ANSIIStyle,
+)
+from teeb.data_type import ReviewItem
+
+TITLE_STYLE = ANSIIStyle(bold=True, color=ANSIIColor.BRIGHT_CYAN)
+CURSOR_STYLE = ANSIIStyle(bold=True, underline=True, color=ANSIIColor.BRIGHT_GREEN)
+SKIPPED_STYLE = ANSIIStyle(strikethrough=True, color=ANSIIColor.GRAY)
+STATUS_STYLE = ANSIIStyle(italic=True, color=ANSIIColor.BRIGHT_BLACK)
+
+HELP = (
+    "space skip/select · tab next choice · a/x all · / search · f filter · "
+    "enter apply · q cancel"
+)
+# Title, status & help line
+CHROME_LINES = 3
+
+KEYS = {
+    b"\x1b[A": "up",
+    b"\x1b[B": "down",
+    b"\x1b[5~": "page up",
+    b"\x1b[6~": "page down",
+    b"\x1b[H": "home",
+    b"\x1bOH": "home",
+    b"\x1b[1~": "home",
+    b"\x1b[F": "end",
+    b"\x1bOF": "end",
+    b"\x1b[4~": "end",
+    b"\r": "enter",
+    b"\n": "enter",
+    b"\t": "tab",
+    b"\x1b": "esc",
+    b"\x7f": "backspace",
+    b"\x08": "backspace",
+}
+ALIASES = {"k": "up", "j": "down", "g": "home", "G": "end"}
+
+
+class LazyList:
+    """Items of an iterator, produced only when they're needed."""
+
+    def __init__(self, items: Iterable):
+        self._iterator = iter(items)
+        self._items: list = []
+        self.exhausted = False
+
+    def load(self, count: int) -> int:
+        """Produce items until there are count of them & return how many there are."""
+        while len(self._items) < count and not self.exhausted:
+            try:
+                self._items.append(next(self._iterator))
+            except StopIteration:
+                self.exhausted = True
+        return len(self._items)
+
+    def __getitem__(self, index: int):
+        self.load(index + 1)
+        return self._items[index]
+
+    def __len__(self) -> int:
+        """Number of items produced so far."""
+        return len(self._items)
+
+
+class View:
+    """Indices of items with labels containing a query, found lazily."""
+
+    def __init__(self, items: LazyList, query: str = ""):
+        self.items = items
+        self.query = query
+        self._query = query.lower()
+        self._indices: List[int] = []
+        self._scanned = 0
+
+    def matches(self, item: ReviewItem) -> bool:
+        return not self._query or self._query in item.label.lower()
+
+    def load(self, count: int) -> int:
+        """Find matching items until there are count of them, return how many."""
+        while len(self._indices) < count:
+            if self.items.load(self._scanned + 1) <= self._scanned:
+                break
+            if self.matches(self.items[self._scanned]):
+                self._indices.append(self._scanned)
+            self._scanned += 1
+        return len(self._indices)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.items.exhausted and self._scanned >= len(self.items)
+
+    def __getitem__(self, position: int) -> int:
+        """Return index of the item at given position in the view."""
+        self.load(position + 1)
+        return self._indices[position]
+
+    def __len__(self) -> int:
+        """Number of matching items found so far."""
+        return len(self._indices)
+
+    def __iter__(self) -> Iterator[int]:
+        position = 0
+        while self.load(position + 1) > position:
+            yield self._indices[position]
+            position += 1
+
+
+def _fit(text: str, width: int) -> str:
+    if len(text) <= width:
+        return text
+    return text[: max(0, width - 1)] + "…"
+
+
+class Review:
+    """State of the review screen, independent of the terminal it's shown in."""
+
+    def __init__(
+        self,
+        items: Iterable[ReviewItem],
+        *,
+        title: str,
+        height: int = 24,
+        width: int = 80,
+    ):
+        self.title = title
+        self.items = LazyList(items)
+        self.view = View(self.items)
+        self.height, self.width = height, width
+        self.cursor = 0
+        self.top = 0
+        self.message = ""
+        self._search = ""
+        # Editor of search or filter query: (kind, text typed so far)
+        self._input: Optional[Tuple[str, str]] = None
+        # Decisions differing from the default one
+        self._skipped: Set[int] = set()
+        self._selected: Set[int] = set()
+        self._choices: Dict[int, int] = {}
+        # Number of skipped or undecided items among the first counted ones
+        self._left_out = 0
+        self._counted = 0
+
+    @property
+    def rows(self) -> int:
+        return max(1, self.height - CHROME_LINES)
+
+    def resize(self, height: int, width: int):
+        self.height, self.width = height, width
+        self._scroll()
+
+    def _undecided(self, index: int) -> bool:
+        """Tell if an item has several choices & the user hasn't picked any yet."""
+        return (
+            index not in self._selected
+            and index not in self._choices
+            and len(self.items[index].choices) > 1
+        )
+
+    def decision(self, index: int) -> Optional[int]:
+        """Return index of chosen choice of an item or None if it's skipped."""
+        if index in self._skipped or self._undecided(index):
+            return None
+        return self._choices.get(index, 0)
+
+    def _count_loaded(self):
+        """Count left out items among the ones produced since the last call.
+
+        Items are counted before any decision about them is made, so only the ones
+        with several choices are left out.
+        """
+        loaded = len(self.items)
+        for index in range(self._counted, loaded):
+            self._left_out += len(self.items[index].choices) > 1
+        self._counted = loaded
+
+    def _decide(self, index: int, skip: bool, choice: Optional[int] = None):
+        self._count_loaded()
+        left_out = self.decision(index) is None
+        if skip:
+            self._selected.discard(index)
+            self._skipped.add(index)
+        else:
+            self._skipped.discard(index)
+            self._selected.add(index)
+            if choice is not None:
+                self._choices[index] = choice
+        self._left_out += (self.decision(index) is None) - left_out
+
+    def _select(self, index: int):
+        self._decide(index, skip=False)
+
+    def _skip(self, index: int):
+        self._decide(index, skip=True)
+
+    def _choose(self, index: int, choice: int):
+        self._decide(index, skip=False, choice=choice)
+
+    def _move(self, position: int):
+        available = self.view.load(max(position, 0) + 1)
+        self.cursor = min(max(position, 0), max(available - 1, 0))
+        self._scroll()
+
+    def _scroll(self):
+        if self.cursor < self.top:
+            self.top = self.cursor
+        elif self.cursor >= self.top + self.rows:
+            self.top = self.cursor - self.rows + 1
+
+    def _current(self) -> Optional[int]:
+        if self.view.load(self.cursor + 1) <= self.cursor:
+            return None
+        return self.view[self.cursor]
+
+    def _end(self):
+        # The view has to be scanned to its end to find it
+        self.view.load(sys.maxsize)
+        self._move(len(self.view) - 1)
+
+    def _set_all(self, skip: bool):
+        undecided = 0
+        for index in self.view:
+            if skip:
+                self._skip(index)
+            elif self._undecided(index):
+                undecided += 1
+            else:
+                self._select(index)
+        state = "Skipped" if skip else "Selected"
+        self.message = f"{state} all {len(self.view) - undecided} items"
+        if undecided:
+            self.message += f", {undecided} with several choices need one picked"
+
+    def _find(self, query: str, start: int):
+        query = query.lower()
+        position = start
+        while self.view.load(position + 1) > position:
+            if query in self.items[self.view[position]].label.lower():
+                self._move(position)
+                self.message = ""
+                return
+            position += 1
+        self.message = f"No more items with: {query}"
+
+    def _filter(self, query: str):
+        current = self._current()
+        self.view = View(self.items, query)
+        self.cursor = self.top = 0
+        if current is not None:
+            # Stay on the same item if it matches the filter
+            for position in range(self.view.load(current + 1)):
+                if self.view[position] == current:
+                    self._move(position)
+                    break
+        self.message = ""
+
+    def _edit(self, key: str):
+        kind, text = self._input
+        if key == "enter":
+            self._input = None
+            if kind == "/":
+                self._search = text
+                self._find(text, self.cursor)
+            else:
+                self._filter(text)
+        elif key == "esc":
+            self._input = None
+        elif key == "backspace":
+            self._input = (kind, text[:-1])
+        elif len(key) == 1 and key.isprintable():
+            self._input = (kind, text + key)
+
+    def handle(self, key: str) -> Optional[bool]:
+        """Handle a key, return True once decisions are confirmed, False if cancelled."""
+        if self._input is not None:
+            self._edit(key)
+            return None
+        key = ALIASES.get(key, key)
+        index = self._current()
+        if key in ["q", "esc"]:
+            return False
+        elif key == "enter":
+            return True
+        elif key == "up":
+            self._move(self.cursor - 1)
+        elif key == "down":
+            self._move(self.cursor + 1)
+        elif key == "page up":
+            self._move(self.cursor - self.rows)
+        elif key == "page down":
+            self._move(self.cursor + self.rows)
+        elif key == "home":
+            self._move(0)
+        elif key == "end":
+            self._end()
+        elif key == " " and index is not None:
+            # Selecting an undecided item picks the choice it shows
+            if self.decision(index) is None:
+                self._select(index)
+            else:
+                self._skip(index)
+            self._move(self.cursor + 1)
+        elif key == "tab" and index is not None:
+            choices = self.items[index].choices
+            if choices:
+                choice = self.decision(index)
+                if choice is None:
+                    self._select(index)
+                else:
+                    self._choose(index, (choice + 1) % len(choices))
+        elif key in ["a", "x"]:
+            self._set_all(skip=key == "x")
+        elif key in ["/", "f"]:
+            self._input = (key, "" if key == "/" else self.view.query)
+        elif key == "n" and self._search:
+            self._find(self._search, self.cursor + 1)
+        return None
+
+    def _row(self, position: int) -> str:
+        index = self.view[position]
+        item = self.items[index]
+        choice = self.decision(index)
+        if choice is not None:
+            mark = "x"
+        else:
+            mark = "?" if self._undecided(index) else " "
+        text = f"[{mark}] {item.label}"
+        if item.choices:
+            chosen = item.choices[choice or 0]
+            more = f" ({(choice or 0) + 1}/{len(item.choices)})"
+            text += f" -> {chosen}{more if len(item.choices) > 1 else ''}"
+        text = _fit(text, self.width)
+        if position == self.cursor:
+            style = CURSOR_STYLE
+        elif choice is None:
+            style = SKIPPED_STYLE
+        else:
+            return text
+        return f"{style.start}{text}{style.end}"
+
+    def render(self) -> List[str]:
+        """Return lines of the screen, with only the visible items rendered."""
+        visible = self.view.load(self.top + self.rows)
+        lines = [f"{TITLE_STYLE.start}{_fit(self.title, self.width)}{TITLE_STYLE.end}"]
+        lines.extend(
+            self._row(p) for p in range(self.top, min(visible, self.top + self.rows))
+        )
+        lines.extend("" for _ in range(self.rows - (len(lines) - 1)))
+        if self._input is not None:
+            kind, text = self._input
+            status = f"{'Search' if kind == '/' else 'Filter'}: {text}"
+        else:
+            total = f"{len(self.view)}{'' if self.view.exhausted else '+'}"
+            status = f"{min(self.cursor + 1, len(self.view))}/{total}"
+            self._count_loaded()
+            status += f" · {self._left_out} skipped"
+            if self.view.query:
+                status += f" · filter: {self.view.query}"
+            if self.message:
+                status += f" · {self.message}"
+        lines.append(
+            f"{STATUS_STYLE.start}{_fit(status, self.width)}{STATUS_STYLE.end}"
+        )
+        lines.append(_fit(HELP, self.width))
+        return lines
+
+    def selected(self) -> Iterator[Tuple[ReviewItem, Optional[str]]]:
+        """Generate all items that weren't skipped with their chosen choices."""
+        index = 0
+        while self.items.load(index + 1) > index:
+            choice = self.decision(index)
+            if choice is not None:
+                item = self.items[index]
+                yield item, item.choices[choice] if item.choices else None
+            index += 1
+
+
+def available() -> bool:
+    """Tell if the review screen can be shown, i.e. teeb runs in a terminal."""
+    try:
+        import termios  # noqa: F401
+    except ImportError:  # Not available on Windows
+        return False
+    return (
+        sys.stdin.isatty()
+        and sys.stdout.isatty()
+        and threading.current_thread() is threading.main_thread()
+    )
+
+
+def _utf8_length(lead: int) -> int:
+    if lead >= 0xF0:
+        return 4
+    if lead >= 0xE0:
+        return 3
+    if lead >= 0xC0:
+        return 2
+    return 1
+
+
+def split_keys(data: bytes) -> List[str]:
+    """Split terminal input into keys, e.g. repeated or pasted ones read at once."""
+    keys = []
+    position = 0
+    while position < len(data):
+        if data[position : position + 1] == b"\x1b":
+            for length in (4, 3, 2):
+                sequence = data[position : position + length]
+                if len(sequence) == length and sequence in KEYS:
+                    keys.append(KEYS[sequence])
+                    position += length
+                    break
+            else:
+                if data[position + 1 : position + 2] in [b"[", b"O"]:
+                    # Unknown sequence, e.g. F5, ends with its first letter or ~
+                    end = position + 2
+                    while end < len(data) and not 0x40 <= data[end] <= 0x7E:
+                        end += 1
+                    position = end + 1
+                else:
+                    keys.append("esc")
+                    position += 1
+            continue
+        single = data[position : position + 1]
+        if single in KEYS:
+            keys.append(KEYS[single])
+            position += 1
+            continue
+        length = _utf8_length(data[position])
+        keys.append(data[position : position + length].decode("utf-8", "replace"))
+        position += length
+    return keys
+
+
+def read_keys(fd: int) -> List[str]:
+    """Read all keys waiting in the terminal."""
+    return split_keys(os.read(fd, 1024))
+
+
+def review(
+    items: Iterable[ReviewItem],
+    *,
+    title: str,
+    read: Callable[[int], List[str]] = read_keys,
+) -> Optional[List[Tuple[ReviewItem, Optional[str]]]]:
+    """Show the review screen & return selected items with chosen choices.
+
+    Returns None if the user cancelled the review.
+    """
+    import termios
+    import tty
+
+    fd = sys.stdin.fileno()
+    stdout = sys.stdout
+    screen = Review(items, title=title)
+    settings = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        # Alternate screen without cursor, the terminal is restored afterwards
+        stdout.write("\033[?1049h\033[?25l")
+        confirmed = None
+        while True:
+            size = shutil.get_terminal_size()
+            screen.resize(size.lines, size.columns)
+            stdout.write("\033[H" + "\033[K\n".join(screen.render()) + "\033[K")
+            stdout.flush()
+            # Keys read at once are handled before the screen is drawn again
+            for key in read(fd):
+                confirmed = screen.handle(key)
+                if confirmed is not None:
+                    break
+            if confirmed is not None:
+                break
+    finally:
+        stdout.write("\033[?25h\033[?1049l")
+        stdout.flush()
+        termios.tcsetattr(fd, termios.TCSADRAIN, settings)
+    if not confirmed:
+        return None
+    return list(screen.selected())
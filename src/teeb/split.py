@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Run CUE splitter jobs concurrently.
+
+Splitting an album image is mostly decoding & encoding audio, so on a multi-core
+machine several images can be split at once. Splitter is started with a list of
+arguments rather than through a shell, so paths with quotes or spaces in them don't
+need any escaping. Output of every job is saved to a log file.
+When flacon isn't installed, WAV images are split with teeb's own splitter.
+"""
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import (
+    Iterator,
+    List,
+)
+
+from teeb.cache import default_cache_dir
+from teeb.data_type import SplitJob
+from teeb.wavsplit import (
+    WavError,
+    split_wav_image,
+)
+
+# Kill a splitter that takes longer than that, in seconds
+DEFAULT_TIMEOUT = 3600
+# Name of the built-in WAV splitter used in place of an external program
+NATIVE_SPLITTER = "teeb-wavsplit"
+
+
+def default_log_dir() -> str:
+    return os.path.join(default_cache_dir(), "logs", time.strftime("%Y%m%d-%H%M%S"))
+
+
+def splitter_name(job: SplitJob) -> str:
+    """Return a human readable name of the splitter running a job."""
+    if job.argv[0] == NATIVE_SPLITTER:
+        return "Built-in WAV splitter"
+    if os.path.basename(job.argv[0]) == "flacon":
+        return "Flacon"
+    return job.argv[0]
+
+
+def flacon_job(cue_path: str) -> SplitJob:
+    return SplitJob(cue_path=cue_path, argv=["flacon", "-s", cue_path])
+
+
+def native_job(cue_path: str) -> SplitJob:
+    return SplitJob(cue_path=cue_path, argv=[NATIVE_SPLITTER, cue_path])
+
+
+def split_job(cue_path: str) -> SplitJob:
+    """Split with flacon if it's installed or with the built-in WAV splitter."""
+    if shutil.which("flacon"):
+        return flacon_job(cue_path)
+    return native_job(cue_path)
+
+
+def _log_path(log_dir: str, number: int, cue_path: str) -> str:
+    name = re.sub(r"[^\w.-]", "_", os.path.basename(cue_path))
+    return os.path.join(log_dir, f"{number:04}-{name}.log")
+
+
+def _run_native(job: SplitJob, log):
+    """Split WAV image(s) in-process & log names of written tracks.
+
+    Any error, e.g. from a malformed Cue Sheet, fails only this job, just like a
+    non-zero exit code of an external splitter would.
+    """
+    try:
+        for path in split_wav_image(job.cue_path):
+            log.write(f"Wrote: {path}\n".encode())
+        job.returncode = 0
+    except (WavError, OSError) as err:
+        log.write(f"{err}\n".encode())
+        job.error = f"{err}"
+    except Exception as err:  # e.g. a malformed INDEX entry
+        job.error = f"{type(err).__name__}: {err}"
+        log.write(f"{job.error}\n".encode())
+
+
+def run_job(job: SplitJob, *, timeout: float = DEFAULT_TIMEOUT, log_dir: str = None):
+    """Run a splitter and save its combined stdout & stderr to a log file.
+
+    Built-in splitter isn't subject to the timeout as it only copies data.
+    """
+    if job.log_path is None:
+        job.log_path = _log_path(log_dir or default_log_dir(), 0, job.cue_path)
+    os.makedirs(os.path.dirname(job.log_path), exist_ok=True)
+    print(f"Executing: {' '.join(job.argv)}")
+    start = time.monotonic()
+    with open(job.log_path, "wb") as log:
+        if job.argv[0] == NATIVE_SPLITTER:
+            _run_native(job, log)
+            job.duration = time.monotonic() - start
+            return job
+        try:
+            completed = subprocess.run(
+                job.argv,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                timeout=timeout,
+            )
+            job.returncode = completed.returncode
+        except subprocess.TimeoutExpired:
+            job.error = f"timed out after {timeout} seconds"
+        except OSError as err:
+            job.error = f"{err}"
+    job.duration = time.monotonic() - start
+    return job
+
+
+def run_jobs(
+    jobs: List[SplitJob],
+    *,
+    workers: int = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    log_dir: str = None,
+) -> Iterator[SplitJob]:
+    """Run up to `workers` jobs at once.
+
+    Jobs are generated as soon as they finish, so the caller can act on results,
+    e.g. delete source files of a successfully split image, while others still run.
+    """
+    workers = workers or os.cpu_count() or 1
+    log_dir = log_dir or default_log_dir()
+    for number, job in enumerate(jobs):
+        job.log_path = _log_path(log_dir, number, job.cue_path)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, job, timeout=timeout) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def summary(jobs: List[SplitJob]) -> str:
+    failed = [job for job in jobs if not job.succeeded]
+    lines = [
+        f"Split {len(jobs) - len(failed)} of {len(jobs)} CUE files in "
+        f"{sum(job.duration for job in jobs):.0f}s of splitter time"
+    ]
+    for job in failed:
+        reason = job.error or f"exit code {job.returncode}"
+        lines.append(f"* Failed '{job.cue_path}': {reason}, see: {job.log_path}")
+    return "\n".join(lines)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Ask about findings as soon as they're found.
+
+Normally every step searches the whole library, prints all it has found & only then
+asks what to do with it, so on a big library the first question comes after minutes
+of silence. In streaming mode the search runs in a background thread & its findings
+are grouped by album, i.e. the top-level sub-directory of the searched directory.
+A group is handed over as soon as the search moves on to another album, it grows to
+a chunk size or nothing new was found for a moment, so the user can answer the first
+question while the rest of the library is still being searched.
+"""
+import os
+import queue
+import threading
+from typing import (
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+)
+
+DEFAULT_CHUNK_SIZE = 50
+# Seconds to wait for more findings in the same album before asking about it
+FLUSH_AFTER = 0.5
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def album_of(path: str, directory: str) -> str:
+    """Return top-level sub-directory of given directory with the path in it.
+
+    Files & directories right in the given directory belong to it.
+    """
+    parts = os.path.relpath(path, directory).split(os.sep)
+    if len(parts) == 1:
+        return directory
+    return os.path.join(directory, parts[0])
+
+
+def stream_groups(
+    found: Iterable[str],
+    directory: str,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    flush_after: float = FLUSH_AFTER,
+) -> Iterator[Tuple[str, List[str]]]:
+    """Generate (album, paths) groups while paths are still being found.
+
+    found is consumed in a background thread & it should generate paths album by
+    album, like finders walking top-down do. An album with more than chunk_size
+    findings is split into several groups. When the generator is closed, e.g.
+    because the user chose to quit, the search stops after its next finding.
+    """
+    findings: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    def search():
+        try:
+            for path in found:
+                if stop.is_set():
+                    return
+                findings.put(path)
+        except BaseException as err:
+            findings.put(_Failed(err))
+        finally:
+            findings.put(_DONE)
+
+    threading.Thread(target=search, name="stream", daemon=True).start()
+    album, paths = None, []
+    try:
+        while True:
+            try:
+                item = findings.get(timeout=flush_after if paths else None)
+            except queue.Empty:
+                yield album, paths
+                paths = []
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, _Failed):
+                raise item.error
+            item_album = album_of(item, directory)
+            if paths and (item_album != album or len(paths) >= chunk_size):
+                yield album, paths
+                paths = []
+            album = item_album
+            paths.append(item)
+        if paths:
+            yield album, paths
+    finally:
+        stop.set()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""Move files between file systems without copying data through user space.
+
+rename() fails with EXDEV when source & target are on different mounts, e.g. when
+an album_art dir is a bind mount or lives on another ZFS/btrfs dataset. Data is
+then copied with the cheapest method the kernel supports:
+
+1. FICLONE ioctl, which shares extents on reflink capable file systems, e.g. btrfs,
+   XFS & bind mounts of the same file system, so no data is copied at all,
+2. copy_file_range(), which copies in kernel & can offload the copy to NFS/SMB
+   servers,
+3. sendfile(), which copies in kernel,
+4. plain read() & write() of large chunks as the last resort.
+
+Copies keep permissions & timestamps. Their size is checked against the source & they
+are fsync'ed before the source is removed.
+"""
+import errno
+import os
+import shutil
+import stat
+import sys
+from typing import Optional
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+CHUNK_SIZE = 1024**2
+
+# Errors meaning that a copy method isn't supported for a pair of files
+_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EBADF,
+    errno.EPERM,
+}
+
+
+def _short_copy(copied: int, size: int) -> bool:
+    """Handle end of data reported before the whole file was copied.
+
+    Some file systems, e.g. FUSE, CIFS or overlayfs, report it right away when
+    they don't support a copy method, so the next one is tried. End of data in
+    the middle of a copy means the source was truncated while it was copied.
+    """
+    if copied == 0:
+        return False
+    raise OSError(errno.EIO, f"Copied only {copied} of {size} bytes")
+
+
+def _reflink(source_fd: int, target_fd: int, size: int) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    try:
+        fcntl.ioctl(target_fd, FICLONE, source_fd)
+    except OSError as err:
+        if err.errno in _UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _copy_file_range(source_fd: int, target_fd: int, size: int) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+    copied = 0
+    while copied < size:
+        try:
+            sent = os.copy_file_range(source_fd, target_fd, min(size - copied, 2**30))
+        except OSError as err:
+            if copied == 0 and err.errno in _UNSUPPORTED:
+                return False
+            raise
+        if sent == 0:
+            return _short_copy(copied, size)
+        copied += sent
+    return True
+
+
+def _sendfile(source_fd: int, target_fd: int, size: int) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    copied = 0
+    while copied < size:
+        try:
+            sent = os.sendfile(
+                target_fd, source_fd, copied, min(size - copied, 2**30)
+            )
+        except OSError as err:
+            if copied == 0 and err.errno in _UNSUPPORTED:
+                return False
+            raise
+        if sent == 0:
+            return _short_copy(copied, size)
+        copied += sent
+    return True
+
+
+def _chunked(source_fd: int, target_fd: int, size: int) -> bool:
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        read = os.readv(source_fd, [buffer])
+        if not read:
+            return True
+        written = 0
+        while written < read:
+            written += os.write(target_fd, view[written:read])
+
+
+COPY_METHODS = [
+    ("reflink", _reflink),
+    ("copy_file_range", _copy_file_range),
+    ("sendfile", _sendfile),
+    ("chunked", _chunked),
+]
+
+
+def copy_file(source: str, target: str) -> str:
+    """Copy a file with its permissions & timestamps & fsync it.
+
+    Target must not exist. Returns the name of the copy method that was used.
+    """
+    source_fd = os.open(source, os.O_RDONLY)
+    try:
+        source_stat = os.fstat(source_fd)
+        target_fd = os.open(
+            target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, source_stat.st_mode & 0o777
+        )
+        try:
+            for method, copy in COPY_METHODS:
+                if copy(source_fd, target_fd, source_stat.st_size):
+                    break
+                os.lseek(source_fd, 0, os.SEEK_SET)
+                os.lseek(target_fd, 0, os.SEEK_SET)
+                os.ftruncate(target_fd, 0)
+            else:
+                raise OSError(errno.ENOTSUP, "No copy method is supported", source)
+            copied = os.fstat(target_fd).st_size
+            if copied != source_stat.st_size:
+                raise OSError(
+                    errno.EIO,
+                    f"Copied {copied} of {source_stat.st_size} bytes with {method}",
+                    source,
+                )
+            os.fsync(target_fd)
+        except BaseException:
+            os.close(target_fd)
+            os.remove(target)
+            raise
+        os.close(target_fd)
+    finally:
+        os.close(source_fd)
+    shutil.copystat(source, target, follow_symlinks=False)
+    return method
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:  # Not supported by some file systems
+        pass
+    finally:
+        os.close(fd)
+
+
+def _copy(source: str, target: str):
+    if os.path.islink(source):
+        os.symlink(os.readlink(source), target)
+    else:
+        copy_file(source, target)
+
+
+def move_across_devices(source: str, target: str) -> Optional[str]:
+    """Copy a file or a directory to another file system & remove the source.
+
+    Returns copy method used for a file or None for a directory or a symlink.
+    Partially copied target is removed if the copy fails.
+    """
+    if os.path.lexists(target):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+    source_stat = os.lstat(source)
+    method = None
+    try:
+        if stat.S_ISDIR(source_stat.st_mode):
+            shutil.copytree(source, target, symlinks=True, copy_function=_copy)
+        elif stat.S_ISLNK(source_stat.st_mode):
+            os.symlink(os.readlink(source), target)
+        else:
+            method = copy_file(source, target)
+    except BaseException:
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target, ignore_errors=True)
+        raise
+    _fsync_dir(os.path.dirname(os.path.abspath(target)))
+    if stat.S_ISDIR(source_stat.st_mode):
+        shutil.rmtree(source)
+    else:
+        os.remove(source)
+    return method
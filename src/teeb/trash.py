@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Trash bin implementing the freedesktop.org Trash specification.
+
+send2trash resolves the trash directory, looks for a free name & writes trashinfo
+from scratch for every single file. Here a trash directory is resolved once per
+file system & names already taken in it are listed once, so trashing a file costs
+an lstat(), a single write of its trashinfo & a rename().
+Files are only ever renamed into a trash directory on their own file system, i.e.
+the home trash or a $topdir/.Trash/$uid or $topdir/.Trash-$uid one. On platforms
+other than Linux & BSD, or when no such directory can be used, send2trash is used.
+A bind mount has the same st_dev as the file system it's mounted from, yet files
+can't be renamed across it, so they're copied to the trash directory instead.
+"""
+import errno
+import os
+import stat
+import sys
+import threading
+import time
+from typing import (
+    Dict,
+    Iterable,
+    Optional,
+    Set,
+)
+from urllib.parse import quote
+
+from send2trash import send2trash
+
+from teeb.transfer import move_across_devices
+
+# Platforms following the freedesktop.org Trash specification
+FREEDESKTOP_PLATFORMS = ("linux", "freebsd", "openbsd", "netbsd")
+
+
+def home_trash_dir() -> str:
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "share"
+    )
+    return os.path.join(data_home, "Trash")
+
+
+def human_size(size: int) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TiB"
+
+
+def trash_info_path(trashed: str) -> str:
+    """Return path to the trashinfo file of a file in trash bin."""
+    trash_dir = os.path.dirname(os.path.dirname(trashed))
+    return os.path.join(trash_dir, "info", f"{os.path.basename(trashed)}.trashinfo")
+
+
+def _size(path: str, path_stat: os.stat_result) -> int:
+    if not stat.S_ISDIR(path_stat.st_mode):
+        return path_stat.st_size
+    total = 0
+    for sub_dir, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(sub_dir, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _mount_point(path: str) -> str:
+    path = os.path.realpath(path)
+    device = os.lstat(path).st_dev
+    while path != os.path.dirname(path):
+        parent = os.path.dirname(path)
+        if os.lstat(parent).st_dev != device:
+            break
+        path = parent
+    return path
+
+
+def _make_dirs(path: str) -> bool:
+    try:
+        for sub_dir in ["files", "info"]:
+            os.makedirs(os.path.join(path, sub_dir), mode=0o700, exist_ok=True)
+    except OSError:
+        return False
+    return os.access(path, os.W_OK)
+
+
+class TrashDir:
+    """A single trash directory with an in-memory set of names already in use."""
+
+    def __init__(self, path: str, top_dir: str = None):
+        self.path = path
+        # Paths in trashinfo files in top directory trashes are relative to it
+        self.top_dir = top_dir
+        self._files_dir = os.path.join(path, "files")
+        self._info_dir = os.path.join(path, "info")
+        # Real paths of directories files were trashed from
+        self._real_dirs: Dict[str, str] = {}
+        self._taken: Set[str] = set(os.listdir(self._files_dir))
+        self._taken.update(
+            name[: -len(".trashinfo")] for name in os.listdir(self._info_dir)
+        )
+
+    def _names(self, name: str) -> Iterable[str]:
+        yield name
+        stem, extension = os.path.splitext(name)
+        number = 2
+        while True:
+            yield f"{stem}.{number}{extension}"
+            number += 1
+
+    def _reserve(self, name: str, info: bytes) -> str:
+        """Create trashinfo file for the first free name & return that name."""
+        for candidate in self._names(name):
+            if candidate in self._taken:
+                continue
+            info_path = f"{self._info_dir}{os.sep}{candidate}.trashinfo"
+            try:
+                fd = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:  # Trashed by someone else in the meantime
+                self._taken.add(candidate)
+                continue
+            try:
+                os.write(fd, info)
+            finally:
+                os.close(fd)
+            self._taken.add(candidate)
+            return candidate
+        raise AssertionError("unreachable")
+
+    def trash(self, path: str) -> str:
+        """Move a file or a directory to this trash & return its new path.
+
+        Path has to be absolute.
+        """
+        directory, name = os.path.split(path)
+        real_dir = self._real_dirs.get(directory)
+        if real_dir is None:
+            real_dir = self._real_dirs[directory] = os.path.realpath(directory)
+        original = os.path.join(real_dir, name)
+        if self.top_dir is not None:
+            original = os.path.relpath(original, self.top_dir)
+        info = (
+            "[Trash Info]\n"
+            f"Path={quote(original)}\n"
+            f"DeletionDate={time.strftime('%Y-%m-%dT%H:%M:%S')}\n"
+        ).encode()
+        name = self._reserve(name, info)
+        trashed = f"{self._files_dir}{os.sep}{name}"
+        try:
+            try:
+                os.rename(path, trashed)
+            except OSError as err:
+                if err.errno != errno.EXDEV:
+                    raise
+                move_across_devices(path, trashed)
+        except OSError:
+            os.remove(os.path.join(self._info_dir, f"{name}.trashinfo"))
+            self._taken.discard(name)
+            raise
+        return trashed
+
+
+class Trash:
+    """Trash bin with trash directories resolved once per file system."""
+
+    def __init__(self, home: str = None):
+        self.home = home or home_trash_dir()
+        self.trashed = 0
+        self.size = 0
+        self._trash_dirs: Dict[int, Optional[TrashDir]] = {}
+        # Albums processed concurrently share a trash bin
+        self._lock = threading.Lock()
+
+    def _top_dir_trash(self, top_dir: str) -> Optional[TrashDir]:
+        uid = os.getuid()
+        shared = os.path.join(top_dir, ".Trash")
+        try:
+            shared_stat = os.lstat(shared)
+        except OSError:
+            shared_stat = None
+        if (
+            shared_stat is not None
+            and stat.S_ISDIR(shared_stat.st_mode)
+            and shared_stat.st_mode & stat.S_ISVTX
+        ):
+            path = os.path.join(shared, str(uid))
+            if _make_dirs(path):
+                return TrashDir(path, top_dir)
+        path = os.path.join(top_dir, f".Trash-{uid}")
+        if _make_dirs(path):
+            return TrashDir(path, top_dir)
+        return None
+
+    def _trash_dir(self, device: int, path: str) -> Optional[TrashDir]:
+        if device in self._trash_dirs:
+            return self._trash_dirs[device]
+        trash_dir = None
+        if sys.platform.startswith(FREEDESKTOP_PLATFORMS):
+            if _make_dirs(self.home) and os.stat(self.home).st_dev == device:
+                trash_dir = TrashDir(self.home)
+            else:
+                trash_dir = self._top_dir_trash(_mount_point(os.path.dirname(path)))
+        self._trash_dirs[device] = trash_dir
+        return trash_dir
+
+    def trash(self, path: str) -> Optional[str]:
+        """Move a file or a directory to trash bin.
+
+        Returns its path in the trash bin or None if it was trashed by send2trash.
+        """
+        path = os.path.abspath(path)
+        path_stat = os.lstat(path)
+        size = _size(path, path_stat)
+        with self._lock:
+            trash_dir = self._trash_dir(path_stat.st_dev, path)
+        trashed = None
+        if trash_dir is None:
+            send2trash(path)
+        else:
+            trashed = trash_dir.trash(path)
+        with self._lock:
+            self.trashed += 1
+            self.size += size
+        return trashed
+
+    def summary(self) -> Optional[str]:
+        if not self.trashed:
+            return None
+        return (
+            f"Moved {self.trashed} files & directories to trash, "
+            f"{human_size(self.size)} can be reclaimed by emptying it"
+        )
+
+
+# Trash bin used by teeb.fileops, see default_trash()
+_trash: Optional[Trash] = None
+_trash_lock = threading.Lock()
+
+
+def default_trash() -> Trash:
+    """Return shared trash bin, a new one if user's home trash has changed."""
+    global _trash
+    with _trash_lock:
+        if _trash is None or _trash.home != home_trash_dir():
+            _trash = Trash()
+        return _trash
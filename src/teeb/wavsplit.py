@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""Split WAV album images into tracks without an external splitter.
+
+Source image is memory mapped & every track is written straight from a slice of its
+PCM data, so no audio is decoded or copied in between and splitting runs at disk
+speed. Track boundaries come from INDEX entries of the Cue Sheet converted to sample
+frames with the sample rate read from the WAV header, as not every image is 44.1kHz
+CD audio.
+"""
+import logging
+import mmap
+import os
+import re
+import struct
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from teeb.cueparser import (
+    CueParser,
+    CueTrack,
+    timestr_to_samples,
+)
+from teeb.data_type import WavFormat
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavError(Exception):
+    """Raised when an image can't be split natively, e.g. it's not a PCM WAV file."""
+
+
+def read_wav_format(buffer) -> WavFormat:
+    """Find audio format & PCM data in a buffer with contents of a WAV file."""
+    if len(buffer) < 12 or buffer[:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+        raise WavError("Not a RIFF WAVE file")
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(buffer):
+        chunk_id = bytes(buffer[offset : offset + 4])
+        (size,) = struct.unpack_from("<I", buffer, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if size < 16:
+                raise WavError(f"Truncated fmt chunk: {size} bytes")
+            fmt_chunk = bytes(buffer[body : body + size])
+            tag, channels, sample_rate, _, block_align, _ = struct.unpack_from(
+                "<HHIIHH", fmt_chunk
+            )
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                # First 2 bytes of SubFormat GUID hold the actual format tag
+                (tag,) = struct.unpack_from("<H", fmt_chunk, 24)
+            if tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+                raise WavError(f"Unsupported WAV format tag: {tag:#06x}")
+            if not sample_rate or not block_align:
+                raise WavError("Invalid sample rate or block alignment")
+            fmt = (fmt_chunk, sample_rate, channels, block_align)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WavError("data chunk found before fmt chunk")
+            # Size of streamed or truncated files can't be trusted
+            data_size = min(size, len(buffer) - body)
+            fmt_chunk, sample_rate, channels, block_align = fmt
+            return WavFormat(
+                fmt_chunk=fmt_chunk,
+                sample_rate=sample_rate,
+                channels=channels,
+                block_align=block_align,
+                data_offset=body,
+                data_size=data_size - data_size % block_align,
+            )
+        offset = body + size + (size & 1)
+    raise WavError("No data chunk found")
+
+
+def wav_header(fmt: WavFormat, data_size: int) -> bytes:
+    """Return header of a WAV file with PCM data of given size."""
+    fmt_chunk = fmt.fmt_chunk + b"\0" * (len(fmt.fmt_chunk) & 1)
+    riff_size = 4 + 8 + len(fmt_chunk) + 8 + data_size + (data_size & 1)
+    return b"".join(
+        [
+            b"RIFF",
+            struct.pack("<I", riff_size),
+            b"WAVE",
+            b"fmt ",
+            struct.pack("<I", len(fmt.fmt_chunk)),
+            fmt_chunk,
+            b"data",
+            struct.pack("<I", data_size),
+        ]
+    )
+
+
+def track_ranges(
+    tracks: List[CueTrack], fmt: WavFormat
+) -> List[Tuple[CueTrack, int, int]]:
+    """Return tracks with offsets of their first & last byte of PCM data.
+
+    Each track starts at its INDEX 01, or INDEX 00 without it, as recorded by
+    CueParser. It ends where the next one starts & the last one at the end of data.
+    """
+    starts = []
+    for track in tracks:
+        index = track.get("INDEX")
+        if not index:
+            raise WavError(f"No INDEX for track: {track.get('TRACK_NUM')}")
+        samples = timestr_to_samples(index, sample_rate=fmt.sample_rate)
+        starts.append(min(samples * fmt.block_align, fmt.data_size))
+    ends = starts[1:] + [fmt.data_size]
+    ranges = []
+    for track, start, end in zip(tracks, starts, ends):
+        if start >= end:
+            raise WavError(
+                f"Track {track.get('TRACK_NUM')} is empty or starts after the next "
+                f"one or past the end of audio data"
+            )
+        ranges.append((track, start, end))
+    return ranges
+
+
+def track_file_name(track: CueTrack, number: int) -> str:
+    track_num = track.get("TRACK_NUM") or number
+    title = re.sub(r'[\\/:*?"<>|\0]', "_", track.get("TITLE") or "")
+    return f"{track_num:02}_{title}.wav" if title else f"{track_num:02}.wav"
+
+
+def find_source(directory: str, name: str) -> Optional[str]:
+    """Find an audio image file referenced in a Cue Sheet.
+
+    Earlier steps might have already replaced spaces with underscores or changed
+    the case of the name.
+    """
+    for candidate in [name, name.replace(" ", "_")]:
+        path = os.path.join(directory, candidate)
+        if os.path.isfile(path):
+            return path
+    wanted = {name.lower(), name.replace(" ", "_").lower()}
+    for entry in os.listdir(directory):
+        if entry.lower() in wanted:
+            return os.path.join(directory, entry)
+    return None
+
+
+def tracks_by_source(cue: CueParser) -> Dict[str, List[CueTrack]]:
+    """Group tracks by the FILE they're stored in, keeping their order."""
+    sources: Dict[str, List[CueTrack]] = {}
+    for track in cue.tracks:
+        source = track.get("FILE") or cue.meta.get("FILE")
+        if not source:
+            raise WavError(f"No FILE for track: {track.get('TRACK_NUM')}")
+        sources.setdefault(source, []).append(track)
+    return sources
+
+
+def split_image(source: str, tracks: List[CueTrack], directory: str) -> List[str]:
+    """Write tracks of a single WAV image as separate files to given directory."""
+    written = []
+    with open(source, "rb") as image:
+        try:
+            mapped = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as err:  # e.g. empty file
+            raise WavError(f"Can't map '{source}': {err}") from None
+        with mapped:
+            with memoryview(mapped) as view:
+                fmt = read_wav_format(view)
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            ranges = track_ranges(tracks, fmt)
+            end_of_data = fmt.data_offset + fmt.data_size
+            with memoryview(mapped)[fmt.data_offset : end_of_data] as data:
+                for number, (track, start, end) in enumerate(ranges, start=1):
+                    path = os.path.join(directory, track_file_name(track, number))
+                    # Never overwrite an existing file
+                    with open(path, "xb") as track_file:
+                        track_file.write(wav_header(fmt, end - start))
+                        track_file.write(data[start:end])
+                        if (end - start) & 1:
+                            track_file.write(b"\0")
+                    logging.debug(f"Wrote {end - start} bytes of audio to: {path}")
+                    written.append(path)
+    return written
+
+
+def split_wav_image(cue_path: str, cue: CueParser = None) -> List[str]:
+    """Split WAV image(s) referenced by a Cue Sheet into tracks.
+
+    Tracks are written next to the Cue Sheet. All sources are checked before any
+    track is written, so a Cue Sheet referencing a non-WAV file is left untouched.
+    """
+    cue = cue or CueParser(cue_path)
+    directory = os.path.dirname(cue_path) or os.curdir
+    images = []
+    for name, tracks in tracks_by_source(cue).items():
+        source = find_source(directory, name)
+        if source is None:
+            raise WavError(f"Can't find audio file: {name}")
+        with open(source, "rb") as image:
+            header = image.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise WavError(f"Not a WAV file: {source}")
+        images.append((source, tracks))
+
+    written = []
+    for source, tracks in images:
+        written.extend(split_image(source, tracks, directory))
+    return written
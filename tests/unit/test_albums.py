@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for processing albums concurrently."""
+import threading
+from pathlib import Path
+
+import pytest
+
+from teeb.albums import (
+    album_directories,
+    process_albums,
+)
+from teeb.index import LibraryIndex
+from teeb.prompt import prompt
+
+
+def test_album_directories(tmp_path: Path):
+    for name in ["b", "a"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / "loose.flac").write_text("")
+
+    expected = [str(tmp_path / "a"), str(tmp_path / "b")]
+    assert album_directories(str(tmp_path)) == expected
+    index = LibraryIndex(str(tmp_path))
+    assert album_directories(str(tmp_path), index=index) == expected
+
+
+def test_albums_are_processed_while_questions_are_answered(monkeypatch, capsys):
+    slow_album_done = threading.Event()
+    questions = []
+
+    def answer(question: str) -> str:
+        # The slow album is done while the user still reads the question
+        assert slow_album_done.wait(timeout=5)
+        questions.append(question)
+        return "y"
+
+    monkeypatch.setattr("builtins.input", answer)
+
+    def process(album: str):
+        if album == "slow":
+            print("slow: converted")
+            slow_album_done.set()
+            return
+        print(f"{album}: found 2 files")
+        assert prompt("Delete them?", ["y", "n"]) == "y"
+        print(f"{album}: deleted 2 files")
+
+    assert process_albums(["first", "slow", "third"], process, workers=3) == 3
+
+    assert sorted(question.split("?")[0] for question in questions) == [
+        "[first] Delete them",
+        "[third] Delete them",
+    ]
+    printed = capsys.readouterr().out
+    assert sorted(printed.splitlines()) == [
+        "first: deleted 2 files",
+        "first: found 2 files",
+        "slow: converted",
+        "third: deleted 2 files",
+        "third: found 2 files",
+    ]
+    for album in ["first", "third"]:
+        assert printed.index(f"{album}: found") < printed.index(f"{album}: deleted")
+
+
+def test_quitting_stops_all_albums(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda question: "q")
+    started = []
+
+    def process(album: str):
+        started.append(album)
+        if prompt("Proceed?", ["y", "q"]) == "q":
+            raise SystemExit(0)
+
+    with pytest.raises(SystemExit):
+        process_albums([f"album {number}" for number in range(10)], process, workers=2)
+
+    assert len(started) < 10
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for finding visually identical album art."""
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+import teeb.arthash
+from teeb.arthash import (
+    ArtHasher,
+    cluster,
+    dhash,
+    hamming_distance,
+    redundant_album_art,
+)
+from teeb.cache import ScanCache
+from teeb.data_type import (
+    ArtCluster,
+    ArtHash,
+)
+
+try:
+    from wand.image import Image
+except ImportError:  # Wand raises it when ImageMagick library can't be found
+    Image = None
+
+requires_image_magick = pytest.mark.skipif(
+    Image is None, reason="ImageMagick is not installed"
+)
+
+
+def test_dhash_compares_neighbouring_pixels():
+    brighter_to_the_right = list(range(9)) * 8
+    darker_to_the_right = list(reversed(range(9))) * 8
+
+    assert dhash(brighter_to_the_right) == 0
+    assert dhash(darker_to_the_right) == 2**64 - 1
+    assert hamming_distance(0b1011, 0b0001) == 2
+
+
+def test_best_of_visually_identical_images_is_kept():
+    arts = [
+        ArtHash("folder.jpg", dhash=0b1111, width=500, height=500, size=60_000),
+        ArtHash("cover.png", dhash=0b1110, width=1000, height=1000, size=900_000),
+        ArtHash("front.bmp", dhash=0b0111, width=1000, height=1000, size=3_000_000),
+        ArtHash("cover.jpg", dhash=0b1111, width=1000, height=1000, size=200_000),
+        # Same hash, but a different shape, e.g. a CD label
+        ArtHash("cd.jpg", dhash=0b1111, width=1000, height=500, size=90_000),
+        ArtHash("back.jpg", dhash=2**64 - 1, width=1000, height=1000, size=90_000),
+    ]
+
+    assert cluster(arts) == [
+        ArtCluster(keep="front.bmp", redundant=["cover.jpg", "cover.png", "folder.jpg"])
+    ]
+
+
+def test_similar_images_dont_chain_into_a_cluster():
+    # Each image differs from the next one by 6 bits, the first & last by 12
+    arts = [
+        ArtHash("a.jpg", dhash=0, width=1000, height=1000, size=200_000),
+        ArtHash("b.png", dhash=0b111111, width=1000, height=1000, size=900_000),
+        ArtHash("c.jpg", dhash=0b111111111111, width=1000, height=1000, size=100),
+    ]
+
+    assert cluster(arts) == [ArtCluster(keep="b.png", redundant=["a.jpg"])]
+
+
+def test_hashes_are_cached(tmp_path: Path, monkeypatch):
+    album = tmp_path / "album"
+    album.mkdir()
+    hashes = {"cover.png": 0, "folder.jpg": 1, "back.jpg": 2**32 - 1}
+    an_hour_ago = time.time() - 3600
+    for name in hashes:
+        (album / name).write_bytes(name.encode())
+        os.utime(album / name, (an_hour_ago, an_hour_ago))
+    (album / "01.flac").write_bytes(b"")
+
+    def read_art_hash(path: str) -> ArtHash:
+        return ArtHash(path, hashes[os.path.basename(path)], 600, 600, 1)
+
+    monkeypatch.setattr(teeb.arthash, "read_art_hash", read_art_hash)
+    cache = ScanCache(str(tmp_path / "cache.sqlite3"))
+    hasher = ArtHasher(store=cache)
+
+    clusters = redundant_album_art([str(album / "cover.png")], hasher=hasher)
+    # Same size, so lossless png is kept
+    assert clusters == [
+        ArtCluster(keep=str(album / "cover.png"), redundant=[str(album / "folder.jpg")])
+    ]
+    assert (hasher.hits, hasher.misses) == (0, 3)
+
+    hasher = ArtHasher(store=cache)
+    assert redundant_album_art([str(album / "cover.png")], hasher=hasher) == clusters
+    assert hasher.summary() == "Album art cache: 3 hits, 0 images hashed"
+
+
+@requires_image_magick
+def test_same_picture_in_different_formats(tmp_path: Path):
+    paths = []
+    with Image(filename="plasma:", width=400, height=400) as picture:
+        for name, size in [("cover.png", 400), ("folder.jpg", 400), ("front.bmp", 200)]:
+            with picture.clone() as image:
+                image.resize(size, size)
+                image.save(filename=str(tmp_path / name))
+            paths.append(str(tmp_path / name))
+    with Image(filename="gradient:", width=400, height=400) as image:
+        image.save(filename=str(tmp_path / "back.jpg"))
+
+    assert redundant_album_art([str(tmp_path / "front.bmp")]) == [
+        ArtCluster(
+            keep=str(tmp_path / "cover.png"),
+            redundant=[str(tmp_path / "folder.jpg"), str(tmp_path / "front.bmp")],
+        )
+    ]
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the persistent directory listing & Cue Sheet cache."""
+import os
+import shutil
+import time
+from pathlib import Path
+
+from teeb.action import _parse_cue
+from teeb.cache import ScanCache
+from teeb.cueparser import (
+    CueCache,
+    CueParser,
+)
+from teeb.index import LibraryIndex
+
+
+def make_old_library(root: Path) -> Path:
+    """Create a library with directory mtimes set an hour back in the past.
+
+    Recently modified directories aren't cached, see teeb.cache.RACY_MTIME_WINDOW
+    """
+    for disc in ["cd1", "cd2"]:
+        (root / "album" / disc).mkdir(parents=True)
+        for track in range(1, 4):
+            (root / "album" / disc / f"{track:02}-track.flac").write_text("")
+    an_hour_ago = time.time() - 3600
+    for path, _, _ in os.walk(root):
+        os.utime(path, (an_hour_ago, an_hour_ago))
+    return root
+
+
+def test_unchanged_directories_are_read_from_cache(tmp_path):
+    library = str(make_old_library(tmp_path / "library"))
+    cache_path = str(tmp_path / "scan.sqlite3")
+
+    cache = ScanCache(cache_path)
+    first = list(LibraryIndex(library, cache=cache).walk())
+    cache.close()
+    assert (cache.hits, cache.misses) == (0, 4)
+
+    cache = ScanCache(cache_path)
+    second = list(LibraryIndex(library, cache=cache).walk())
+    cache.close()
+    assert (cache.hits, cache.misses) == (4, 0)
+    assert first == second
+
+
+def test_changed_directory_is_listed_again(tmp_path):
+    library = make_old_library(tmp_path / "library")
+    cache_path = str(tmp_path / "scan.sqlite3")
+    cache = ScanCache(cache_path)
+    LibraryIndex(str(library), cache=cache)
+    cache.close()
+
+    (library / "album" / "cd2" / "04-track.flac").write_text("")
+    an_hour_ago = time.time() - 3600
+    os.utime(library / "album" / "cd2", (an_hour_ago + 60, an_hour_ago + 60))
+
+    cache = ScanCache(cache_path)
+    index = LibraryIndex(str(library), cache=cache)
+    cache.close()
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert index.isfile(str(library / "album" / "cd2" / "04-track.flac"))
+
+
+def test_recently_modified_directories_are_not_cached(tmp_path):
+    (tmp_path / "library" / "album").mkdir(parents=True)
+    cache_path = str(tmp_path / "scan.sqlite3")
+    for _ in range(2):
+        cache = ScanCache(cache_path)
+        LibraryIndex(str(tmp_path / "library"), cache=cache)
+        cache.close()
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_clear_and_prune(tmp_path):
+    library = make_old_library(tmp_path / "library")
+    cache_path = str(tmp_path / "scan.sqlite3")
+    cache = ScanCache(cache_path)
+    LibraryIndex(str(library), cache=cache)
+    cache.clear(str(library / "album" / "cd1"))
+    index = LibraryIndex(str(library), cache=cache)
+    assert (cache.hits, cache.misses) == (3, 5)
+
+    for name in os.listdir(library / "album" / "cd2"):
+        os.remove(library / "album" / "cd2" / name)
+    os.rmdir(library / "album" / "cd2")
+    an_hour_ago = time.time() - 3600
+    os.utime(library / "album", (an_hour_ago + 60, an_hour_ago + 60))
+    index = LibraryIndex(str(library), cache=cache)
+    rows = cache._connection.execute("SELECT path FROM listings").fetchall()
+    cache.close()
+    assert not index.isdir(str(library / "album" / "cd2"))
+    assert sorted(path for (path,) in rows) == sorted(
+        os.path.abspath(path) for path, _, _ in os.walk(library)
+    )
+
+
+def test_parsed_cue_sheets_are_reused_until_they_change(
+    tmp_path, multiple_files_multiple_tracks
+):
+    cue_path = str(tmp_path / "album.cue")
+    shutil.copy(multiple_files_multiple_tracks, cue_path)
+    an_hour_ago = time.time() - 3600
+    os.utime(cue_path, (an_hour_ago, an_hour_ago))
+    cache_path = str(tmp_path / "scan.sqlite3")
+
+    cache = ScanCache(cache_path)
+    cues = CueCache(store=cache)
+    assert cues.parse(cue_path) is cues.parse(cue_path)
+    assert (cues.hits, cues.misses) == (1, 1)
+    cache.close()
+
+    cache = ScanCache(cache_path)
+    cues = CueCache(store=cache)
+    cached = cues.parse(cue_path)
+    assert (cues.hits, cues.misses) == (1, 0)
+    parsed = CueParser(cue_path)
+    assert cached.encoding == parsed.encoding
+    assert cached.meta == parsed.meta
+    assert [dict(track) for track in cached.tracks] == [
+        dict(track) for track in parsed.tracks
+    ]
+
+    with open(cue_path, "a") as cue_file:
+        cue_file.write("REM COMMENT changed\n")
+    assert cues.parse(cue_path).tracks[-1]["COMMENT"] == "changed"
+    assert cues.misses == 1
+    cache.close()
+
+
+def test_cue_sheets_are_parsed_without_a_cache(multiple_files_multiple_tracks):
+    cue = _parse_cue(multiple_files_multiple_tracks)
+    parsed = CueParser(multiple_files_multiple_tracks)
+    assert cue.meta == parsed.meta
+    assert len(cue.tracks) == len(parsed.tracks)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for resuming interrupted runs."""
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from teeb.checkpoint import (
+    FINISHED,
+    Checkpoint,
+    checkpoint_dir,
+    fingerprint,
+)
+from teeb.index import LibraryIndex
+
+
+def make_album(library: Path, name: str) -> str:
+    album = library / name
+    album.mkdir(parents=True)
+    (album / "01.flac").write_text(name)
+    return str(album)
+
+
+def test_fingerprint_changes_with_names_only(tmp_path: Path):
+    album = make_album(tmp_path, "Album")
+    before = fingerprint(album)
+
+    (tmp_path / "Album" / "01.flac").write_text("re-tagged")
+    assert fingerprint(album) == before
+    assert fingerprint(album, index=LibraryIndex(album)) == before
+    (tmp_path / "Album" / "01.flac").rename(tmp_path / "Album" / "01_track.flac")
+    assert fingerprint(album) != before
+
+
+def test_completed_steps_of_unchanged_albums_are_skipped(tmp_path: Path, capsys):
+    state = str(tmp_path / "checkpoint.json")
+    library = tmp_path / "library"
+    unchanged = make_album(library, "Unchanged")
+    changed = make_album(library, "Changed")
+    checkpoint = Checkpoint(str(library), path=state)
+    for album in [unchanged, changed]:
+        checkpoint.complete(album, "delete_extra_files")
+    checkpoint.complete(unchanged, FINISHED)
+    checkpoint.close()
+
+    (library / "Changed" / "rip.log").write_text("new file")
+    resumed = Checkpoint(str(library), path=state, resume=True)
+
+    assert resumed.done(unchanged, "delete_extra_files")
+    assert resumed.done(unchanged, FINISHED)
+    assert not resumed.done(changed, "delete_extra_files")
+    assert "Changed has changed since it was checkpointed" in capsys.readouterr().out
+    assert not Checkpoint(str(library), path=state).done(unchanged, FINISHED)
+
+
+def test_changes_of_interrupted_step_are_kept_on_close(tmp_path: Path):
+    state = str(tmp_path / "checkpoint.json")
+    album = make_album(tmp_path / "library", "Album")
+    checkpoint = Checkpoint(album, path=state)
+    checkpoint.complete(album, "delete_extra_files")
+
+    # Next step renames a file & the user quits before it's completed
+    (tmp_path / "library" / "Album" / "01.flac").rename(
+        tmp_path / "library" / "Album" / "01_track.flac"
+    )
+    checkpoint.close()
+
+    resumed = Checkpoint(album, path=state, resume=True)
+    assert resumed.done(album, "delete_extra_files")
+    assert not resumed.done(album, "normalise_names")
+
+
+def test_index_fingerprints_dont_stat_unchanged_directories(
+    tmp_path: Path, monkeypatch
+):
+    album = make_album(tmp_path, "Album")
+    (tmp_path / "Album" / "Scans").mkdir()
+    index = LibraryIndex(album)
+    before = fingerprint(album)
+    stat = os.stat
+    stated = []
+
+    def counting_stat(path, *args, **kwargs):
+        stated.append(path)
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr("os.stat", counting_stat)
+    assert fingerprint(album, index=index) == before
+    assert stated == []
+
+    os.rename(os.path.join(album, "01.flac"), os.path.join(album, "01_track.flac"))
+    index.rename(os.path.join(album, "01.flac"), os.path.join(album, "01_track.flac"))
+    monkeypatch.setattr("os.stat", stat)
+    assert fingerprint(album, index=index) == fingerprint(album)
+
+
+def test_steps_are_pending_only_in_changed_albums(tmp_path: Path):
+    state = str(tmp_path / "checkpoint.json")
+    library = tmp_path / "library"
+    albums = [make_album(library, "A"), make_album(library, "B")]
+    checkpoint = Checkpoint(str(library), path=state)
+    assert checkpoint.pending(str(library), albums, "normalise_names") is None
+    checkpoint.complete_library(str(library), albums, "normalise_names")
+    checkpoint.close()
+
+    (library / "B" / "rip.log").write_text("new file")
+    resumed = Checkpoint(str(library), path=state, resume=True)
+    assert resumed.pending(str(library), albums, "normalise_names") == [albums[1]]
+
+    # A new album changes the library directory itself
+    albums.append(make_album(library, "C"))
+    resumed = Checkpoint(str(library), path=state, resume=True)
+    assert resumed.pending(str(library), albums, "normalise_names") is None
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGHUP"), reason="POSIX signals only")
+def test_hangup_interrupts_the_run_cleanly(tmp_path: Path, monkeypatch):
+    library = tmp_path / "library"
+    make_album(library, "Album")
+    (library / "Album" / "setup.exe").write_text("extra file")
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(path for path in sys.path if path))
+    teeb = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "from teeb.__main__ import main; main()",
+            "-d",
+            str(library),
+            "--no-prefetch",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    output = b""
+    deadline = time.monotonic() + 30
+    while b"Delete all extra files?" not in output and time.monotonic() < deadline:
+        read = os.read(teeb.stdout.fileno(), 4096)
+        if not read:
+            break
+        output += read
+
+    teeb.send_signal(signal.SIGHUP)
+    output += teeb.communicate(timeout=30)[0]
+
+    assert b"was interrupted" in output
+    assert os.listdir(checkpoint_dir())
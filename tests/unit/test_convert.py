@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for album art conversion."""
+import os
+from pathlib import Path
+
+import pytest
+
+from teeb.convert import (
+    convert_to_jpg,
+    jpg_path,
+    memory_summary,
+    run_in_workers,
+)
+from teeb.data_type import (
+    Conversion,
+    SizeLimit,
+)
+
+try:
+    from wand.color import Color
+    from wand.image import Image
+except ImportError:  # Wand raises it when ImageMagick library can't be found
+    Image = None
+
+requires_image_magick = pytest.mark.skipif(
+    Image is None, reason="ImageMagick is not installed"
+)
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("album/cover.png", "album/cover.jpg"),
+        ("album/cover.TIFF", "album/cover.jpg"),
+        ("album/cover.png.bmp", "album/cover.png.jpg"),
+        ("./album.art/back.tif", "./album.art/back.jpg"),
+    ],
+)
+def test_jpg_path(path: str, expected: str):
+    assert jpg_path(path) == expected
+
+
+@requires_image_magick
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_to_jpg_reports_broken_files(tmp_path: Path, jobs: int):
+    paths = []
+    for name in ["cover.png", "back.bmp", "inlay.tif"]:
+        path = str(tmp_path / name)
+        with Image(width=8, height=8, background=Color("red")) as image:
+            image.save(filename=path)
+        paths.append(path)
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    paths.append(str(broken))
+
+    conversions = {c.source: c for c in convert_to_jpg(paths, jobs=jobs)}
+
+    assert conversions[str(broken)].error
+    for path in paths[:-1]:
+        assert conversions[path].error is None
+        assert os.path.isfile(conversions[path].target)
+
+
+def _exit_on_crash(path: str) -> str:
+    if path == "crash":
+        os._exit(1)  # Same as a worker killed by the OOM killer
+    return f"done {path}"
+
+
+def test_run_in_workers_fails_only_the_file_which_kills_its_worker(monkeypatch):
+    monkeypatch.setattr("teeb.convert.set_resource_limits", lambda **limits: None)
+    paths = ["crash"] + [f"{number}" for number in range(8)]
+
+    results = run_in_workers(
+        _exit_on_crash,
+        paths,
+        jobs=3,
+        memory_limit=0,
+        failed=lambda path, error: f"failed {path}",
+    )
+
+    assert sorted(results) == sorted(
+        [f"done {number}" for number in range(8)] + ["failed crash"]
+    )
+
+
+def test_run_in_workers_without_paths():
+    results = run_in_workers(
+        _exit_on_crash, [], jobs=3, memory_limit=0, failed=lambda path, error: path
+    )
+    assert list(results) == []
+
+
+@pytest.mark.parametrize(
+    "limit, size, expected",
+    [
+        (SizeLimit(), (6000, 4000), (6000, 4000)),
+        (SizeLimit(max_dimension=3000), (6000, 4000), (3000, 2000)),
+        (SizeLimit(max_dimension=3000), (2000, 4000), (1500, 3000)),
+        (SizeLimit(max_dimension=3000), (1000, 1000), (1000, 1000)),
+        (SizeLimit(max_megapixels=6), (6000, 4000), (3000, 2000)),
+        (SizeLimit(max_dimension=2000, max_megapixels=6), (6000, 4000), (2000, 1333)),
+    ],
+)
+def test_size_limit(limit: SizeLimit, size: tuple, expected: tuple):
+    assert limit.fit(*size) == expected
+
+
+def test_memory_summary_reports_peak_of_each_worker():
+    conversions = [
+        Conversion("a.png", "a.jpg", worker=1, peak_rss=100 * 1024**2),
+        Conversion("b.png", "b.jpg", worker=1, peak_rss=300 * 1024**2),
+        Conversion("c.png", "c.jpg", worker=2, peak_rss=200 * 1024**2),
+        Conversion("d.png", "d.jpg", error="BrokenProcessPool"),
+    ]
+
+    assert memory_summary(conversions) == (
+        "Peak memory of 2 conversion workers: 200.0MiB, 300.0MiB"
+    )
+    assert memory_summary([]) is None
+
+
+@requires_image_magick
+def test_convert_to_jpg_scales_down_large_images(tmp_path: Path):
+    path = str(tmp_path / "scan.tif")
+    with Image(width=1200, height=800, background=Color("blue")) as image:
+        image.save(filename=path)
+
+    (conversion,) = convert_to_jpg(
+        [path], jobs=1, size_limit=SizeLimit(max_dimension=600)
+    )
+
+    assert conversion.error is None
+    assert (conversion.original_size, conversion.size) == ((1200, 800), (600, 400))
+    assert conversion.peak_rss > 0
+    with Image(filename=conversion.target) as image:
+        assert image.size == (600, 400)
@@ -72,3 +72,43 @@ def test_number_of_parsed_tracks(filename, number_of_tracks):
     path = os.path.join("tests", "files", filename)
     cue = CueParser(path)
     assert len(cue.tracks) == number_of_tracks
+
+
+def test_malformed_lines_are_skipped(tmp_path):
+    cue_path = tmp_path / "malformed.cue"
+    cue_path.write_text(
+        "REM\n"
+        "REM GENRE Rock\n"
+        "PERFORMER\n"
+        'TITLE "Album"\n'
+        'FILE "album.flac" WAVE\n'
+        "  TRACK 01 AUDIO\n"
+        '    TITLE "One"\n'
+        "    INDEX 01 00:00:00\n"
+        "  TRACK XX AUDIO\n"
+        "    INDEX 01 not:a:time\n"
+        "  TRACK 03 AUDIO\n"
+        "    INDEX\n"
+        "    INDEX 01 01:00:00\n"
+        "  UNKNOWN command\n"
+    )
+    cue = CueParser(str(cue_path))
+    assert cue.meta["GENRE"] == "Rock"
+    assert cue.meta["ALBUM"] == "Album"
+    assert [track["TRACK_NUM"] for track in cue.tracks] == [1, 2, 3]
+    assert cue.tracks[0]["POS_END_SAMPLES"] is None
+    assert cue.tracks[2]["POS_START_SAMPLES"] == 60 * 44100
+    assert cue.tracks[2]["POS_END_SAMPLES"] is None
+
+
+def test_tracks_borrow_global_data_except_file(multiple_files_single_track):
+    cue = CueParser(multiple_files_single_track)
+    track = cue.tracks[0]
+    assert track["ALBUM"] == cue.meta["ALBUM"]
+    cue.meta["GENRE"] = "Jazz"
+    assert track["GENRE"] == "Jazz"
+    track["GENRE"] = "Blues"
+    assert cue.meta["GENRE"] == "Jazz"
+    assert dict(track)["GENRE"] == "Blues"
+    del track["FILE"]
+    assert "FILE" not in track
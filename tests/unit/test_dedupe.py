@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for finding files with identical content."""
+import os
+from pathlib import Path
+
+from teeb import dedupe
+from teeb.dedupe import (
+    PARTIAL_SIZE,
+    duplicate_groups,
+    find_duplicates,
+    identical_pairs,
+    summary,
+)
+from teeb.index import LibraryIndex
+
+
+def test_files_of_the_same_size_are_compared_by_content(tmp_path: Path):
+    head = os.urandom(PARTIAL_SIZE)
+    tail = os.urandom(PARTIAL_SIZE)
+    big = head + b"middle" + tail
+    (tmp_path / "a.flac").write_bytes(big)
+    (tmp_path / "b.flac").write_bytes(big)
+    # Same size, first & last 64 KiB as a.flac, only the full hash tells them apart
+    (tmp_path / "c.flac").write_bytes(head + b"MIDDLE" + tail)
+    (tmp_path / "cover.jpg").write_bytes(b"1234")
+    (tmp_path / "front.jpg").write_bytes(b"1234")
+    (tmp_path / "back.jpg").write_bytes(b"4321")
+    os.symlink("cover.jpg", tmp_path / "link.jpg")
+
+    groups = duplicate_groups(sorted(str(path) for path in tmp_path.iterdir()))
+
+    assert [group.paths for group in groups] == [
+        [str(tmp_path / "a.flac"), str(tmp_path / "b.flac")],
+        [str(tmp_path / "cover.jpg"), str(tmp_path / "front.jpg")],
+    ]
+    assert [group.reclaimable for group in groups] == [len(big), 4]
+
+
+def test_files_truncated_during_the_search_are_left_out(tmp_path: Path, monkeypatch):
+    content = os.urandom(3 * PARTIAL_SIZE)
+    for name in ["a.flac", "b.flac", "c.flac"]:
+        (tmp_path / name).write_bytes(content)
+    partial_digest = dedupe._partial_digest
+
+    def truncate_after_partial_digest(path: str, size: int) -> bytes:
+        digest = partial_digest(path, size)
+        if path.endswith("c.flac"):
+            open(path, "wb").close()
+        return digest
+
+    monkeypatch.setattr("teeb.dedupe._partial_digest", truncate_after_partial_digest)
+    groups = duplicate_groups(sorted(str(path) for path in tmp_path.iterdir()))
+
+    assert [group.paths for group in groups] == [
+        [str(tmp_path / "a.flac"), str(tmp_path / "b.flac")]
+    ]
+
+
+def test_identical_pairs(tmp_path: Path):
+    art = tmp_path / "Art"
+    art.mkdir()
+    (art / "cover.jpg").write_bytes(b"same")
+    (tmp_path / "cover.jpg").write_bytes(b"same")
+    (art / "back.jpg").write_bytes(b"back")
+    (tmp_path / "back.jpg").write_bytes(b"BACK")
+    pairs = [
+        (str(art / "cover.jpg"), str(tmp_path / "cover.jpg")),
+        (str(art / "back.jpg"), str(tmp_path / "back.jpg")),
+    ]
+
+    assert identical_pairs(pairs) == {pairs[0]}
+
+
+def test_find_duplicates_in_library(tmp_path: Path):
+    for album in ["album 1", "album 2"]:
+        (tmp_path / album).mkdir()
+        (tmp_path / album / "cover.jpg").write_bytes(b"cover")
+        (tmp_path / album / "01.flac").write_bytes(album.encode())
+
+    groups = find_duplicates(str(tmp_path), index=LibraryIndex(str(tmp_path)))
+
+    assert [group.paths for group in groups] == [
+        [
+            str(tmp_path / "album 1" / "cover.jpg"),
+            str(tmp_path / "album 2" / "cover.jpg"),
+        ]
+    ]
+    assert summary(groups) == (
+        "Found 2 files in 1 groups of identical files, 5B can be reclaimed by "
+        "removing duplicates"
+    )
+    assert summary([]) is None
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the library index."""
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+import teeb.find
+from teeb.index import LibraryIndex
+
+NESTED_ALBUM_ART = os.path.join("tests", "nested_album_art")
+
+
+def make_library(root: Path) -> Path:
+    """Create a small library with a nested album art directory & an empty one."""
+    album = root / "Artist - Album"
+    (album / "album_art").mkdir(parents=True)
+    (album / "empty").mkdir()
+    for name in ["01 Track.FLAC", "02 Track.flac", "album.cue", "rip.log"]:
+        (album / name).write_text(name)
+    for name in ["Front.JPEG", "back.png", "folder.jpg"]:
+        (album / "album_art" / name).write_text(name)
+    return root
+
+
+def test_walk_is_the_same_as_os_walk():
+    index = LibraryIndex(NESTED_ALBUM_ART)
+    assert list(index.walk()) == list(os.walk(NESTED_ALBUM_ART))
+
+
+@pytest.mark.parametrize(
+    "finder",
+    [
+        teeb.find.extra_files,
+        teeb.find.extra_text_files,
+        teeb.find.files_with_upper_case_extension,
+        teeb.find.non_audio_files_with_upper_case_characters,
+        teeb.find.files_to_change_extension,
+        teeb.find.directory_and_file_paths_with_spaces,
+        teeb.find.album_art_files_to_convert,
+        teeb.find.album_art_jpg_files,
+        teeb.find.cue_files_and_audio_files,
+        teeb.find.empty_directories,
+        teeb.find.nested_album_art,
+    ],
+)
+def test_finders_return_the_same_results_with_index(tmp_path, finder):
+    make_library(tmp_path)
+    for directory in [NESTED_ALBUM_ART, str(tmp_path)]:
+        index = LibraryIndex(directory)
+        assert finder(directory, index=index) == finder(directory)
+
+
+def test_index_tracks_renamed_and_removed_files(tmp_path):
+    make_library(tmp_path)
+    index = LibraryIndex(str(tmp_path))
+    album = os.path.join(str(tmp_path), "Artist - Album")
+    new_album = os.path.join(str(tmp_path), "Artist_-_Album")
+
+    os.rename(os.path.join(album, "rip.log"), os.path.join(album, "rip.txt"))
+    index.rename(os.path.join(album, "rip.log"), os.path.join(album, "rip.txt"))
+    os.remove(os.path.join(album, "album.cue"))
+    index.remove(os.path.join(album, "album.cue"))
+    os.rmdir(os.path.join(album, "empty"))
+    index.remove(os.path.join(album, "empty"))
+    os.rename(album, new_album)
+    index.rename(album, new_album)
+
+    assert index.isfile(os.path.join(new_album, "rip.txt"))
+    assert index.isdir(os.path.join(new_album, "album_art"))
+    assert os.path.join(album, "rip.log") not in index
+    for (path, dirs, files), (os_path, os_dirs, os_files) in zip(
+        index.walk(), os.walk(str(tmp_path))
+    ):
+        assert path == os_path
+        assert sorted(dirs) == sorted(os_dirs)
+        assert sorted(files) == sorted(os_files)
+
+
+def test_directory_changes_leave_siblings_with_the_same_prefix_alone(tmp_path):
+    make_library(tmp_path)
+    album = os.path.join(str(tmp_path), "Artist - Album")
+    sibling = os.path.join(str(tmp_path), "Artist - Album 2")
+    os.makedirs(os.path.join(sibling, "album_art"))
+    index = LibraryIndex(str(tmp_path))
+
+    index.rename(album, album + " (2001)")
+    assert index.isdir(os.path.join(album + " (2001)", "album_art"))
+    assert index.isdir(os.path.join(sibling, "album_art"))
+    index.remove(album + " (2001)")
+    assert not index.isdir(os.path.join(album + " (2001)", "album_art"))
+    assert index.isdir(os.path.join(sibling, "album_art"))
+    index.refresh(sibling)
+    assert index.isdir(os.path.join(sibling, "album_art"))
+    assert len(index) == 3
+
+
+def test_refresh_picks_up_new_files(tmp_path):
+    make_library(tmp_path)
+    index = LibraryIndex(str(tmp_path))
+    album = os.path.join(str(tmp_path), "Artist - Album")
+    Path(album, "03 Track.flac").write_text("split")
+
+    assert not index.isfile(os.path.join(album, "03 Track.flac"))
+    index.refresh(album)
+    assert index.isfile(os.path.join(album, "03 Track.flac"))
+    assert index.isdir(os.path.join(album, "album_art"))
+
+
+def test_changes_are_tracked_per_directory(tmp_path):
+    make_library(tmp_path)
+    (tmp_path / "Other Album").mkdir()
+    index = LibraryIndex(str(tmp_path))
+    album = os.path.join(str(tmp_path), "Artist - Album")
+    other = os.path.join(str(tmp_path), "Other Album")
+    generation = index.generation
+
+    assert not index.changed_since(generation)
+    index.remove(os.path.join(album, "rip.log"))
+
+    assert index.changed_since(generation)
+    assert index.changed_since(generation, album)
+    assert index.changed_since(generation, str(tmp_path))
+    assert not index.changed_since(generation, other)
+    assert not index.changed_since(index.generation, album)
+    index.rename(str(tmp_path), str(tmp_path) + "_renamed")
+    assert index.changed_since(generation, other)
+
+
+def test_concurrent_scan_gives_the_same_index_as_sequential_one(tmp_path, monkeypatch):
+    """Simulate a high-latency network file system, where every listing is slow."""
+    for album in range(5):
+        make_library(tmp_path / f"album_{album}")
+    scandir = os.scandir
+
+    def slow_scandir(path):
+        time.sleep(0.01)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", slow_scandir)
+    sequential = LibraryIndex(str(tmp_path))
+    concurrent = LibraryIndex(str(tmp_path), workers=8)
+    assert list(concurrent.walk()) == list(sequential.walk())
+    assert list(concurrent.walk()) == list(os.walk(str(tmp_path)))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the file operation journal."""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from teeb import journal
+from teeb.fileops import (
+    remove,
+    rename,
+)
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path: Path, monkeypatch) -> Path:
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    yield tmp_path / "state"
+    journal.finish_run()
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+def test_undo_reverses_renames_in_reverse_order(tmp_path: Path):
+    album = tmp_path / "Some Album"
+    album.mkdir()
+    (album / "Cover.JPG").write_text("cover")
+    (album / "rip.log").write_text("log")
+
+    run = journal.start_run(str(tmp_path))
+    rename(str(album), str(tmp_path / "Some_Album"))
+    rename(
+        str(tmp_path / "Some_Album" / "Cover.JPG"), str(tmp_path / "Some_Album/c.jpg")
+    )
+    remove(str(tmp_path / "Some_Album" / "rip.log"))
+    with pytest.raises(OSError):
+        rename(str(tmp_path / "missing"), str(tmp_path / "found"))
+    journal.finish_run()
+
+    journal.start_run(str(tmp_path), undo=run.run_id)
+    undone, problems = journal.undo(journal.journal_path(run.run_id))
+    journal.finish_run()
+
+    assert undone == 2
+    assert problems == [f"can't undo remove of '{tmp_path}/Some_Album/rip.log'"]
+    assert sorted(os.listdir(tmp_path)) == ["Some Album", "state"]
+    assert os.listdir(album) == ["Cover.JPG"]
+    assert journal.undo(journal.journal_path(run.run_id))[0] == 0
+
+
+def test_interrupted_run_is_settled_by_checking_disk(tmp_path: Path):
+    (tmp_path / "b").write_text("b")
+    (tmp_path / "c").write_text("c")
+    path = journal.journal_path("20210101-000000-1")
+    os.makedirs(os.path.dirname(path))
+    records = [
+        {"run": "20210101-000000-1", "directory": str(tmp_path), "pid": dead_pid()},
+        # confirmed rename
+        {"seq": 1, "action": "rename", "source": str(tmp_path / "a"), "target": "b"},
+        {"seq": 1, "done": True},
+        # rename made just before teeb was killed
+        {"seq": 2, "action": "rename", "source": str(tmp_path / "x")},
+        {"seq": 3, "action": "rename", "source": str(tmp_path / "c")},
+    ]
+    records[1]["target"] = str(tmp_path / "b")
+    records[3]["target"] = str(tmp_path / "y")
+    records[4]["target"] = str(tmp_path / "d")
+    (tmp_path / "y").write_text("y")
+    with open(path, "w") as journal_file:
+        for record in records:
+            journal_file.write(json.dumps(record) + "\n")
+        journal_file.write('{"seq": 4, "act')  # line cut short by a crash
+
+    assert journal.interrupted_runs() == [path]
+    _, entries, _ = journal.read_journal(path)
+    assert [journal.settle(entry) for entry in entries] == [True, True, False]
+
+    undone, problems = journal.recover(path, rollback=True)
+
+    assert (undone, problems) == (2, [])
+    assert sorted(os.listdir(tmp_path)) == ["a", "c", "state", "x"]
+    assert journal.interrupted_runs() == []
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for re-encoding oversized jpg files."""
+from pathlib import Path
+
+import pytest
+
+from teeb.action import optimise_album_art_jpg
+from teeb.data_type import Optimisation
+from teeb.find import oversized_jpg_files
+from teeb.optimise import (
+    MAX_QUALITY,
+    MIN_QUALITY,
+    choose_quality,
+    optimise_jpg,
+    optimise_jpgs,
+    temporary_path,
+)
+
+try:
+    from wand.image import Image
+except ImportError:  # Wand raises it when ImageMagick library can't be found
+    Image = None
+
+requires_image_magick = pytest.mark.skipif(
+    Image is None, reason="ImageMagick is not installed"
+)
+
+
+def size(quality: int) -> int:
+    return quality * 10_000
+
+
+def similarity(quality: int) -> float:
+    return 0.9 + quality / 1000
+
+
+@pytest.mark.parametrize(
+    "target_size, min_ssim, expected",
+    [
+        (800_000, None, 80),
+        (805_000, None, 80),
+        (100_000, None, MIN_QUALITY),
+        (None, 0.97, 70),
+        # Target size would need lower quality than the SSIM floor allows
+        (600_000, 0.97, 70),
+        (800_000, 0.97, 80),
+        (None, 0.999, MAX_QUALITY),
+    ],
+)
+def test_choose_quality(target_size: int, min_ssim: float, expected: int):
+    visited = []
+
+    def measure(quality: int) -> int:
+        visited.append(quality)
+        return size(quality)
+
+    quality = choose_quality(
+        measure, similarity, target_size=target_size, min_ssim=min_ssim
+    )
+
+    assert quality == expected
+    assert len(visited) <= 6
+
+
+def test_oversized_jpg_files(tmp_path: Path):
+    (tmp_path / "cover.jpg").write_bytes(b"x" * 2000)
+    (tmp_path / "back.JPEG").write_bytes(b"x" * 2000)
+    (tmp_path / "small.jpg").write_bytes(b"x" * 1000)
+    (tmp_path / "scan.png").write_bytes(b"x" * 2000)
+    # AppleDouble file left by macOS
+    (tmp_path / "._cover.jpg").write_bytes(b"x" * 4096)
+
+    assert sorted(oversized_jpg_files(str(tmp_path), min_size=1000)) == [
+        str(tmp_path / "back.JPEG"),
+        str(tmp_path / "cover.jpg"),
+    ]
+
+
+def test_interrupted_run_leaves_no_re_encoded_files(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    library = tmp_path / "library"
+    library.mkdir()
+    first, second = str(library / "back.jpg"), str(library / "cover.jpg")
+    for path in [first, second]:
+        Path(path).write_bytes(b"x" * 2000)
+
+    def optimise_jpgs(paths, **options):
+        # Both files are done by workers, but the run is interrupted after the first
+        for path in paths:
+            Path(temporary_path(path)).write_bytes(b"x" * 500)
+        yield Optimisation(
+            path=first,
+            original_size=2000,
+            size=500,
+            temporary_path=temporary_path(first),
+        )
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr("teeb.action.optimise_jpgs", optimise_jpgs)
+    monkeypatch.setattr("builtins.input", lambda question: "y")
+    with pytest.raises(KeyboardInterrupt):
+        optimise_album_art_jpg(str(library), target_size=1000)
+
+    assert sorted(path.name for path in library.iterdir()) == ["back.jpg", "cover.jpg"]
+    assert Path(first).stat().st_size == 500
+    assert Path(second).stat().st_size == 2000
+
+
+@requires_image_magick
+def test_optimise_jpg_fits_in_target_size(tmp_path: Path):
+    path = str(tmp_path / "cover.jpg")
+    with Image(filename="plasma:", width=1000, height=1000) as image:
+        image.compression_quality = 100
+        image.save(filename=path)
+
+    dry_run = optimise_jpg(path, target_size=150_000, dry_run=True)
+    result = optimise_jpg(path, target_size=150_000)
+
+    assert dry_run.temporary_path is None
+    assert 0 < result.size <= 150_000 < result.original_size
+    assert result.temporary_path == temporary_path(path)
+    assert Path(result.temporary_path).stat().st_size == result.size
+
+
+def test_ssim_floor_is_left_out_without_the_metric(monkeypatch, caplog):
+    options = []
+
+    def optimise_jpg(path: str, **kwargs):
+        options.append(kwargs)
+
+    monkeypatch.setattr("teeb.optimise.ssim_available", lambda: False)
+    monkeypatch.setattr("teeb.optimise.set_resource_limits", lambda **limits: None)
+    monkeypatch.setattr("teeb.optimise.optimise_jpg", optimise_jpg)
+
+    list(optimise_jpgs(["cover.jpg"], jobs=1, min_ssim=0.97))
+
+    assert options[0]["min_ssim"] is None
+    assert "SSIM" in caplog.text
+
+
+@requires_image_magick
+def test_optimise_jpg_keeps_ssim_floor(tmp_path: Path):
+    path = str(tmp_path / "cover.jpg")
+    with Image(filename="plasma:", width=500, height=500) as image:
+        image.compression_quality = 100
+        image.save(filename=path)
+
+    result = optimise_jpg(path, target_size=10_000, min_ssim=0.97, dry_run=True)
+
+    assert result.error is None
+    assert result.ssim is None or result.ssim >= 0.97
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for summarised & buffered console output."""
+import io
+import os
+from pathlib import Path
+
+import teeb.output
+from teeb.output import (
+    Output,
+    summarise,
+)
+from teeb.prompt import prompt
+
+ALBUM = os.path.join("library", "Album")
+PATHS = [os.path.join(ALBUM, f"{number:02}.log") for number in range(20)] + [
+    os.path.join("library", "Other", "rip.m3u")
+]
+
+
+def test_summarise():
+    assert summarise(PATHS, examples=2) == [
+        "By extension: 20 .log, 1 .m3u",
+        "By directory (2):",
+        f"  20 in {ALBUM}",
+        f"  1 in {os.path.join('library', 'Other')}",
+        "First 2:",
+        f"  {PATHS[0]}",
+        f"  {PATHS[1]}",
+    ]
+
+
+def test_long_listings_are_summarised_unless_verbose(tmp_path: Path):
+    stream = io.StringIO()
+    listing_path = str(tmp_path / "listing.txt")
+    output = Output(stream, examples=3, listing_path=listing_path)
+
+    output.listing(PATHS[:3], title="short")
+    output.listing(PATHS, title="long")
+    output.close()
+
+    lines = stream.getvalue().splitlines()
+    assert lines[:3] == PATHS[:3]
+    assert lines[-1] == f"Use --verbose to list all 21 or see {listing_path}"
+    assert len(lines) < len(PATHS)
+    assert Path(listing_path).read_text().splitlines() == (
+        ["# short: 3", *PATHS[:3], "# long: 21", *PATHS]
+    )
+    verbose = io.StringIO()
+    Output(verbose, examples=3, verbose=True).listing(PATHS)
+    assert verbose.getvalue().splitlines() == PATHS
+
+
+def test_buffered_output_is_written_before_a_question(monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(teeb.output, "_output", Output(stream))
+    shown = []
+
+    def answer(question: str) -> str:
+        shown.append(stream.getvalue())
+        return "y"
+
+    monkeypatch.setattr("builtins.input", answer)
+
+    with teeb.output.buffered():
+        teeb.output.echo("Moved", "1 file")
+        assert stream.getvalue() == ""
+        assert prompt("Continue?", ["y", "n"]) == "y"
+        teeb.output.echo("Moved 2 files")
+        assert stream.getvalue() == "Moved 1 file\n"
+
+    assert shown == ["Moved 1 file\n"]
+    assert stream.getvalue() == "Moved 1 file\nMoved 2 files\n"
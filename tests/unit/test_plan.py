@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for non-interactive plan & apply mode."""
+import os
+from pathlib import Path
+
+import pytest
+
+from teeb.index import LibraryIndex
+from teeb.plan import (
+    Planner,
+    apply_plan,
+    load_plan,
+    save_plan,
+)
+
+
+@pytest.fixture
+def library(tmp_path: Path) -> Path:
+    root = tmp_path / "library"
+    album = root / "Artist Album"
+    (album / "Cover Art").mkdir(parents=True)
+    (album / "empty").mkdir()
+    (album / "01 Track.FLAC").write_text("1")
+    (album / "02 Track.flac").write_text("2")
+    (album / "rip.log").write_text("log")
+    (album / "Cover Art" / "Front.JPEG").write_text("cover")
+    return root
+
+
+@pytest.fixture
+def trash_bin(tmp_path: Path, monkeypatch) -> Path:
+    """Move trashed files to a temporary trash bin instead of user's one."""
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    return tmp_path / "data" / "Trash" / "files"
+
+
+def test_plan_doesnt_touch_the_disk(library: Path):
+    before = list(os.walk(library))
+    plan = Planner(str(library), LibraryIndex(str(library))).make()
+    assert list(os.walk(library)) == before
+
+    album = os.path.join(str(library), "Artist Album")
+    renamed_album = os.path.join(str(library), "Artist_Album")
+    operations = [
+        (operation.step, operation.action, operation.source, operation.target)
+        for operation in plan.operations
+    ]
+    assert operations[0] == (
+        "delete_extra_files",
+        "delete",
+        os.path.join(album, "rip.log"),
+        None,
+    )
+    # Each file is renamed once & before the directory it's in
+    assert operations[1] == (
+        "normalise_names",
+        "rename",
+        os.path.join(album, "Cover Art", "Front.JPEG"),
+        os.path.join(album, "Cover Art", "front.jpg"),
+    )
+    assert operations[5] == ("normalise_names", "rename", album, renamed_album)
+    assert (
+        "move_album_art_files_to_album_dir",
+        "move",
+        os.path.join(renamed_album, "Cover_Art", "front.jpg"),
+        os.path.join(renamed_album, "front.jpg"),
+    ) in operations
+    assert operations[-1] == (
+        "delete_empty_directories",
+        "trash",
+        os.path.join(renamed_album, "empty"),
+        None,
+    )
+    moved = [o for o in plan.operations if o.action == "move"][0]
+    assert moved.size == len("cover")
+
+
+def test_apply_saved_plan(library: Path, trash_bin: Path, tmp_path: Path):
+    plan_path = str(tmp_path / "plan.json")
+    save_plan(Planner(str(library), LibraryIndex(str(library))).make(), plan_path)
+
+    applied, skipped = apply_plan(load_plan(plan_path))
+
+    assert skipped == 0
+    assert sorted(os.listdir(library)) == ["Artist_Album"]
+    assert sorted(os.listdir(library / "Artist_Album")) == [
+        "01_Track.flac",
+        "02_Track.flac",
+        "cover.jpg",
+    ]
+    assert sorted(os.listdir(trash_bin)) == ["Cover_Art", "empty"]
+
+
+def test_apply_skips_files_changed_since_plan_was_made(
+    library: Path, trash_bin: Path, tmp_path: Path
+):
+    plan = Planner(str(library), LibraryIndex(str(library))).make()
+    (library / "Artist Album" / "Cover Art" / "Front.JPEG").write_text("new cover")
+
+    applied, skipped = apply_plan(plan)
+
+    # All 3 operations on the cover are skipped & so is trashing of its directory
+    assert skipped == 4
+    assert os.path.isfile(library / "Artist_Album" / "Cover_Art" / "Front.JPEG")
+
+
+def test_apply_skips_split_if_audio_image_changed_since_plan_was_made(
+    tmp_path: Path, trash_bin: Path
+):
+    album = tmp_path / "album"
+    album.mkdir()
+    (album / "album.cue").write_text('FILE "album.flac" WAVE')
+    (album / "album.flac").write_text("image")
+    planner = Planner(str(album), LibraryIndex(str(album)))
+    planner._add(
+        "what_to_do_with_cue",
+        "split",
+        str(album / "album.cue"),
+        related=[str(album / "album.flac")],
+    )
+    plan_path = str(tmp_path / "plan.json")
+    save_plan(planner.plan, plan_path)
+    plan = load_plan(plan_path)
+    assert plan.operations[0].related_stats == [
+        [len("image"), os.stat(album / "album.flac").st_mtime_ns]
+    ]
+    (album / "album.flac").write_text("new image")
+
+    assert apply_plan(plan) == (0, 1)
+    assert sorted(os.listdir(album)) == ["album.cue", "album.flac"]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for recording & replaying answers to questions."""
+from pathlib import Path
+
+import pytest
+
+import teeb.prompt
+from teeb.policy import (
+    Policy,
+    pattern,
+)
+from teeb.prompt import prompt
+
+
+@pytest.fixture
+def policy_path(tmp_path: Path, monkeypatch) -> str:
+    path = str(tmp_path / "policy.json")
+    monkeypatch.setattr(teeb.prompt, "policy", Policy(path))
+    return path
+
+
+def test_pattern():
+    assert pattern("01-Front.JPG") == pattern("02-front.jpg") == "#-front.jpg"
+
+
+def test_answers_are_replayed_in_next_run(policy_path: str, monkeypatch, capsys):
+    answers = iter(["y", "2", "q"])
+    monkeypatch.setattr("builtins.input", lambda question: next(answers))
+
+    assert prompt("Delete all extra files?", ["y", "n", "q"]) == "y"
+    assert prompt("Choose suggestion for 01.jpg?", ["n", "1", "2"], key="#.jpg") == "2"
+    assert prompt("Convert all album art to jpg?", ["y", "n", "q"]) == "q"
+
+    teeb.prompt.policy = Policy(policy_path)
+    monkeypatch.setattr("builtins.input", lambda question: "n")
+
+    assert prompt("Delete all extra files?", ["y", "n", "q"]) == "y"
+    assert prompt("Choose suggestion for 02.jpg?", ["n", "1", "2"], key="#.jpg") == "2"
+    # Quitting isn't recorded, so it's asked again
+    assert prompt("Convert all album art to jpg?", ["y", "n", "q"]) == "n"
+    # Recorded answer isn't one of the options
+    assert prompt("Choose suggestion for 03.jpg?", ["n", "1"], key="#.jpg") == "n"
+    assert "Delete all extra files? y (from policy)" in capsys.readouterr().out
+    assert teeb.prompt.policy.summary() == (
+        f"Policy {policy_path}: 2 answers replayed, 2 recorded"
+    )
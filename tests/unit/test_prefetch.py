@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for prefetching the next step while a prompt is shown."""
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+import teeb.prefetch
+from teeb.find import extra_files
+from teeb.index import LibraryIndex
+from teeb.prefetch import Prefetcher
+from teeb.prompt import prompt
+
+
+@pytest.fixture
+def library(tmp_path: Path) -> str:
+    for album in ["Album", "Other Album"]:
+        (tmp_path / album).mkdir()
+        for name in ["01.flac", "rip.log", "setup.exe"]:
+            (tmp_path / album / name).write_text(name)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def prefetcher(library: str):
+    prefetcher = teeb.prefetch.start(LibraryIndex(library))
+    yield prefetcher
+    teeb.prefetch.stop()
+
+
+def test_next_step_is_prefetched_while_prompt_is_shown(
+    library: str, prefetcher: Prefetcher, monkeypatch
+):
+    index = prefetcher.index
+    calls = []
+    prefetched = threading.Event()
+
+    def finder(directory: str, *, index: LibraryIndex = None) -> list:
+        calls.append(threading.current_thread().name)
+        prefetched.set()
+        return extra_files(directory, index=index)
+
+    def answer(question: str) -> str:
+        # The answer is given only once the next step has been prepared
+        assert prefetched.wait(timeout=5)
+        return "y"
+
+    monkeypatch.setattr("builtins.input", answer)
+    teeb.prefetch.expect(finder, library, index=index)
+    assert calls == []
+
+    assert prompt("Delete all extra files?", ["y", "n"]) == "y"
+    result = teeb.prefetch.prefetched(finder, library, index=index)
+
+    assert result == extra_files(library, index=index)
+    assert len(calls) == 1 and calls[0].startswith("prefetch")
+    assert prefetcher.summary() == "Prefetched 1 of 1 scans, 0 were discarded as stale"
+
+
+def test_result_is_discarded_when_directory_changed(
+    library: str, prefetcher: Prefetcher
+):
+    index = prefetcher.index
+    album = os.path.join(library, "Album")
+    other = os.path.join(library, "Other Album")
+    found = threading.Semaphore(0)
+
+    def finder(directory: str, *, index: LibraryIndex = None) -> list:
+        result = extra_files(directory, index=index)
+        found.release()
+        return result
+
+    for directory in [album, other]:
+        prefetcher.expect(finder, directory, index=index)
+    prefetcher.idle()
+    assert found.acquire(timeout=5) and found.acquire(timeout=5)
+
+    # The user agreed to delete a file after the finders were done
+    os.remove(os.path.join(album, "setup.exe"))
+    index.remove(os.path.join(album, "setup.exe"))
+
+    assert prefetcher.take(finder, album, index=index) == [
+        os.path.join(album, "rip.log")
+    ]
+    assert len(prefetcher.take(finder, other, index=index)) == 2
+    assert (prefetcher.hits, prefetcher.stale, prefetcher.misses) == (1, 1, 0)
+
+
+def test_calls_needed_before_any_prompt_are_not_prefetched(
+    library: str, prefetcher: Prefetcher
+):
+    index = prefetcher.index
+    prefetcher.expect(extra_files, library, index=index)
+
+    assert len(prefetcher.take(extra_files, library, index=index)) == 4
+    prefetcher.idle()
+
+    assert (prefetcher.hits, prefetcher.stale, prefetcher.misses) == (0, 0, 1)
+    assert prefetcher.take(extra_files, library, index=index) is not None
+    assert prefetcher.misses == 2
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the single pass name normaliser."""
+import os
+from pathlib import Path
+
+import pytest
+
+from teeb.index import LibraryIndex
+from teeb.rename import (
+    CHANGE_EXTENSIONS,
+    SPACES_TO_UNDERSCORES,
+    apply_renames,
+    normalised_name,
+    plan_renames,
+)
+
+
+@pytest.mark.parametrize(
+    "name, is_dir, rules, expected",
+    [
+        ("Front Cover.JPEG", False, None, "front_cover.jpg"),
+        ("01 Track.FLAC", False, None, "01_Track.flac"),
+        ("Info.NFO", False, None, "info.nfo"),
+        (".Hidden", False, None, ".hidden"),
+        ("Cover Art", True, None, "Cover_Art"),
+        ("Front Cover.JPEG", False, [CHANGE_EXTENSIONS], "Front Cover.jpg"),
+        ("Front Cover.JPEG", False, [SPACES_TO_UNDERSCORES], "Front_Cover.JPEG"),
+    ],
+)
+def test_normalised_name(name: str, is_dir: bool, rules, expected: str):
+    if rules is None:
+        assert normalised_name(name, is_dir=is_dir) == expected
+    else:
+        assert normalised_name(name, is_dir=is_dir, rules=frozenset(rules)) == expected
+
+
+def test_every_entry_is_renamed_once_bottom_up(tmp_path: Path):
+    art = tmp_path / "Some Album" / "Cover Art"
+    art.mkdir(parents=True)
+    (art / "Front Cover.JPEG").write_text("")
+    (art / "back.jpg").write_text("")
+    (tmp_path / "Some Album" / "01 Track.FLAC").write_text("")
+    index = LibraryIndex(str(tmp_path))
+
+    plan = plan_renames(str(tmp_path), index=index)
+
+    assert [
+        (os.path.relpath(entry.source, tmp_path), os.path.basename(entry.target))
+        for entry in plan.renames
+    ] == [
+        ("Some Album/Cover Art/Front Cover.JPEG", "front_cover.jpg"),
+        ("Some Album/01 Track.FLAC", "01_Track.flac"),
+        ("Some Album/Cover Art", "Cover_Art"),
+        ("Some Album", "Some_Album"),
+    ]
+    assert plan.renames[0].rules == [
+        "change_extensions",
+        "lower_extensions",
+        "non_audio_to_lower_case",
+        "spaces_to_underscores",
+    ]
+
+    assert apply_renames(plan, index=index) == (4, [])
+    expected = [
+        "Some_Album/01_Track.flac",
+        "Some_Album/Cover_Art/back.jpg",
+        "Some_Album/Cover_Art/front_cover.jpg",
+    ]
+    on_disk = sorted(
+        os.path.relpath(os.path.join(path, name), tmp_path)
+        for path, _, files in os.walk(tmp_path)
+        for name in files
+    )
+    assert on_disk == expected
+    assert list(index.walk()) == list(LibraryIndex(str(tmp_path)).walk())
+
+
+def test_conflicting_entries_are_not_renamed(tmp_path: Path):
+    (tmp_path / "Cover.JPG").write_text("1")
+    (tmp_path / "cover.jpg").write_text("2")
+    (tmp_path / "a b.txt").write_text("3")
+    (tmp_path / "A_B.txt").write_text("4")
+    (tmp_path / "Booklet.PNG").write_text("5")
+
+    plan = plan_renames(str(tmp_path))
+
+    assert [os.path.basename(entry.target) for entry in plan.renames] == ["booklet.png"]
+    assert sorted(plan.conflicts) == [
+        str(tmp_path / "a_b.txt"),
+        str(tmp_path / "cover.jpg"),
+    ]
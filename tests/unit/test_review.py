@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the full-screen review of findings."""
+from typing import (
+    Iterator,
+    List,
+)
+
+from teeb.data_type import ReviewItem
+from teeb.review import (
+    CHROME_LINES,
+    SKIPPED_STYLE,
+    Review,
+    split_keys,
+)
+
+MANY = 1_000_000
+
+
+def findings(
+    count: int = MANY, choices: List[str] = ["cover.jpg", "front.jpg"]
+) -> Iterator[ReviewItem]:
+    for number in range(count):
+        yield ReviewItem(
+            label=f"Album {number}/Folder.jpg",
+            choices=choices,
+            value=number,
+        )
+
+
+def test_only_visible_items_are_produced_and_rendered():
+    review = Review(findings(), title="Suggestions", height=10 + CHROME_LINES)
+
+    lines = review.render()
+
+    assert len(lines) == 10 + CHROME_LINES
+    # Items with several choices are left out until one is picked
+    assert lines[2] == (
+        f"{SKIPPED_STYLE.start}[?] Album 1/Folder.jpg -> cover.jpg (1/2)"
+        f"{SKIPPED_STYLE.end}"
+    )
+    assert "1/10+" in lines[-2]
+    assert len(review.items) == 10
+    for _ in range(25):
+        review.handle("page down")
+    assert review.cursor == 250
+    assert len(review.items) < 300
+
+
+def test_decisions_are_toggled_before_confirming():
+    review = Review(findings(5), title="Suggestions")
+
+    for key in [" ", "tab", "tab", "down", "down", " ", "up", " "]:
+        review.handle(key)
+
+    assert "5/5 · 3 skipped" in review.render()[-2]
+    assert review.handle("enter") is True
+    assert [(item.value, choice) for item, choice in review.selected()] == [
+        (0, "cover.jpg"),
+        (1, "front.jpg"),
+    ]
+
+
+def test_items_with_several_choices_start_skipped():
+    review = Review(findings(3), title="Suggestions")
+
+    assert review.handle("enter") is True
+    assert list(review.selected()) == []
+    review.handle("a")
+    assert "3 with several choices need one picked" in review.message
+    assert list(review.selected()) == []
+
+    review = Review(findings(3, choices=["cover.jpg"]), title="Suggestions")
+    assert [choice for _, choice in review.selected()] == ["cover.jpg"] * 3
+
+
+def test_filter_and_search():
+    review = Review(findings(100_000, choices=["cover.jpg"]), title="Suggestions")
+
+    for key in ["f", *"m 4242", "enter"]:
+        review.handle(key)
+    assert review.items[review.view[0]].label == "Album 4242/Folder.jpg"
+    assert review.items[review.view[1]].label == "Album 42420/Folder.jpg"
+    assert "filter: m 4242" in review.render()[-2]
+
+    review.handle("x")
+    assert review.decision(42421) is None and review.decision(42431) is not None
+    for key in ["f", "backspace", "backspace", "backspace", "backspace", "enter"]:
+        review.handle(key)
+    assert review.view.query == "m "
+    # Cursor stays on the same item when the filter changes
+    assert review.cursor == 4242
+    for key in ["home", "/", *"Album 7/", "enter"]:
+        review.handle(key)
+    assert review.items[review.view[review.cursor]].value == 7
+    assert review.handle("q") is False
+
+
+def test_keys_read_at_once_are_all_handled():
+    assert split_keys(b"jj\x1b[B\x1b[Bx \t") == [
+        "j",
+        "j",
+        "down",
+        "down",
+        "x",
+        " ",
+        "tab",
+    ]
+    # Pasted text, unknown sequences (F5) & a lone escape
+    assert split_keys("Café".encode() + b"\x1b[15~\x1b") == [*"Café", "esc"]
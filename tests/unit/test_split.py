@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the CUE splitter job scheduler."""
+import sys
+import time
+from pathlib import Path
+
+from teeb.data_type import SplitJob
+from teeb.split import (
+    flacon_job,
+    native_job,
+    run_job,
+    run_jobs,
+    splitter_name,
+    summary,
+)
+
+
+def python_job(cue_path: str, code: str) -> SplitJob:
+    return SplitJob(cue_path=cue_path, argv=[sys.executable, "-c", code, cue_path])
+
+
+def test_flacon_job_doesnt_need_quoting():
+    job = flacon_job("/music/Guns N' Roses/Appetite for Destruction.cue")
+    assert job.argv == [
+        "flacon",
+        "-s",
+        "/music/Guns N' Roses/Appetite for Destruction.cue",
+    ]
+
+
+def test_run_job_captures_output(tmp_path: Path):
+    cue_path = str(tmp_path / "Guns N' Roses.cue")
+    job = run_job(
+        python_job(cue_path, "import sys; print('splitting', sys.argv[1])"),
+        log_dir=str(tmp_path / "logs"),
+    )
+    assert job.succeeded
+    assert Path(job.log_path).read_text() == f"splitting {cue_path}\n"
+
+
+def test_run_job_reports_failures(tmp_path: Path):
+    log_dir = str(tmp_path / "logs")
+    failed = run_job(python_job("a.cue", "raise SystemExit(3)"), log_dir=log_dir)
+    timed_out = run_job(
+        python_job("b.cue", "import time; time.sleep(10)"), timeout=0.2, log_dir=log_dir
+    )
+    missing = run_job(
+        SplitJob(cue_path="c.cue", argv=[str(tmp_path / "no-such-splitter")]),
+        log_dir=log_dir,
+    )
+    assert (failed.succeeded, failed.returncode) == (False, 3)
+    assert not timed_out.succeeded and "timed out" in timed_out.error
+    assert not missing.succeeded and missing.error
+    assert "Split 0 of 3 CUE files" in summary([failed, timed_out, missing])
+
+
+def test_run_jobs_concurrently(tmp_path: Path):
+    jobs = [
+        python_job(f"{number}.cue", "import time; time.sleep(0.3)")
+        for number in range(4)
+    ]
+    start = time.monotonic()
+    finished = list(run_jobs(jobs, workers=4, log_dir=str(tmp_path)))
+    assert time.monotonic() - start < 1.2
+    assert sorted(job.cue_path for job in finished) == [
+        f"{number}.cue" for number in range(4)
+    ]
+    assert all(job.succeeded for job in finished)
+    assert len({job.log_path for job in finished}) == 4
+
+
+def test_native_splitter_errors_fail_only_their_job(tmp_path: Path, monkeypatch):
+    def split_wav_image(cue_path: str):
+        if "broken" in cue_path:
+            raise KeyError("TRACK_NUM")
+        return [cue_path.replace(".cue", ".wav")]
+
+    monkeypatch.setattr("teeb.split.split_wav_image", split_wav_image)
+    jobs = [native_job(str(tmp_path / f"{name}.cue")) for name in ["broken", "ok"]]
+
+    finished = {
+        Path(job.cue_path).stem: job
+        for job in run_jobs(jobs, workers=2, log_dir=str(tmp_path / "logs"))
+    }
+
+    assert not finished["broken"].succeeded
+    assert finished["broken"].error == "KeyError: 'TRACK_NUM'"
+    assert finished["ok"].succeeded
+    assert splitter_name(finished["ok"]) == "Built-in WAV splitter"
+    assert splitter_name(flacon_job("album.cue")) == "Flacon"
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for asking about findings as soon as they're found."""
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+from teeb.action import delete_extra_files
+from teeb.stream import (
+    album_of,
+    stream_groups,
+)
+
+LIBRARY = os.path.join("music", "library")
+
+
+def test_album_of():
+    assert album_of(os.path.join(LIBRARY, "A", "CD1", "x.log"), LIBRARY) == (
+        os.path.join(LIBRARY, "A")
+    )
+    assert album_of(os.path.join(LIBRARY, "x.log"), LIBRARY) == LIBRARY
+
+
+def test_groups_are_generated_album_by_album_in_chunks():
+    found = [
+        os.path.join(LIBRARY, "A", "1.log"),
+        os.path.join(LIBRARY, "A", "CD2", "2.log"),
+        os.path.join(LIBRARY, "B", "1.log"),
+        os.path.join(LIBRARY, "B", "2.log"),
+        os.path.join(LIBRARY, "B", "3.log"),
+    ]
+
+    groups = list(stream_groups(iter(found), LIBRARY, chunk_size=2))
+
+    assert groups == [
+        (os.path.join(LIBRARY, "A"), found[:2]),
+        (os.path.join(LIBRARY, "B"), found[2:4]),
+        (os.path.join(LIBRARY, "B"), found[4:]),
+    ]
+
+
+def test_first_album_is_generated_before_search_is_done():
+    first_album_asked = threading.Event()
+    searched = []
+
+    def slow_search():
+        yield os.path.join(LIBRARY, "A", "1.log")
+        # The rest of the library is searched while the user is asked about A
+        assert first_album_asked.wait(timeout=5)
+        searched.append("B")
+        yield os.path.join(LIBRARY, "B", "1.log")
+
+    groups = stream_groups(slow_search(), LIBRARY, flush_after=0.01)
+
+    assert next(groups) == (
+        os.path.join(LIBRARY, "A"),
+        [os.path.join(LIBRARY, "A", "1.log")],
+    )
+    assert searched == []
+    first_album_asked.set()
+    assert [album for album, _ in groups] == [os.path.join(LIBRARY, "B")]
+
+
+def test_search_errors_are_raised():
+    def broken_search():
+        yield os.path.join(LIBRARY, "A", "1.log")
+        raise OSError("Stale file handle")
+
+    with pytest.raises(OSError, match="Stale file handle"):
+        list(stream_groups(broken_search(), LIBRARY))
+
+
+def test_extra_files_are_deleted_album_by_album(tmp_path: Path, monkeypatch, capsys):
+    for album in ["A", "B", "C"]:
+        (tmp_path / album).mkdir()
+        (tmp_path / album / "rip.log").write_text(album)
+    answers = iter(["y", "n", "s"])
+    monkeypatch.setattr("builtins.input", lambda question: next(answers))
+
+    delete_extra_files(str(tmp_path), stream=True)
+
+    asked = [
+        line.split(": ")[1]
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith("Found 1 extra files in: ")
+    ]
+    assert len(asked) == 3
+    assert not os.path.exists(os.path.join(asked[0], "rip.log"))
+    assert os.path.exists(os.path.join(asked[1], "rip.log"))
+    assert os.path.exists(os.path.join(asked[2], "rip.log"))
+
+
+def test_all_remaining_albums_are_deleted_without_asking(
+    tmp_path: Path, monkeypatch, capsys
+):
+    for album in ["A", "B", "C", "D"]:
+        (tmp_path / album).mkdir()
+        (tmp_path / album / "rip.log").write_text(album)
+    answers = iter(["n", "a"])
+    monkeypatch.setattr("builtins.input", lambda question: next(answers))
+
+    delete_extra_files(str(tmp_path), stream=True)
+
+    asked = [
+        line.split(": ")[1]
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith("Found 1 extra files in: ")
+    ]
+    assert len(asked) == 4
+    assert os.path.exists(os.path.join(asked[0], "rip.log"))
+    for album in asked[1:]:
+        assert not os.path.exists(os.path.join(album, "rip.log"))
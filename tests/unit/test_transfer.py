@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for moves across file systems."""
+import errno
+import os
+from pathlib import Path
+
+import pytest
+
+from teeb import (
+    fileops,
+    journal,
+    transfer,
+)
+from teeb.index import LibraryIndex
+
+
+@pytest.fixture(autouse=True)
+def state_home(tmp_path: Path, monkeypatch) -> Path:
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    yield tmp_path / "state"
+    journal.finish_run()
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    """Make every rename() fail as if source & target were on different mounts."""
+
+    def fail(source, target):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV), source, target)
+
+    monkeypatch.setattr(fileops.os, "rename", fail)
+
+
+@pytest.mark.parametrize("method", [name for name, _ in transfer.COPY_METHODS])
+def test_copy_file_keeps_data_and_timestamps(tmp_path: Path, monkeypatch, method):
+    source = tmp_path / "cover.jpg"
+    data = os.urandom(transfer.CHUNK_SIZE * 2 + 123)
+    source.write_bytes(data)
+    source.chmod(0o640)
+    os.utime(source, ns=(1_500_000_000_000_000_000, 1_600_000_000_123_456_789))
+    # Methods before the one under test pretend they're not supported
+    methods = [
+        (name, copy if name in (method, "chunked") else lambda *_: False)
+        for name, copy in transfer.COPY_METHODS
+    ]
+    monkeypatch.setattr(transfer, "COPY_METHODS", methods)
+    target = tmp_path / "copy.jpg"
+
+    used = transfer.copy_file(str(source), str(target))
+
+    # Falls back to chunked copy if not supported by the kernel or file system
+    assert used in [method, "chunked"]
+    assert target.read_bytes() == data
+    assert target.stat().st_mtime_ns == source.stat().st_mtime_ns
+    assert target.stat().st_mode & 0o777 == 0o640
+
+
+def test_copy_file_removes_partial_copy(tmp_path: Path, monkeypatch):
+    def broken(source_fd, target_fd, size):
+        os.write(target_fd, b"partial")
+        raise OSError(errno.EIO, os.strerror(errno.EIO))
+
+    monkeypatch.setattr(transfer, "COPY_METHODS", [("broken", broken)])
+    (tmp_path / "a.flac").write_bytes(b"data")
+
+    with pytest.raises(OSError):
+        transfer.copy_file(str(tmp_path / "a.flac"), str(tmp_path / "b.flac"))
+
+    assert not (tmp_path / "b.flac").exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="copy_file_range() only")
+def test_copy_file_range_reporting_no_data(tmp_path: Path, monkeypatch):
+    methods = [
+        ("copy_file_range", transfer._copy_file_range),
+        ("chunked", transfer._chunked),
+    ]
+    monkeypatch.setattr(transfer, "COPY_METHODS", methods)
+    (tmp_path / "a.flac").write_bytes(b"data")
+    sent = iter([0, 2, 0])
+    monkeypatch.setattr(transfer.os, "copy_file_range", lambda *_: next(sent))
+
+    # Nothing copied, e.g. by FUSE, means copy_file_range() isn't supported
+    used = transfer.copy_file(str(tmp_path / "a.flac"), str(tmp_path / "b.flac"))
+    assert used == "chunked"
+    assert (tmp_path / "b.flac").read_bytes() == b"data"
+    # Source truncated in the middle of a copy
+    with pytest.raises(OSError):
+        transfer.copy_file(str(tmp_path / "a.flac"), str(tmp_path / "c.flac"))
+    assert not (tmp_path / "c.flac").exists()
+
+
+def test_short_copy_keeps_the_source(tmp_path: Path, monkeypatch, cross_device):
+    def short(source_fd, target_fd, size):
+        os.write(target_fd, b"da")
+        return True
+
+    monkeypatch.setattr(transfer, "COPY_METHODS", [("short", short)])
+    (tmp_path / "a.flac").write_bytes(b"data")
+
+    with pytest.raises(OSError):
+        fileops.move(str(tmp_path / "a.flac"), str(tmp_path / "b.flac"))
+
+    assert (tmp_path / "a.flac").read_bytes() == b"data"
+    assert not (tmp_path / "b.flac").exists()
+
+
+def test_move_across_devices(tmp_path: Path, cross_device):
+    tmp_path = tmp_path / "library"
+    art = tmp_path / "album" / "Art"
+    art.mkdir(parents=True)
+    (art / "front.jpg").write_text("front")
+    (art / "back.jpg").write_text("back")
+    os.symlink("front.jpg", art / "cover.jpg")
+    index = LibraryIndex(str(tmp_path))
+
+    run = journal.start_run(str(tmp_path))
+    fileops.move(str(art / "back.jpg"), str(tmp_path / "album" / "back.jpg"), index)
+    fileops.move(str(art), str(tmp_path / "art"), index)
+    journal.finish_run()
+
+    assert not art.exists()
+    assert (tmp_path / "album" / "back.jpg").read_text() == "back"
+    assert sorted(os.listdir(tmp_path / "art")) == ["cover.jpg", "front.jpg"]
+    assert os.readlink(tmp_path / "art" / "cover.jpg") == "front.jpg"
+    assert list(index.walk()) == list(LibraryIndex(str(tmp_path)).walk())
+    _, entries, _ = journal.read_journal(journal.journal_path(run.run_id))
+    assert [entry.action for entry in entries] == ["move", "move"]
+    assert entries[0].copied in [name for name, _ in transfer.COPY_METHODS]
+    assert entries[1].copied == "tree"
+
+
+def test_move_never_replaces_a_file(tmp_path: Path, cross_device):
+    (tmp_path / "a.jpg").write_text("a")
+    (tmp_path / "b.jpg").write_text("b")
+
+    with pytest.raises(FileExistsError):
+        fileops.move(str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"))
+
+    assert (tmp_path / "b.jpg").read_text() == "b"
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the freedesktop.org trash bin."""
+import errno
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from teeb import journal
+from teeb.fileops import trash_many
+from teeb.trash import (
+    Trash,
+    default_trash,
+)
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="freedesktop.org trash only"
+)
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path: Path, monkeypatch) -> Path:
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    yield tmp_path
+    journal.finish_run()
+
+
+def test_trash_files_and_directories(tmp_path: Path):
+    album = tmp_path / "album 1"
+    album.mkdir()
+    (album / "cover.jpg").write_text("12345")
+    (tmp_path / "cover.jpg").write_text("123")
+    trash_bin = Trash()
+
+    trashed = [
+        trash_bin.trash(str(album / "cover.jpg")),
+        trash_bin.trash(str(tmp_path / "cover.jpg")),
+        trash_bin.trash(str(album)),
+    ]
+
+    files = tmp_path / "data" / "Trash" / "files"
+    assert trashed == [
+        str(files / "cover.jpg"),
+        str(files / "cover.2.jpg"),
+        str(files / "album 1"),
+    ]
+    info = (tmp_path / "data" / "Trash" / "info" / "album 1.trashinfo").read_text()
+    assert info.startswith(f"[Trash Info]\nPath={tmp_path}/album%201\nDeletionDate=")
+    assert (trash_bin.trashed, trash_bin.size) == (3, 8)
+    assert trash_bin.summary() == (
+        "Moved 3 files & directories to trash, 8B can be reclaimed by emptying it"
+    )
+
+
+def test_files_are_copied_to_trash_across_a_bind_mount(tmp_path: Path, monkeypatch):
+    album = tmp_path / "album"
+    (album / "scans").mkdir(parents=True)
+    (album / "scans" / "01.png").write_text("scan")
+    (album / "rip.log").write_text("log")
+    rename = os.rename
+
+    def rename_across_bind_mount(source, target):
+        if "Trash" in str(target):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV), source, target)
+        rename(source, target)
+
+    monkeypatch.setattr("os.rename", rename_across_bind_mount)
+    trash_bin = Trash()
+
+    trash_bin.trash(str(album / "rip.log"))
+    trash_bin.trash(str(album / "scans"))
+
+    files = tmp_path / "data" / "Trash" / "files"
+    assert (files / "rip.log").read_text() == "log"
+    assert (files / "scans" / "01.png").read_text() == "scan"
+    assert os.listdir(album) == []
+    assert sorted(os.listdir(tmp_path / "data" / "Trash" / "info")) == [
+        "rip.log.trashinfo",
+        "scans.trashinfo",
+    ]
+
+
+def test_undo_restores_trashed_files(tmp_path: Path):
+    for name in ["a.cue", "b.cue"]:
+        (tmp_path / name).write_text(name)
+
+    run = journal.start_run(str(tmp_path))
+    errors = trash_many([str(tmp_path / "a.cue"), str(tmp_path / "missing.cue")])
+    journal.finish_run()
+    assert len(errors) == 1
+    assert default_trash().trashed == 1
+
+    undone, problems = journal.undo(journal.journal_path(run.run_id))
+
+    assert (undone, problems) == (1, [])
+    assert (tmp_path / "a.cue").read_text() == "a.cue"
+    assert os.listdir(tmp_path / "data" / "Trash" / "info") == []
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the built-in WAV image splitter."""
+import os
+import wave
+from pathlib import Path
+
+import pytest
+
+from teeb.split import (
+    native_job,
+    run_job,
+)
+from teeb.wavsplit import (
+    WavError,
+    split_wav_image,
+)
+
+
+def write_wav(path: Path, seconds: int, *, sample_rate: int, channels: int = 2):
+    """Write a 16 bit WAV file where every sample frame holds its own number."""
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        frames = bytearray()
+        for frame in range(seconds * sample_rate):
+            frames += (frame % 2**15).to_bytes(2, "little") * channels
+        wav.writeframes(bytes(frames))
+
+
+def read_frames(path: str):
+    with wave.open(path, "rb") as wav:
+        return wav.getframerate(), wav.getnframes(), wav.readframes(1)
+
+
+def test_split_uses_sample_rate_from_wav_header(tmp_path: Path):
+    write_wav(tmp_path / "Album Image.wav", 3, sample_rate=8000)
+    (tmp_path / "album.cue").write_text(
+        'FILE "Album Image.wav" WAVE\n'
+        "  TRACK 01 AUDIO\n"
+        '    TITLE "Intro"\n'
+        "    INDEX 01 00:00:00\n"
+        "  TRACK 02 AUDIO\n"
+        '    TITLE "AC/DC"\n'
+        "    INDEX 00 00:00:50\n"
+        "    INDEX 01 00:01:00\n"
+        "  TRACK 03 AUDIO\n"
+        "    INDEX 01 00:02:15\n"
+    )
+
+    written = split_wav_image(str(tmp_path / "album.cue"))
+
+    assert [os.path.basename(path) for path in written] == [
+        "01_Intro.wav",
+        "02_AC_DC.wav",
+        "03.wav",
+    ]
+    # 15 CD frames at 8kHz are 1600 sample frames
+    assert [read_frames(path)[:2] for path in written] == [
+        (8000, 8000),
+        (8000, 9600),
+        (8000, 6400),
+    ]
+    # Tracks start with sample frames at INDEX 01 positions
+    assert read_frames(written[1])[2] == (8000).to_bytes(2, "little") * 2
+    assert read_frames(written[2])[2] == (17600 % 2**15).to_bytes(2, "little") * 2
+
+
+def test_tracks_are_split_at_index_01_not_at_sub_indexes(tmp_path: Path):
+    write_wav(tmp_path / "image.wav", 3, sample_rate=8000)
+    (tmp_path / "album.cue").write_text(
+        'FILE "image.wav" WAVE\n'
+        "  TRACK 01 AUDIO\n"
+        "    INDEX 01 00:00:00\n"
+        "  TRACK 02 AUDIO\n"
+        "    INDEX 00 00:00:50\n"
+        "    INDEX 01 00:01:00\n"
+        "    INDEX 02 00:01:40\n"
+        "  TRACK 03 AUDIO\n"
+        "    INDEX 00 00:02:00\n"
+    )
+
+    written = split_wav_image(str(tmp_path / "album.cue"))
+
+    # Track 3 without INDEX 01 starts at its INDEX 00
+    assert [read_frames(path)[:2] for path in written] == [(8000, 8000)] * 3
+
+
+def test_split_multiple_files(tmp_path: Path):
+    write_wav(tmp_path / "cd1.wav", 2, sample_rate=4000, channels=1)
+    write_wav(tmp_path / "cd2.wav", 1, sample_rate=4000, channels=1)
+    (tmp_path / "album.cue").write_text(
+        'FILE "CD1.wav" WAVE\n'
+        "  TRACK 01 AUDIO\n"
+        "    INDEX 01 00:00:00\n"
+        "  TRACK 02 AUDIO\n"
+        "    INDEX 01 00:01:00\n"
+        'FILE "cd2.wav" WAVE\n'
+        "  TRACK 03 AUDIO\n"
+        "    INDEX 01 00:00:00\n"
+    )
+
+    written = split_wav_image(str(tmp_path / "album.cue"))
+
+    assert [read_frames(path)[1] for path in written] == [4000, 4000, 4000]
+
+
+def test_non_wav_images_are_left_untouched(tmp_path: Path):
+    (tmp_path / "image.flac").write_bytes(b"fLaC" + b"\0" * 64)
+    (tmp_path / "album.cue").write_text(
+        'FILE "image.flac" WAVE\n  TRACK 01 AUDIO\n    INDEX 01 00:00:00\n'
+    )
+
+    with pytest.raises(WavError):
+        split_wav_image(str(tmp_path / "album.cue"))
+    assert sorted(os.listdir(tmp_path)) == ["album.cue", "image.flac"]
+
+    job = run_job(native_job(str(tmp_path / "album.cue")), log_dir=str(tmp_path))
+    assert not job.succeeded and "Not a WAV file" in job.error